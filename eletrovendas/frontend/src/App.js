@@ -598,8 +598,15 @@ function Home() {
         return;
       }
 
-      const response = await axios.get(`${API}/products`);
-      setProducts(response.data);
+      // A listagem é paginada: segue o X-Next-Cursor até a última página
+      const all = [];
+      let after;
+      do {
+        const response = await axios.get(`${API}/products`, { params: { limit: 1000, after } });
+        all.push(...response.data);
+        after = response.headers['x-next-cursor'];
+      } while (after);
+      setProducts(all);
     } catch (error) {
       console.error('Error loading products:', error);
       // fallback local se a requisição falhar
@@ -0,0 +1,162 @@
+import math
+import time
+import asyncio
+from collections import OrderedDict, deque
+from typing import Iterable, Optional, Tuple
+
+import orjson
+
+HIGH, LOW = 0, 1
+
+
+class TokenBuckets:
+    """One token bucket per client, refilled lazily on each request.
+
+    Only the `max_clients` most recently seen clients are tracked; a client
+    evicted from the table simply starts again with a full bucket.
+    """
+
+    def __init__(self, rate: float, burst: float, max_clients: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def take(self, client: str, now: Optional[float] = None) -> float:
+        """Spend one token; returns 0 when allowed, else seconds until a token is due."""
+        now = time.monotonic() if now is None else now
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class PriorityLimiter:
+    """Concurrency cap with a bounded two-level waiting queue.
+
+    Requests beyond `max_concurrent` wait for a slot; a freed slot goes to
+    the oldest high-priority waiter first. When the queue is full a new
+    request is refused, except that a high-priority one takes the place of
+    the newest low-priority waiter. Waiting longer than `queue_timeout` also
+    gives up.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self._waiters = (deque(), deque())
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters[HIGH]) + len(self._waiters[LOW])
+
+    async def acquire(self, priority: int) -> bool:
+        if self.active < self.max_concurrent and not self.queued:
+            self.active += 1
+            return True
+        if self.queued >= self.max_queue:
+            if priority == LOW or not self._waiters[LOW]:
+                return False
+            self._waiters[LOW].pop().set_result(False)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(waiter)
+        try:
+            # A True result means release() handed its slot over to us
+            return await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            # Cancelled right after being handed a slot: pass it on
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release()
+            raise
+        finally:
+            if not waiter.done() or waiter.cancelled():
+                try:
+                    self._waiters[priority].remove(waiter)
+                except ValueError:
+                    pass
+
+    def release(self):
+        for waiters in self._waiters:
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(True)
+                    return
+        self.active -= 1
+
+
+class AdmissionMiddleware:
+    """ASGI admission control for the API: rate limit, concurrency cap, priorities.
+
+    The rate limit is keyed on the client IP alone. Each IP gets a token
+    bucket and is answered 429 once it is empty. Admitted requests then need
+    one of `max_concurrent` slots; they queue for one when all are busy, and
+    are answered 503 right away when the queue is full or after waiting too
+    long. Checkout routes jump ahead of catalog browsing in that queue.
+    Limits apply per worker process; a rate of 0 (the default) turns the
+    rate limit off.
+    """
+
+    def __init__(self, app, rate: float = 0.0, burst: float = 40.0, max_concurrent: int = 64,
+                 max_queue: int = 256, queue_timeout: float = 2.0, retry_after: int = 1,
+                 prefixes: Iterable[str] = ("/api",), priority_prefixes: Iterable[str] = ()):
+        self.app = app
+        self.buckets = TokenBuckets(rate, burst) if rate > 0 else None
+        self.limiter = PriorityLimiter(max_concurrent, max_queue, queue_timeout) if max_concurrent > 0 else None
+        self.retry_after = retry_after
+        self.prefixes = tuple(prefixes)
+        self.priority_prefixes = tuple(priority_prefixes)
+
+    @staticmethod
+    def client_key(scope) -> str:
+        return scope["client"][0] if scope.get("client") else "-"
+
+    @staticmethod
+    async def reject(send, status: int, detail: str, retry_after: int):
+        body = orjson.dumps({"detail": detail})
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or scope["method"] == "OPTIONS"
+                or not scope["path"].startswith(self.prefixes)):
+            await self.app(scope, receive, send)
+            return
+
+        if self.buckets is not None:
+            wait = self.buckets.take(self.client_key(scope))
+            if wait:
+                await self.reject(send, 429, "Too many requests", max(1, math.ceil(wait)))
+                return
+
+        if self.limiter is None:
+            await self.app(scope, receive, send)
+            return
+        priority = HIGH if scope["path"].startswith(self.priority_prefixes) else LOW
+        if not await self.limiter.acquire(priority):
+            await self.reject(send, 503, "Server busy, try again shortly", self.retry_after)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
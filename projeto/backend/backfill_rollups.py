@@ -0,0 +1,113 @@
+"""Recompute the daily sales rollups from the orders collection.
+
+The live rollups are maintained incrementally by create_order and status
+changes; this rebuilds them from scratch (after a bug, or for orders placed
+before rollups existed) and can export the result.
+
+    python backfill_rollups.py [--dry-run] [--export sales.csv]
+
+Orders are aggregated batch by batch as the cursor streams them, so memory
+grows with the number of buckets, not of orders. The new buckets replace
+the old ones in one rename, but orders placed or changing status while the
+backfill runs may be left out: run it while checkout is quiet, or run it
+again afterwards.
+"""
+import csv
+import asyncio
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import typer
+
+from config import STREAM_BATCH_SIZE, require_mongo, storage_from_env
+from storage import Storage
+from rollups import ROLLUP_METRICS, UNKNOWN, counts_as_sale, order_deltas
+
+cli = typer.Typer(add_completion=False)
+
+BucketKey = Tuple[str, str, str]
+
+
+async def fill_lines(storage: Storage, orders: List[dict], products: Dict[str, dict]):
+    """Give lines from orders placed before they carried category and brand those of the current product."""
+    missing = {line["product_id"] for order in orders for line in order["items"]
+               if not (line.get("category") and line.get("brand"))} - products.keys()
+    if missing:
+        products.update((product["id"], product) for product in await storage.products.get_many(list(missing)))
+        products.update((product_id, {}) for product_id in missing - products.keys())
+    for order in orders:
+        for line in order["items"]:
+            product = products.get(line["product_id"], {})
+            line["category"] = line.get("category") or product.get("category", UNKNOWN)
+            line["brand"] = line.get("brand") or product.get("brand", UNKNOWN)
+
+
+def add_orders(buckets: Dict[BucketKey, List[float]], orders: List[dict]):
+    for order in orders:
+        for delta in order_deltas(order):
+            bucket = buckets.setdefault((delta["day"], delta["dimension"], delta["value"]), [0.0, 0, 0])
+            for position, metric in enumerate(ROLLUP_METRICS):
+                bucket[position] += delta[metric]
+
+
+def bucket_rows(buckets: Dict[BucketKey, List[float]]) -> List[dict]:
+    return [
+        {"day": day, "dimension": dimension, "value": value,
+         "revenue": round(revenue, 2), "orders": orders, "units": units}
+        for (day, dimension, value), (revenue, orders, units) in sorted(buckets.items())
+    ]
+
+
+async def compute_buckets(storage: Storage) -> Tuple[int, List[dict]]:
+    """(orders counted, bucket documents) for every order that counts as a sale."""
+    buckets: Dict[BucketKey, List[float]] = {}
+    products: Dict[str, dict] = {}
+    batch: List[dict] = []
+    counted = 0
+    async for order in storage.orders.stream(STREAM_BATCH_SIZE):
+        if counts_as_sale(order["status"]):
+            batch.append(order)
+        if len(batch) >= STREAM_BATCH_SIZE:
+            await fill_lines(storage, batch, products)
+            add_orders(buckets, batch)
+            counted += len(batch)
+            batch = []
+    await fill_lines(storage, batch, products)
+    add_orders(buckets, batch)
+    return counted + len(batch), bucket_rows(buckets)
+
+
+async def backfill(storage: Storage, dry_run: bool, export: Optional[Path] = None):
+    counted, buckets = await compute_buckets(storage)
+    typer.echo(f"{counted} orders -> {len(buckets)} buckets")
+    if export:
+        with open(export, "w", newline="") as out:
+            writer = csv.DictWriter(out, ["day", "dimension", "value", *ROLLUP_METRICS])
+            writer.writeheader()
+            writer.writerows(buckets)
+        typer.echo(f"Buckets written to {export}")
+    if not dry_run:
+        await storage.sales.replace(buckets)
+        typer.echo("Rollups replaced")
+
+
+async def run(dry_run: bool, export: Optional[Path]):
+    storage = storage_from_env()
+    try:
+        await backfill(storage, dry_run, export)
+    finally:
+        await storage.close()
+
+
+@cli.command()
+def main(
+    dry_run: bool = typer.Option(False, help="compute without replacing the rollups"),
+    export: Optional[Path] = typer.Option(None, help="write the recomputed buckets to this CSV file"),
+):
+    """Recompute the daily sales rollups from all orders."""
+    require_mongo()
+    asyncio.run(run(dry_run, export))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,89 @@
+"""Micro-benchmark of the get_products response path.
+
+Compares the original handler (a Product per document, re-validated and
+serialized by FastAPI through `response_model`) against the trusted-document
+fast path (projection without _id, defaults filled in, orjson).
+
+    python bench_serialization.py [--size 1000 --size 10000 --size 100000] [--repeat 5]
+"""
+import time
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+from typing import List
+
+import orjson
+import typer
+from bson import ObjectId
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from models import Product, product_shape
+
+cli = typer.Typer(add_completion=False)
+
+
+def make_documents(count: int) -> List[dict]:
+    """Documents shaped like what Motor returns for the products collection."""
+    start = datetime(2024, 1, 1)
+    return [
+        {
+            "_id": ObjectId(),
+            "id": str(uuid.uuid4()),
+            "name": f"Geladeira Brastemp Frost Free {index}",
+            "description": "Geladeira duplex com tecnologia frost free, 400 litros, eficiência energética A+",
+            "price": 1000 + index % 4000 + 0.99,
+            "category": "geladeira",
+            "brand": "Brastemp",
+            "image_url": "https://images.unsplash.com/photo-1484154218962-a197022b5858",
+            "in_stock": True,
+            "specifications": {"capacidade": "400L", "cor": "Inox", "consumo": "45kWh/mês"},
+            "created_at": start + timedelta(seconds=index),
+        }
+        for index in range(count)
+    ]
+
+
+async def validated_path(documents: List[dict], field) -> bytes:
+    content = [Product(**product) for product in documents]
+    serialized = await serialize_response(field=field, response_content=content)
+    return JSONResponse(serialized).body
+
+
+async def fast_path(documents: List[dict]) -> bytes:
+    # The projection would have dropped _id on the database side
+    return orjson.dumps([product_shape(product) for product in documents])
+
+
+async def timed(coroutine_factory, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coroutine_factory()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+async def run(sizes: List[int], repeat: int):
+    field = create_response_field(name="Response_Get_Products", type_=List[Product])
+    typer.echo(f"{'documents':>10} {'validated ms':>14} {'fast ms':>10} {'speedup':>8}")
+    for size in sizes:
+        documents = make_documents(size)
+        projected = [{key: value for key, value in product.items() if key != "_id"} for product in documents]
+        validated = await timed(lambda: validated_path(documents, field), repeat)
+        fast = await timed(lambda: fast_path(projected), repeat)
+        typer.echo(f"{size:>10} {validated * 1000:>14.1f} {fast * 1000:>10.1f} {validated / fast:>7.1f}x")
+
+
+@cli.command()
+def main(
+    sizes: List[int] = typer.Option([1000, 10000, 100000], "--size", min=1, help="documents per run; repeatable"),
+    repeat: int = typer.Option(5, min=1, help="runs per size; the best one is reported"),
+):
+    """Time the validated and fast get_products serialization paths."""
+    asyncio.run(run(sizes, repeat))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,164 @@
+import zlib
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Media types worth compressing; images and archives already are
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson", "application/javascript",
+                      "application/xml", "application/problem+json")
+
+
+def choose_encoding(accept_encoding: str, available: Tuple[str, ...]) -> Optional[str]:
+    """The first of `available` (in server preference order) with the highest q in Accept-Encoding."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            weights[coding] = q
+    best, best_q = None, 0.0
+    for coding in available:
+        q = weights.get(coding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class Compressor:
+    """Incremental gzip or brotli encoder."""
+
+    def __init__(self, coding: str, gzip_level: int, brotli_quality: int):
+        if coding == "br":
+            self._brotli = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._brotli = None
+            # wbits 31 writes a gzip header with no timestamp, so output is reproducible
+            self._zlib = zlib.compressobj(gzip_level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self) -> bytes:
+        """Everything buffered so far, keeping the stream open."""
+        if self._brotli is not None:
+            return self._brotli.flush()
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self._brotli is not None:
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+class CompressionMiddleware:
+    """Negotiated brotli/gzip compression of text responses of at least `minimum_size` bytes.
+
+    Brotli is preferred when the optional brotli package is installed and the
+    client accepts it. Streamed responses are compressed chunk by chunk.
+    Whenever the request negotiates a content-coding, the response's ETag
+    is made weak and it varies on Accept-Encoding, whether or not this body
+    ends up compressed. A 304 has no body to decide by, so the rule only
+    looks at the request, and every worker answers alike. Complete bodies
+    carrying an ETag (the cached catalog reads) are compressed once and
+    kept in a small LRU keyed by ETag and encoding.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4,
+                 cache_size: int = 256):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.cache_size = cache_size
+        self.encodings = ("br", "gzip") if brotli is not None else ("gzip",)
+        self._cache: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+
+    def compress_body(self, body: bytes, coding: str, etag: Optional[str]) -> bytes:
+        key = (etag, coding)
+        if etag and key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        compressor = Compressor(coding, self.gzip_level, self.brotli_quality)
+        compressed = compressor.compress(body) + compressor.finish()
+        if etag and self.cache_size:
+            self._cache[key] = compressed
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return compressed
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        coding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""), self.encodings)
+        start = None
+        compressor = None
+
+        async def send_compressed(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=message["headers"])
+                media_type = headers.get("content-type", "")
+                compressible = media_type.startswith(COMPRESSIBLE_TYPES) and not headers.get("content-encoding")
+                if coding is not None or compressible:
+                    # The representation depends on Accept-Encoding whether or not this one is compressed
+                    headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if coding is not None and etag and not etag.startswith("W/"):
+                    # Decided by the request alone, so a 304 gets the validator its 200 had
+                    headers["ETag"] = "W/" + etag
+                if coding is None or not compressible:
+                    await send(message)
+                    return
+                start = message  # held until the first body chunk shows how big the response is
+                return
+            if start is None:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = MutableHeaders(raw=start["headers"])
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(start)
+                    await send(message)
+                    start = None
+                    return
+                etag = headers.get("etag")
+                headers["Content-Encoding"] = coding
+                if "content-length" in headers:
+                    del headers["content-length"]
+                if not more_body:
+                    body = self.compress_body(body, coding, etag)
+                    headers["Content-Length"] = str(len(body))
+                    await send(start)
+                    await send({"type": "http.response.body", "body": body})
+                    start = None
+                    return
+                compressor = Compressor(coding, self.gzip_level, self.brotli_quality)
+                await send(start)
+
+            if more_body:
+                data = compressor.compress(body) + compressor.flush() if body else b""
+            else:
+                data = compressor.compress(body) + compressor.finish()
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
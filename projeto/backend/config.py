@@ -0,0 +1,113 @@
+"""Settings and clients shared by the API server and the command-line tools.
+
+Importing this loads backend/.env and configures logging; it does not build
+the app, so scripts can use it without starting the catalog or the workers.
+"""
+import os
+import sys
+import logging
+from pathlib import Path
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+from storage import Storage, MotorStorage, MemoryStorage
+from metrics import MongoCommandListener
+from profiling import SlowQueryLog
+from payments import PayPalClient, create_http_client
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Documents per cursor batch when streaming a collection
+STREAM_BATCH_SIZE = 500
+
+# Carts expire after this long untouched
+CART_TTL_SECONDS = int(os.environ.get('CART_TTL_SECONDS', str(7 * 24 * 3600)))
+
+# Idempotency keys are remembered this long
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+
+# Orders per cursor batch and per encoded chunk in exports. An order is a
+# KB or two, so each getMore brings back a couple of MB
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', '1000'))
+
+# Documents per insert_many when generating synthetic data
+SYNTHETIC_BATCH_SIZE = int(os.environ.get('SYNTHETIC_BATCH_SIZE', '5000'))
+
+# Co-purchase suggestions kept per product
+RELATED_TOP_K = int(os.environ.get('RELATED_TOP_K', '20'))
+
+# PayPal; without PAYPAL_CLIENT_ID the /paypal endpoints answer with demo data
+PAYPAL_BASE_URL = os.environ.get('PAYPAL_BASE_URL', 'https://api-m.sandbox.paypal.com')
+PAYPAL_CLIENT_ID = os.environ.get('PAYPAL_CLIENT_ID')
+PAYPAL_CLIENT_SECRET = os.environ.get('PAYPAL_CLIENT_SECRET', '')
+
+# MongoDB commands slower than this are logged with their filter shape and plan; off (0)
+# by default like the other profiling aids, since every command is then tracked
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '0'))
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG')
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+if SLOW_QUERY_LOG:
+    slow_query_handler = logging.FileHandler(SLOW_QUERY_LOG)
+    slow_query_handler.setFormatter(logging.Formatter('%(message)s'))
+    logging.getLogger('slow_queries').addHandler(slow_query_handler)
+
+
+def paypal_from_env() -> Optional[PayPalClient]:
+    if not PAYPAL_CLIENT_ID:
+        return None
+    return PayPalClient(create_http_client(PAYPAL_BASE_URL), PAYPAL_CLIENT_ID, PAYPAL_CLIENT_SECRET)
+
+
+def missing_mongo_settings() -> List[str]:
+    return [name for name in ('MONGO_URL', 'DB_NAME') if not os.environ.get(name)]
+
+
+def storage_from_env() -> Storage:
+    """MongoDB from MONGO_URL and DB_NAME, or the in-memory engine with STORAGE_BACKEND=memory.
+
+    The in-memory engine loses everything on restart, so it is never picked
+    by default; without STORAGE_BACKEND=memory a missing MONGO_URL is a
+    RuntimeError at startup.
+    """
+    backend = os.environ.get('STORAGE_BACKEND', 'mongo')
+    if backend == 'memory':
+        logger.warning("Using the in-memory storage backend; data is lost on restart")
+        return MemoryStorage(cart_ttl_seconds=CART_TTL_SECONDS, idempotency_ttl_seconds=IDEMPOTENCY_TTL_SECONDS)
+    if backend != 'mongo':
+        raise RuntimeError(f"Unknown STORAGE_BACKEND {backend!r}; expected mongo or memory")
+    missing = missing_mongo_settings()
+    if missing:
+        raise RuntimeError(f"Missing {', '.join(missing)}; set them, or STORAGE_BACKEND=memory for a throwaway "
+                           "in-memory database")
+    event_listeners = [MongoCommandListener()]
+    if SLOW_QUERY_MS > 0:
+        event_listeners.append(SlowQueryLog(SLOW_QUERY_MS, os.environ['MONGO_URL']))
+    return MotorStorage(
+        os.environ['MONGO_URL'],
+        os.environ['DB_NAME'],
+        cart_ttl_seconds=CART_TTL_SECONDS,
+        event_listeners=event_listeners,
+        idempotency_ttl_seconds=IDEMPOTENCY_TTL_SECONDS,
+    )
+
+
+def require_mongo():
+    """Exit with status 1 unless MongoDB is configured.
+
+    The command-line tools read or fill the shared database, so they refuse
+    STORAGE_BACKEND=memory as well: they would report success and change
+    nothing.
+    """
+    if os.environ.get('STORAGE_BACKEND', 'mongo') != 'mongo':
+        sys.exit("The command-line tools only work against MongoDB; unset STORAGE_BACKEND")
+    missing = missing_mongo_settings()
+    if missing:
+        sys.exit(f"Missing {', '.join(missing)}: set MONGO_URL and DB_NAME in the environment or in {ROOT_DIR / '.env'}")
@@ -0,0 +1,89 @@
+import io
+import csv
+import zlib
+from datetime import date, datetime, time, timedelta, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+
+import orjson
+
+from models import order_shape
+
+EXPORT_FORMATS = ("csv", "ndjson")
+
+# CSV has one row per order line, the order's own fields repeated on each
+ORDER_COLUMNS = ["order_id", "created_at", "status", "customer_name", "customer_email", "customer_phone",
+                 "total_amount", "item_count", "paypal_order_id"]
+LINE_COLUMNS = ["line", "product_id", "product_name", "category", "brand", "quantity", "price", "line_total"]
+
+
+def export_range(start: Optional[date], end: Optional[date]) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """[start, end] in whole UTC days as a half-open datetime range."""
+    return (
+        datetime.combine(start, time(), timezone.utc) if start else None,
+        datetime.combine(end + timedelta(days=1), time(), timezone.utc) if end else None,
+    )
+
+
+def utc_iso(value: datetime) -> str:
+    # MongoDB hands datetimes back naive, in UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat()
+
+
+def csv_header() -> bytes:
+    return (",".join(ORDER_COLUMNS + LINE_COLUMNS) + "\r\n").encode()
+
+
+def order_csv_rows(order: dict) -> List[list]:
+    head = [
+        order["id"], utc_iso(order["created_at"]), order.get("status"), order.get("customer_name"),
+        order.get("customer_email"), order.get("customer_phone"), order.get("total_amount"),
+        order.get("item_count"), order.get("paypal_order_id"),
+    ]
+    lines = order.get("items") or [{}]
+    return [
+        head + [
+            number if line else None, line.get("product_id"), line.get("product_name"), line.get("category"),
+            line.get("brand"), line.get("quantity"), line.get("price"), line.get("line_total"),
+        ]
+        for number, line in enumerate(lines, 1)
+    ]
+
+
+def encode_orders(orders: List[dict], fmt: str) -> bytes:
+    if fmt == "ndjson":
+        return b"".join(orjson.dumps(order_shape(order), option=orjson.OPT_NAIVE_UTC) + b"\n" for order in orders)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for order in orders:
+        writer.writerows(order_csv_rows(order))
+    return buffer.getvalue().encode()
+
+
+async def export_batches(orders: AsyncIterator[dict], fmt: str,
+                         batch_size: int) -> AsyncIterator[Tuple[bytes, int, Tuple[datetime, str]]]:
+    """(encoded chunk, order count, watermark) for every `batch_size` orders.
+
+    The watermark is the (created_at, id) of the chunk's last order; an
+    export resumed from it continues with the next order. Chunks always
+    end on an order boundary.
+    """
+    batch = []
+    async for order in orders:
+        batch.append(order)
+        if len(batch) >= batch_size:
+            yield encode_orders(batch, fmt), len(batch), (batch[-1]["created_at"], batch[-1]["id"])
+            batch = []
+    if batch:
+        yield encode_orders(batch, fmt), len(batch), (batch[-1]["created_at"], batch[-1]["id"])
+
+
+async def gzip_stream(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Compress a byte stream into a single gzip member as it goes."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
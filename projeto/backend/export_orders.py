@@ -0,0 +1,98 @@
+"""Export orders for accounting as CSV or NDJSON, gzip-compressed, with bounded memory.
+
+    python export_orders.py orders.csv.gz --start 2024-01-01 --end 2024-12-31
+    python export_orders.py orders.csv.gz --start 2024-01-01 --end 2024-12-31 --resume
+
+Each batch of orders is appended as its own gzip member (the members
+concatenate into one valid .gz file), and <output>.state records the file
+size and the (created_at, id) watermark after every batch. --resume drops
+whatever a crash left half-written and carries on from the watermark.
+"""
+import os
+import gzip
+import json
+import asyncio
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import typer
+
+from config import EXPORT_BATCH_SIZE, require_mongo, storage_from_env
+from export import EXPORT_FORMATS, csv_header, export_batches, export_range, utc_iso
+
+cli = typer.Typer(add_completion=False)
+
+
+def save_state(path: Path, state: dict):
+    # Written aside then renamed, so a crash never leaves half a state file
+    temporary = path.with_name(path.name + ".tmp")
+    temporary.write_text(json.dumps(state))
+    os.replace(temporary, path)
+
+
+async def export(output: Path, fmt: str, start: Optional[datetime], end: Optional[datetime],
+                 batch_size: int, compress: bool, resume: bool):
+    state_path = output.with_name(output.name + ".state")
+    settings = {
+        "format": fmt,
+        "start": start.date().isoformat() if start else None,
+        "end": end.date().isoformat() if end else None,
+        "gzip": compress,
+    }
+    if resume:
+        if not state_path.exists():
+            raise typer.BadParameter(f"No interrupted export to resume ({state_path} not found)")
+        state = json.loads(state_path.read_text())
+        if {key: state[key] for key in settings} != settings:
+            raise typer.BadParameter(f"Options differ from the interrupted run: {state}")
+        after = (datetime.fromisoformat(state["created_at"]), state["id"]) if state["id"] else None
+    else:
+        state = {**settings, "offset": 0, "orders": 0, "created_at": None, "id": None}
+        after = None
+
+    storage = storage_from_env()
+    try:
+        orders = storage.orders.export(
+            *export_range(start and start.date(), end and end.date()), after, batch_size)
+        with open(output, "r+b" if resume else "wb") as out:
+            out.truncate(state["offset"])
+            out.seek(state["offset"])
+            header = csv_header() if fmt == "csv" and not state["offset"] else b""
+            async for chunk, count, (created_at, order_id) in export_batches(orders, fmt, batch_size):
+                data = header + chunk
+                header = b""
+                out.write(gzip.compress(data) if compress else data)
+                out.flush()
+                os.fsync(out.fileno())
+                state.update(offset=out.tell(), orders=state["orders"] + count,
+                             created_at=utc_iso(created_at), id=order_id)
+                save_state(state_path, state)
+                typer.echo(f"{state['orders']} orders, up to {state['created_at']}", err=True)
+            if header:
+                out.write(gzip.compress(header) if compress else header)
+    finally:
+        await storage.close()
+    state_path.unlink(missing_ok=True)
+    typer.echo(f"Exported {state['orders']} orders to {output}", err=True)
+
+
+@cli.command()
+def main(
+    output: Path = typer.Argument(..., help="file to write, e.g. orders.csv.gz"),
+    fmt: str = typer.Option("csv", "--format", help="csv (one row per order line) or ndjson"),
+    start: Optional[datetime] = typer.Option(None, formats=["%Y-%m-%d"], help="first UTC day"),
+    end: Optional[datetime] = typer.Option(None, formats=["%Y-%m-%d"], help="last UTC day, inclusive"),
+    batch_size: int = typer.Option(EXPORT_BATCH_SIZE, min=1, help="orders per cursor batch and checkpoint"),
+    compress: bool = typer.Option(True, "--gzip/--no-gzip"),
+    resume: bool = typer.Option(False, help="continue an interrupted export of the same range"),
+):
+    """Export orders created between --start and --end."""
+    if fmt not in EXPORT_FORMATS:
+        raise typer.BadParameter(f"must be one of {', '.join(EXPORT_FORMATS)}", param_hint="--format")
+    require_mongo()
+    asyncio.run(export(output, fmt, start, end, batch_size, compress, resume))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,163 @@
+import re
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+# Price bands shown in the sidebar, as [low, high) in BRL
+PRICE_BANDS = [(0, 500), (500, 1000), (1000, 2000), (2000, 5000), (5000, None)]
+
+FACET_FIELDS = ("category", "brand", "price", "in_stock")
+
+PRICE_RANGE = re.compile(r"(\d+(?:\.\d+)?)(?:-(\d+(?:\.\d+)?)|\+)")
+
+
+def price_band(price: float) -> str:
+    for low, high in PRICE_BANDS:
+        if high is None:
+            return f"{low}+"
+        if low <= price < high:
+            return f"{low}-{high}"
+    return f"{PRICE_BANDS[0][0]}-{PRICE_BANDS[0][1]}"
+
+
+def parse_price_range(value: str) -> Tuple[float, Optional[float]]:
+    """`low-high` as [low, high) or `low+` as [low, ∞), like the band labels.
+
+    Raises ValueError for anything else, or when high is not above low.
+    """
+    match = PRICE_RANGE.fullmatch(value.strip())
+    if match is None:
+        raise ValueError(f"Invalid price range {value!r}; expected min-max or min+, e.g. 500-1000 or 5000+")
+    low = float(match.group(1))
+    high = float(match.group(2)) if match.group(2) is not None else None
+    if high is not None and high <= low:
+        raise ValueError(f"Invalid price range {value!r}; max must be greater than min")
+    return low, high
+
+
+def facet_values(product: dict) -> Dict[str, str]:
+    return {
+        "category": product["category"],
+        "brand": product["brand"],
+        "price": price_band(product["price"]),
+        "in_stock": "true" if product.get("in_stock", True) else "false",
+    }
+
+
+class FacetIndex:
+    """Per-facet-value bitsets over the catalog.
+
+    Every product owns a slot, and every facet value keeps a boolean array
+    with the slots that carry it. Filtering is a handful of vectorised ANDs
+    and each facet count is one AND plus a popcount, so the sidebar counts
+    come with the result page without extra queries. Prices are also kept
+    per slot, so a price filter can be any range, not just a sidebar band.
+    Slots are handed out in load order, which is the listing order when
+    loaded by PRODUCT_SORT.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._initial_capacity = capacity
+        self.clear()
+
+    def clear(self):
+        self._capacity = self._initial_capacity
+        self._ids: List[Optional[str]] = []
+        self._slots: Dict[str, int] = {}
+        self._live = np.zeros(self._capacity, dtype=bool)
+        self._prices = np.zeros(self._capacity)
+        self._masks: Dict[str, Dict[str, np.ndarray]] = {field: {} for field in FACET_FIELDS}
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _grow(self):
+        self._capacity *= 2
+        self._live = np.resize(self._live, self._capacity)
+        self._live[len(self._ids):] = False
+        self._prices = np.resize(self._prices, self._capacity)
+        for masks in self._masks.values():
+            for value, mask in masks.items():
+                grown = np.zeros(self._capacity, dtype=bool)
+                grown[:len(mask)] = mask
+                masks[value] = grown
+
+    def _clear_slot(self, slot: int):
+        self._live[slot] = False
+        for masks in self._masks.values():
+            for mask in masks.values():
+                mask[slot] = False
+
+    def add(self, product: dict):
+        slot = self._slots.get(product["id"])
+        if slot is None:
+            if len(self._ids) == self._capacity:
+                self._grow()
+            slot = len(self._ids)
+            self._ids.append(product["id"])
+            self._slots[product["id"]] = slot
+        else:
+            self._clear_slot(slot)
+        self._live[slot] = True
+        self._prices[slot] = product["price"]
+        for field, value in facet_values(product).items():
+            mask = self._masks[field].get(value)
+            if mask is None:
+                mask = self._masks[field][value] = np.zeros(self._capacity, dtype=bool)
+            mask[slot] = True
+
+    def remove(self, doc_id: str):
+        slot = self._slots.pop(doc_id, None)
+        if slot is not None:
+            self._ids[slot] = None
+            self._clear_slot(slot)
+
+    def rebuild(self, products):
+        self.clear()
+        for product in products:
+            self.add(product)
+
+    def _selection(self, field: str, values: List[str]) -> np.ndarray:
+        selected = np.zeros(self._capacity, dtype=bool)
+        if field == "price":
+            for low, high in map(parse_price_range, values):
+                in_range = self._prices >= low
+                if high is not None:
+                    in_range &= self._prices < high
+                selected |= in_range
+            return selected
+        for value in values:
+            mask = self._masks[field].get(value)
+            if mask is not None:
+                selected |= mask
+        return selected
+
+    def query(self, filters: Dict[str, List[str]], limit: int, offset: int = 0
+              ) -> Tuple[List[str], int, Dict[str, Dict[str, int]]]:
+        """Return (page of ids, total matches, facet counts).
+
+        Values within a facet are OR-ed and facets are AND-ed. Each facet's
+        counts ignore that facet's own selection, so picking one brand still
+        shows how many products the other brands would add. Price values are
+        ranges (see parse_price_range) and raise ValueError when malformed.
+        """
+        selections = {field: self._selection(field, values) for field, values in filters.items() if values}
+        match = self._live.copy()
+        for selected in selections.values():
+            match &= selected
+
+        counts = {}
+        for field in FACET_FIELDS:
+            base = self._live.copy()
+            for other, selected in selections.items():
+                if other != field:
+                    base &= selected
+            field_counts = {}
+            for value, mask in self._masks[field].items():
+                count = int(np.count_nonzero(mask & base))
+                if count:
+                    field_counts[value] = count
+            counts[field] = field_counts
+
+        slots = np.flatnonzero(match)
+        ids = [self._ids[slot] for slot in slots[offset:offset + limit]]
+        return ids, len(slots), counts
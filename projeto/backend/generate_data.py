@@ -0,0 +1,52 @@
+"""Fill an empty database with a synthetic catalog, carts and orders for scale testing.
+
+    python generate_data.py --products 2000000 --orders 500000 --carts 100000 --seed 7
+
+The same seed always yields the same data, whatever the number of workers.
+Chunks are generated in a process pool and written with unordered insert_many.
+"""
+import os
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import typer
+
+from config import RELATED_TOP_K, SYNTHETIC_BATCH_SIZE, require_mongo, storage_from_env
+from synthetic import DEFAULT_EPOCH, generate
+
+cli = typer.Typer(add_completion=False)
+
+
+async def run(products: int, carts: int, orders: int, seed: int, batch_size: int, workers: int, epoch: datetime):
+    storage = storage_from_env()
+    try:
+        await storage.start()
+        if await storage.products.count():
+            raise typer.BadParameter("The catalog is not empty; generate into a fresh database")
+        with ProcessPoolExecutor(workers) as executor:
+            summary = await generate(storage, seed, products, carts, orders, batch_size, workers,
+                                     executor=executor, epoch=epoch, top_k=RELATED_TOP_K)
+    finally:
+        await storage.close()
+    typer.echo(summary)
+
+
+@cli.command()
+def main(
+    products: int = typer.Option(100_000, min=1),
+    carts: int = typer.Option(10_000, min=0),
+    orders: int = typer.Option(50_000, min=0),
+    seed: int = typer.Option(42),
+    batch_size: int = typer.Option(SYNTHETIC_BATCH_SIZE, min=1, help="documents per insert_many"),
+    workers: int = typer.Option(os.cpu_count() or 4, min=1, help="generator processes and concurrent inserts"),
+    epoch: datetime = typer.Option(DEFAULT_EPOCH.strftime("%Y-%m-%d"), formats=["%Y-%m-%d"],
+                                   help="generated products and orders date up to this UTC day"),
+):
+    """Generate products, carts and orders deterministically from --seed."""
+    require_mongo()
+    asyncio.run(run(products, carts, orders, seed, batch_size, workers, epoch.replace(tzinfo=timezone.utc)))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,148 @@
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from storage import IdempotencyRepository
+
+logger = logging.getLogger(__name__)
+
+# (status code, JSON body) of a response that can be replayed
+StoredResponse = Tuple[int, bytes]
+
+
+class KeyReused(Exception):
+    """The key was already used for a request with a different payload."""
+
+
+class RequestInProgress(Exception):
+    """The first request with this key did not finish within the wait budget."""
+
+
+def fingerprint(method: str, path: str, session: str, body: bytes) -> str:
+    digest = hashlib.sha256()
+    for part in (method.encode(), path.encode(), session.encode(), body):
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class IdempotencyGuard:
+    """Run a mutating request at most once per Idempotency-Key.
+
+    The first request claims the key in the repository, runs, and stores
+    its response there; duplicates replay it. Duplicates arriving while the
+    first one still runs wait for it: those on the same worker await its
+    future directly, those on other workers poll the stored record. Failed
+    requests release the key, so a retry after an error runs again. If the
+    response of a successful request cannot be stored, the key stays locked
+    and replays from this worker while the write is retried.
+
+    The claim holds a lock for `lock_seconds`, renewed every third of that
+    while the request runs, so however long it takes no duplicate can take
+    the key over; only a worker that died stops renewing.
+    """
+
+    def __init__(self, store: IdempotencyRepository, wait_seconds: float = 10.0,
+                 lock_seconds: float = 30.0, poll_interval: float = 0.05):
+        self.store = store
+        self.wait_seconds = wait_seconds
+        self.lock_seconds = lock_seconds
+        self.poll_interval = poll_interval
+        self._in_flight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._completing: Set[asyncio.Task] = set()
+
+    async def run(self, key: str, fingerprint: str,
+                  handler: Callable[[], Awaitable[StoredResponse]]) -> Tuple[StoredResponse, bool]:
+        """Return (response, replayed)."""
+        deadline = asyncio.get_running_loop().time() + self.wait_seconds
+        while True:
+            local = self._in_flight.get(key)
+            if local is not None:
+                owner_fingerprint, future = local
+                if owner_fingerprint != fingerprint:
+                    raise KeyReused(key)
+                response = await self._wait_local(future, deadline)
+                if response is not None:
+                    return response, True
+                continue
+
+            record = await self.store.claim(key, fingerprint, self.lock_seconds)
+            if record is None:
+                return await self._execute(key, fingerprint, handler), False
+            if record["fingerprint"] != fingerprint:
+                raise KeyReused(key)
+            if record["state"] == "done":
+                return (record["status_code"], bytes(record["body"])), True
+            await self._wait_remote(key, deadline)
+
+    async def _execute(self, key: str, fingerprint: str, handler) -> StoredResponse:
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fingerprint, future)
+        heartbeat = asyncio.create_task(self._renew(key))
+        try:
+            response = await handler()
+        except BaseException:
+            heartbeat.cancel()
+            del self._in_flight[key]
+            await self.store.release(key)
+            # Waiters loop back and try to claim the key themselves
+            future.set_result(None)
+            raise
+        future.set_result(response)
+        try:
+            await self.store.complete(key, *response)
+        except Exception:
+            # The request took effect, so the key must never be claimable again:
+            # keep it locked and replayed from here until the response is stored
+            logger.exception("Could not store the response for idempotency key %s; retrying", key)
+            task = asyncio.create_task(self._complete_later(key, response, heartbeat))
+            self._completing.add(task)
+            task.add_done_callback(self._completing.discard)
+            return response
+        heartbeat.cancel()
+        del self._in_flight[key]
+        return response
+
+    async def _complete_later(self, key: str, response: StoredResponse, heartbeat: asyncio.Task):
+        delay = self.poll_interval
+        try:
+            while True:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.lock_seconds / 3)
+                try:
+                    await self.store.complete(key, *response)
+                    return
+                except Exception:
+                    logger.warning("Still cannot store the response for idempotency key %s", key, exc_info=True)
+        finally:
+            heartbeat.cancel()
+            del self._in_flight[key]
+
+    async def _renew(self, key: str):
+        while True:
+            await asyncio.sleep(self.lock_seconds / 3)
+            try:
+                await self.store.renew(key, self.lock_seconds)
+            except Exception:
+                logger.exception("Could not renew the lock on idempotency key %s", key)
+
+    async def _wait_local(self, future: asyncio.Future, deadline: float) -> Optional[StoredResponse]:
+        remaining = deadline - asyncio.get_running_loop().time()
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(remaining, 0))
+        except asyncio.TimeoutError:
+            raise RequestInProgress()
+
+    async def _wait_remote(self, key: str, deadline: float):
+        """Poll with backoff until the record is done or released."""
+        loop = asyncio.get_running_loop()
+        interval = self.poll_interval
+        while True:
+            if loop.time() + interval > deadline:
+                raise RequestInProgress()
+            await asyncio.sleep(interval)
+            interval = min(interval * 2, 1.0)
+            record = await self.store.get(key)
+            if record is None or record["state"] == "done":
+                return
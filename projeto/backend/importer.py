@@ -0,0 +1,214 @@
+import csv
+import codecs
+import orjson
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from multipart.multipart import MultipartParser, parse_options_header
+from pydantic import ValidationError
+
+from models import ProductImportRow
+
+IMPORT_FORMATS = ("ndjson", "csv")
+# Longest line or CSV record buffered while looking for its end; beyond it a
+# missing newline or unterminated quote would pull the rest of the upload in
+MAX_RECORD_CHARS = 1 << 20
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+def detect_format(content_type: str, filename: Optional[str] = None) -> Optional[str]:
+    if filename:
+        extension = filename.rsplit(".", 1)[-1].lower()
+        if extension in ("ndjson", "jsonl"):
+            return "ndjson"
+        if extension == "csv":
+            return "csv"
+    if "csv" in content_type:
+        return "csv"
+    if "ndjson" in content_type or "jsonl" in content_type or "json-seq" in content_type:
+        return "ndjson"
+    return None
+
+
+async def multipart_file(chunks: AsyncIterator[bytes], content_type: str) -> Tuple[AsyncIterator[bytes], dict]:
+    """Stream the first file part of a multipart/form-data body.
+
+    Returns the part's data as an async iterator plus its headers, parsed
+    incrementally with python-multipart so the upload never sits in memory.
+    """
+    _, options = parse_options_header(content_type)
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise ImportFormatError("Missing multipart boundary")
+
+    state = {"field": b"", "value": b"", "headers": {}, "in_file": False, "done": False, "pending": deque()}
+
+    def on_header_field(data, start, end):
+        state["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].decode("latin-1").lower()] = state["value"].decode("latin-1")
+        state["field"] = state["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get("content-disposition", ""))
+        state["in_file"] = not state["done"] and b"filename" in disposition
+        if state["in_file"]:
+            state["filename"] = disposition[b"filename"].decode("utf-8", "replace")
+            state["content_type"] = state["headers"].get("content-type", "")
+
+    def on_part_data(data, start, end):
+        if state["in_file"]:
+            state["pending"].append(data[start:end])
+
+    def on_part_end():
+        if state["in_file"]:
+            state["done"] = True
+        state["in_file"] = False
+        state["headers"] = {}
+
+    parser = MultipartParser(boundary, {
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    chunks = chunks.__aiter__()
+
+    # Read up to the start of the file part to learn its headers
+    while "filename" not in state:
+        try:
+            parser.write(await chunks.__anext__())
+        except StopAsyncIteration:
+            raise ImportFormatError("No file part in the upload")
+
+    async def data():
+        while True:
+            while state["pending"]:
+                yield state["pending"].popleft()
+            if state["done"]:
+                return
+            try:
+                parser.write(await chunks.__anext__())
+            except StopAsyncIteration:
+                parser.finalize()
+                while state["pending"]:
+                    yield state["pending"].popleft()
+                return
+
+    return data(), {"filename": state["filename"], "content_type": state["content_type"]}
+
+
+async def lines(chunks: AsyncIterator[bytes], max_chars: int = MAX_RECORD_CHARS) -> AsyncIterator[str]:
+    """Decode a byte stream into lines, whatever the chunk boundaries."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *complete, buffer = buffer.split("\n")
+        for line in complete:
+            yield line.rstrip("\r")
+        if len(buffer) > max_chars:
+            raise ImportFormatError(f"Line longer than {max_chars} characters")
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+async def ndjson_records(chunks: AsyncIterator[bytes],
+                         max_chars: int = MAX_RECORD_CHARS) -> AsyncIterator[Tuple[int, object]]:
+    """(line number, parsed object or the ValueError), skipping blank lines."""
+    number = 0
+    async for line in lines(chunks, max_chars):
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            yield number, orjson.loads(line)
+        except orjson.JSONDecodeError as error:
+            yield number, ValueError(f"Invalid JSON: {error}")
+
+
+def csv_row(header: List[str], values: List[str]) -> Dict[str, object]:
+    """Map a CSV row onto product fields.
+
+    Empty cells fall back to the field defaults. Specifications come either
+    as a JSON object in a `specifications` column or as `spec.<name>` columns.
+    """
+    record: Dict[str, object] = {}
+    specifications: Dict[str, str] = {}
+    for column, value in zip(header, values):
+        if value == "":
+            continue
+        if column.startswith("spec."):
+            specifications[column[len("spec."):]] = value
+        elif column == "specifications":
+            parsed = orjson.loads(value)
+            if not isinstance(parsed, dict):
+                raise ValueError(f"expected a JSON object, got {type(parsed).__name__}")
+            record["specifications"] = parsed
+        else:
+            record[column] = value
+    if specifications:
+        record["specifications"] = {**record.get("specifications", {}), **specifications}
+    return record
+
+
+async def csv_records(chunks: AsyncIterator[bytes],
+                      max_chars: int = MAX_RECORD_CHARS) -> AsyncIterator[Tuple[int, object]]:
+    """(line number, record dict or the ValueError) for each CSV data row."""
+    header = None
+    logical = ""
+    number = start = 0
+    async for line in lines(chunks, max_chars):
+        number += 1
+        logical = f"{logical}\n{line}" if logical else line
+        if not logical:
+            continue
+        # A quoted field spanning lines keeps the quote count odd
+        if logical.count('"') % 2:
+            start = start or number
+            if len(logical) > max_chars:
+                if header is None:
+                    raise ImportFormatError("Unterminated quoted field in the header")
+                yield start, ValueError(f"Unterminated quoted field (record over {max_chars} characters)")
+                logical, start = "", 0
+            continue
+        values = next(csv.reader([logical]))
+        row_number, logical, start = start or number, "", 0
+        if header is None:
+            header = [column.strip() for column in values]
+            continue
+        try:
+            yield row_number, csv_row(header, values)
+        except ValueError as error:
+            yield row_number, ValueError(f"Invalid specifications: {error}")
+    if logical:
+        yield start or number, ValueError("Unterminated quoted field")
+
+
+def validate(record: object) -> Tuple[Optional[dict], Optional[List[str]]]:
+    """(product fields, None) for a valid row, else (None, error messages).
+
+    Only the fields the row sets are returned, so an update leaves the
+    others (say stock, when the feed has no such column) as they are.
+    """
+    if isinstance(record, ValueError):
+        return None, [str(record)]
+    if not isinstance(record, dict):
+        return None, ["Row must be an object"]
+    try:
+        row = ProductImportRow.model_validate(record)
+    except ValidationError as error:
+        return None, [
+            f"{'.'.join(str(part) for part in item['loc']) or 'row'}: {item['msg']}" for item in error.errors()
+        ]
+    return row.model_dump(exclude_unset=True), None
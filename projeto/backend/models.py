@@ -0,0 +1,156 @@
+from pydantic import BaseModel, Field
+from typing import Dict, Iterable, List, Literal, Optional
+import uuid
+from datetime import datetime, timezone
+
+# Pydantic Models
+class Product(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    # Supplier stock-keeping unit; bulk imports upsert by it
+    sku: Optional[str] = None
+    name: str
+    description: str
+    price: float
+    category: str
+    brand: str
+    image_url: str
+    in_stock: bool = True
+    # Units on hand; None means stock is not tracked for this product
+    stock: Optional[int] = None
+    specifications: dict = {}
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class ProductCreate(BaseModel):
+    sku: Optional[str] = None
+    name: str
+    description: str
+    price: float
+    category: str
+    brand: str
+    image_url: str
+    in_stock: bool = True
+    stock: Optional[int] = None
+    specifications: dict = {}
+
+class ProductImportRow(ProductCreate):
+    sku: str = Field(min_length=1, max_length=128)
+
+class ImportJob(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    format: str
+    status: str = "running"
+    rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    # First IMPORT_MAX_ERRORS failures as {"row", "sku", "errors"}
+    errors: List[dict] = []
+    started_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: Optional[datetime] = None
+
+class FacetedProducts(BaseModel):
+    items: List[Product]
+    total: int
+    facets: Dict[str, Dict[str, int]]
+
+class CartItem(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    product_id: str
+    quantity: int
+    added_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class CartLine(CartItem):
+    product: Optional[Product] = None
+    line_total: float = 0
+
+class CartDetails(BaseModel):
+    items: List[CartLine]
+    total: float
+    item_count: int
+
+class CartItemCreate(BaseModel):
+    product_id: str
+    quantity: int
+
+class Order(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    customer_name: str
+    customer_email: str
+    customer_phone: str
+    items: List[dict]
+    total_amount: float
+    # Units across all lines, denormalized so listings never load `items`
+    item_count: Optional[int] = None
+    status: str = "pending"
+    paypal_order_id: Optional[str] = None
+    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+class OrderSummary(BaseModel):
+    id: str
+    customer_email: str
+    status: str
+    total_amount: float
+    item_count: Optional[int] = None
+    created_at: datetime
+
+class OrderStatusUpdate(BaseModel):
+    # Payment statuses (capturing, paid, payment_failed, refunded) are only set by the PayPal flow
+    status: Literal["shipped", "delivered", "cancelled"]
+
+class OrderItemCreate(BaseModel):
+    product_id: str
+    quantity: int = Field(gt=0)
+
+class OrderCreate(BaseModel):
+    customer_name: str
+    customer_email: str
+    customer_phone: str
+    items: List[OrderItemCreate] = Field(min_length=1)
+    # Accepted for compatibility; the total is always recomputed server-side
+    total_amount: Optional[float] = None
+
+# Fast-path serialization for trusted database documents
+class TrustedShape:
+    """Emit a model's JSON shape straight from a MongoDB document.
+
+    Documents written by this API are already valid, so read endpoints
+    project exactly the model's fields and fill in defaults for fields older
+    documents lack, then hand the dict to orjson. This skips building a
+    model per document and FastAPI re-validating it via `response_model`.
+    Values are emitted as stored, not coerced: an integer in a float field
+    (say a price of 100 written by another tool) comes out as 100 where the
+    validated path gives 100.0, and an aware UTC datetime ends in +00:00
+    rather than Z. Documents written through the models always hold floats
+    there.
+    """
+
+    def __init__(self, model, fields: Optional[Iterable[str]] = None):
+        self.model = model
+        wanted = set(model.model_fields if fields is None else fields)
+        # Declaration order is kept because dict unpacking preserves it
+        self.fields = tuple(name for name in model.model_fields if name in wanted)
+        self.projection = {"_id": 0, **{name: 1 for name in self.fields}}
+        self.template = {
+            name: None if field.is_required() or field.default_factory else field.default
+            for name, field in model.model_fields.items() if name in wanted
+        }
+        self._subsets = {}
+
+    def __call__(self, doc: dict) -> dict:
+        return {**self.template, **doc}
+
+    def select(self, doc: dict) -> dict:
+        """Copy of `doc` restricted to the model's fields, like the projection."""
+        return {name: doc[name] for name in self.template if name in doc}
+
+    def only(self, fields: Iterable[str]) -> "TrustedShape":
+        """The shape restricted to `fields` (a sparse fieldset), cached per set of fields."""
+        key = frozenset(fields)
+        if key not in self._subsets:
+            self._subsets[key] = TrustedShape(self.model, key)
+        return self._subsets[key]
+
+product_shape = TrustedShape(Product)
+cart_item_shape = TrustedShape(CartItem)
+order_shape = TrustedShape(Order)
+order_summary_shape = TrustedShape(OrderSummary)
@@ -0,0 +1,169 @@
+import time
+import random
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Refresh the OAuth token this long before PayPal says it expires
+TOKEN_REFRESH_MARGIN = 60.0
+
+
+class PayPalError(Exception):
+    def __init__(self, status_code: int, body: dict):
+        super().__init__(f"PayPal returned {status_code}: {body.get('name') or body}")
+        self.status_code = status_code
+        self.body = body
+
+    @property
+    def retryable(self) -> bool:
+        return self.status_code == 429 or self.status_code >= 500
+
+
+def create_http_client(base_url: str, max_connections: int = 20, timeout: float = 10.0) -> httpx.AsyncClient:
+    """One pooled client per process, so calls reuse keep-alive TLS connections."""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                            keepalive_expiry=30.0),
+        timeout=httpx.Timeout(timeout, connect=5.0),
+    )
+
+
+class PayPalClient:
+    """Orders v2 API calls with a cached client-credentials token."""
+
+    def __init__(self, http: httpx.AsyncClient, client_id: str, client_secret: str):
+        self.http = http
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self._token: Optional[str] = None
+        self._token_expires_at = 0.0
+        self._token_lock = asyncio.Lock()
+
+    async def access_token(self) -> str:
+        if self._token and time.monotonic() < self._token_expires_at:
+            return self._token
+        # Concurrent callers wait for one refresh instead of each fetching a token
+        async with self._token_lock:
+            if self._token and time.monotonic() < self._token_expires_at:
+                return self._token
+            response = await self.http.post(
+                "/v1/oauth2/token",
+                data={"grant_type": "client_credentials"},
+                auth=(self.client_id, self.client_secret),
+            )
+            body = self._json(response)
+            self._token = body["access_token"]
+            self._token_expires_at = time.monotonic() + max(body.get("expires_in", 0) - TOKEN_REFRESH_MARGIN, 0)
+            return self._token
+
+    @staticmethod
+    def _json(response: httpx.Response) -> dict:
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code >= 400:
+            raise PayPalError(response.status_code, body)
+        return body
+
+    async def _call(self, method: str, path: str, request_id: Optional[str] = None, **kwargs) -> dict:
+        headers = {"Authorization": f"Bearer {await self.access_token()}"}
+        if request_id:
+            # PayPal deduplicates calls carrying the same request id, so retries are safe
+            headers["PayPal-Request-Id"] = request_id
+        response = await self.http.request(method, path, headers=headers, **kwargs)
+        if response.status_code == 401:
+            self._token = None
+            headers["Authorization"] = f"Bearer {await self.access_token()}"
+            response = await self.http.request(method, path, headers=headers, **kwargs)
+        return self._json(response)
+
+    async def create_order(self, amount: float, currency: str, reference_id: str) -> dict:
+        return await self._call("POST", "/v2/checkout/orders", request_id=f"create-{reference_id}", json={
+            "intent": "CAPTURE",
+            "purchase_units": [{
+                "reference_id": reference_id,
+                "amount": {"currency_code": currency, "value": f"{amount:.2f}"},
+            }],
+        })
+
+    async def capture(self, paypal_order_id: str) -> dict:
+        return await self._call("POST", f"/v2/checkout/orders/{paypal_order_id}/capture",
+                                request_id=f"capture-{paypal_order_id}", json={})
+
+
+class CaptureWorker:
+    """Background captures with exponential backoff and jitter.
+
+    Checkout only enqueues the capture, so request latency does not depend
+    on PayPal. `on_result(order_id, status)` is called with "paid" or
+    "payment_failed"; captures still failing after `max_attempts` keep their
+    order in "capturing" and are resubmitted at the next startup.
+    """
+
+    def __init__(self, paypal: PayPalClient, on_result: Callable[[str, str], Awaitable[None]],
+                 concurrency: int = 4, max_attempts: int = 6, base_delay: float = 0.5, max_delay: float = 30.0):
+        self.paypal = paypal
+        self.on_result = on_result
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self._tasks = []
+
+    def submit(self, order_id: str, paypal_order_id: str):
+        self.queue.put_nowait((order_id, paypal_order_id))
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def join(self):
+        await self.queue.join()
+
+    async def _run(self):
+        while True:
+            order_id, paypal_order_id = await self.queue.get()
+            try:
+                await self._capture(order_id, paypal_order_id)
+            except Exception:
+                logger.exception("Capture of PayPal order %s failed", paypal_order_id)
+            finally:
+                self.queue.task_done()
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter keeps retries from many workers from lining up
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def _capture(self, order_id: str, paypal_order_id: str):
+        for attempt in range(self.max_attempts):
+            try:
+                result = await self.paypal.capture(paypal_order_id)
+            except PayPalError as error:
+                if next(iter(error.body.get("details") or []), {}).get("issue") == "ORDER_ALREADY_CAPTURED":
+                    await self.on_result(order_id, "paid")
+                    return
+                if not error.retryable:
+                    logger.warning("PayPal rejected capture of %s: %s", paypal_order_id, error)
+                    await self.on_result(order_id, "payment_failed")
+                    return
+                logger.info("Capture of %s failed (%s), retrying", paypal_order_id, error)
+            except httpx.TransportError as error:
+                logger.info("Capture of %s failed (%r), retrying", paypal_order_id, error)
+            else:
+                await self.on_result(order_id, "paid" if result.get("status") == "COMPLETED" else "payment_failed")
+                return
+            if attempt + 1 < self.max_attempts:
+                await asyncio.sleep(self.backoff(attempt))
+        logger.error("Giving up on capture of %s after %d attempts", paypal_order_id, self.max_attempts)
@@ -0,0 +1,101 @@
+"""Local stand-in for the PayPal REST API (OAuth token and Orders v2).
+
+Point the backend at it to exercise the payment flow without PayPal:
+
+    STUB_LATENCY=0.5 STUB_FAILURE_RATE=0.2 uvicorn paypal_stub:app --port 8002
+    PAYPAL_BASE_URL=http://localhost:8002 PAYPAL_CLIENT_ID=stub uvicorn server:app --port 8001
+
+STUB_LATENCY delays every call (seconds) and STUB_FAILURE_RATE answers that
+fraction of captures with 503. GET /stats counts the calls received.
+"""
+import os
+import uuid
+import random
+import asyncio
+from collections import Counter
+
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import JSONResponse
+
+
+def create_stub(latency: float = 0.0, failure_rate: float = 0.0, token_ttl: int = 32400,
+                seed: int = None) -> FastAPI:
+    stub = FastAPI(title="PayPal stub")
+    stub.state.stats = Counter()
+    orders = {}
+    tokens = set()
+    replies = {}
+    rng = random.Random(seed)
+
+    def authorize(authorization: str):
+        if not authorization or authorization.removeprefix("Bearer ") not in tokens:
+            raise HTTPException(status_code=401, detail="invalid token")
+
+    async def replay(request_id: str, build):
+        # Same PayPal-Request-Id, same answer, like the real API
+        if request_id and request_id in replies:
+            return replies[request_id]
+        response = await build()
+        if request_id and response.status_code < 500:
+            replies[request_id] = response
+        return response
+
+    @stub.middleware("http")
+    async def delay(request: Request, call_next):
+        stub.state.stats[request.url.path.rsplit("/", 1)[-1]] += 1
+        if latency:
+            await asyncio.sleep(latency)
+        return await call_next(request)
+
+    @stub.post("/v1/oauth2/token")
+    async def token():
+        value = uuid.uuid4().hex
+        tokens.add(value)
+        return {"access_token": value, "token_type": "Bearer", "expires_in": token_ttl}
+
+    @stub.post("/v2/checkout/orders")
+    async def create_order(payload: dict, authorization: str = Header(None),
+                           paypal_request_id: str = Header(None)):
+        authorize(authorization)
+
+        async def build():
+            order_id = uuid.uuid4().hex[:17].upper()
+            orders[order_id] = {"id": order_id, "status": "CREATED", "purchase_units": payload["purchase_units"]}
+            return JSONResponse({
+                **orders[order_id],
+                "links": [{"href": f"https://www.sandbox.paypal.com/checkoutnow?token={order_id}",
+                           "rel": "approve", "method": "GET"}],
+            }, status_code=201)
+
+        return await replay(paypal_request_id, build)
+
+    @stub.post("/v2/checkout/orders/{order_id}/capture")
+    async def capture(order_id: str, authorization: str = Header(None), paypal_request_id: str = Header(None)):
+        authorize(authorization)
+
+        async def build():
+            if rng.random() < failure_rate:
+                return JSONResponse({"name": "SERVICE_UNAVAILABLE"}, status_code=503)
+            order = orders.get(order_id)
+            if order is None:
+                return JSONResponse({"name": "RESOURCE_NOT_FOUND", "details": [{"issue": "INVALID_RESOURCE_ID"}]},
+                                    status_code=404)
+            if order["status"] == "COMPLETED":
+                return JSONResponse({"name": "UNPROCESSABLE_ENTITY", "details": [{"issue": "ORDER_ALREADY_CAPTURED"}]},
+                                    status_code=422)
+            order["status"] = "COMPLETED"
+            return JSONResponse({"id": order_id, "status": "COMPLETED"}, status_code=201)
+
+        return await replay(paypal_request_id, build)
+
+    @stub.get("/stats")
+    async def stats():
+        return dict(stub.state.stats)
+
+    return stub
+
+
+app = create_stub(
+    latency=float(os.environ.get('STUB_LATENCY', '0')),
+    failure_rate=float(os.environ.get('STUB_FAILURE_RATE', '0')),
+)
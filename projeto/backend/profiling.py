@@ -0,0 +1,402 @@
+import io
+import re
+import hmac
+import json
+import time
+import uuid
+import queue
+import pstats
+import random
+import asyncio
+import cProfile
+import inspect
+import logging
+import functools
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+from fastapi.responses import ORJSONResponse
+from fastapi.routing import APIRoute
+from pymongo import MongoClient, monitoring
+
+from storage import Storage, plan_stages
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("slow_queries")
+
+
+class Timings:
+    """Where one request's time went, in seconds, for its Server-Timing header."""
+
+    __slots__ = ("db", "db_calls", "app", "serialize")
+
+    def __init__(self):
+        self.db = 0.0
+        self.db_calls = 0
+        self.app = 0.0
+        self.serialize = 0.0
+
+    def header(self, total: float) -> str:
+        # Not measured but what is left over: FastAPI resolving dependencies,
+        # parsing the request and, for handlers returning plain data,
+        # validating the response model
+        other = max(total - self.db - self.app - self.serialize, 0.0)
+        return ", ".join([
+            f'db;desc="{self.db_calls} calls";dur={self.db * 1000:.2f}',
+            f"app;dur={self.app * 1000:.2f}",
+            f"other;dur={other * 1000:.2f}",
+            f"serialize;dur={self.serialize * 1000:.2f}",
+            f"total;dur={total * 1000:.2f}",
+        ])
+
+
+_timings: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+
+def _timed_call(method):
+    @functools.wraps(method)
+    async def timed(*args, **kwargs):
+        timings = _timings.get()
+        if timings is None:
+            return await method(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            timings.db += time.perf_counter() - started
+            timings.db_calls += 1
+
+    return timed
+
+
+def _timed_stream(method):
+    @functools.wraps(method)
+    async def timed(*args, **kwargs):
+        generator = method(*args, **kwargs)
+        try:
+            while True:
+                timings = _timings.get()
+                started = time.perf_counter()
+                try:
+                    item = await generator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    if timings is not None:
+                        timings.db += time.perf_counter() - started
+                yield item
+        finally:
+            await generator.aclose()
+
+    return timed
+
+
+class TimedRepository:
+    """Repository proxy adding the time spent awaiting it to the request's `db` timing.
+
+    Storage calls are timed on the event loop rather than by the command
+    listener: Motor runs commands on driver threads, which never see the
+    request's context.
+    """
+
+    def __init__(self, repository):
+        self._repository = repository
+
+    def __getattr__(self, name):
+        attribute = getattr(self._repository, name)
+        if inspect.iscoroutinefunction(attribute):
+            return _timed_call(attribute)
+        if inspect.isasyncgenfunction(attribute):
+            return _timed_stream(attribute)
+        return attribute
+
+
+class TimedStorage:
+    """`storage` with every repository wrapped in a TimedRepository."""
+
+    def __init__(self, storage: Storage):
+        self._storage = storage
+        for name in Storage.__annotations__:
+            setattr(self, name, TimedRepository(getattr(storage, name)))
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+
+class TimedORJSONResponse(ORJSONResponse):
+    """ORJSONResponse that counts its encoding as the request's `serialize` time."""
+
+    def render(self, content) -> bytes:
+        timings = _timings.get()
+        if timings is None:
+            return super().render(content)
+        started = time.perf_counter()
+        try:
+            return super().render(content)
+        finally:
+            timings.serialize += time.perf_counter() - started
+
+
+def _timed_endpoint(call):
+    @functools.wraps(call)
+    async def timed(*args, **kwargs):
+        timings = _timings.get()
+        if timings is None:
+            return await call(*args, **kwargs)
+        started = time.perf_counter()
+        db, serialize = timings.db, timings.serialize
+        try:
+            return await call(*args, **kwargs)
+        finally:
+            # Only the handler's own code: its storage calls and encoding count apart
+            timings.app += (time.perf_counter() - started) - (timings.db - db) - (timings.serialize - serialize)
+
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """APIRoute answering with a Server-Timing header.
+
+    db is time awaiting storage, app the handler's own code, serialize JSON
+    encoding and other whatever is left: FastAPI's dependency resolution,
+    request parsing and validation, and response model validation.
+    """
+
+    def get_route_handler(self):
+        if asyncio.iscoroutinefunction(self.dependant.call):
+            self.dependant.call = _timed_endpoint(self.dependant.call)
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            timings = Timings()
+            token = _timings.set(timings)
+            started = time.perf_counter()
+            try:
+                response = await handler(request)
+            finally:
+                _timings.reset(token)
+            response.headers["Server-Timing"] = timings.header(time.perf_counter() - started)
+            return response
+
+        return timed_handler
+
+
+class ProfilingMiddleware:
+    """Opt-in cProfile of single requests, written to `directory`.
+
+    A request is profiled when it sends `header` with the configured token,
+    or at random with probability `sample_rate`. Each profile is saved as
+    <name>.prof (for pstats/snakeviz) and <name>.txt (top functions by
+    cumulative time), and the response names it in X-Profile-Report.
+    cProfile sees the whole thread, so work of requests running concurrently
+    shows up too; only one profile runs at a time.
+    """
+
+    def __init__(self, app, directory: str, sample_rate: float = 0.0, token: Optional[str] = None,
+                 header: str = "X-Profile", top: int = 40):
+        self.app = app
+        self.directory = Path(directory)
+        self.sample_rate = sample_rate
+        self.token = token
+        self.header = header.lower().encode("latin-1")
+        self.top = top
+        self._active = False
+
+    def wanted(self, scope) -> bool:
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == self.header:
+                    return hmac.compare_digest(value, self.token.encode())
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def save(self, profiler: cProfile.Profile, name: str, scope, elapsed: float):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(self.directory / f"{name}.prof")
+        report = io.StringIO()
+        report.write(f"{scope['method']} {scope['path']}?{scope['query_string'].decode('latin-1')}\n")
+        report.write(f"{elapsed * 1000:.1f} ms wall time\n\n")
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(self.top)
+        (self.directory / f"{name}.txt").write_text(report.getvalue())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active or not self.wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", scope["path"]).strip("_")[:60]
+        name = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{scope['method']}-{slug}-{uuid.uuid4().hex[:8]}"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-profile-report", name.encode())]
+            await send(message)
+
+        self._active = True
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profiler.disable()
+            self._active = False
+            try:
+                await asyncio.to_thread(self.save, profiler, name, scope, time.perf_counter() - started)
+            except OSError:
+                logger.exception("Could not save profile %s", name)
+
+
+# Commands whose plan `explain` can describe, and where their filter sits
+EXPLAINABLE = {
+    "find": lambda command: command.get("filter"),
+    "count": lambda command: command.get("query"),
+    "distinct": lambda command: command.get("query"),
+    "findAndModify": lambda command: command.get("query"),
+    "update": lambda command: (command.get("updates") or [{}])[0].get("q"),
+    "delete": lambda command: (command.get("deletes") or [{}])[0].get("q"),
+    "aggregate": lambda command: next(
+        (stage["$match"] for stage in command.get("pipeline", []) if "$match" in stage), None),
+}
+# Writes get their filter shape logged but are not explained: explain can
+# fail for them (multi-statement updates and deletes) and only sees the first
+WRITE_COMMANDS = {"update", "delete", "findAndModify"}
+# Fields the driver adds to a command that explain must not be given
+DRIVER_FIELDS = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "autocommit", "startTransaction",
+                 "readConcern", "writeConcern"}
+
+
+def query_shape(value):
+    """`value` with every literal replaced by its type name, keeping keys and operators."""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if any(isinstance(item, dict) for item in value):
+            return [query_shape(item) for item in value]
+        return [type(value[0]).__name__] if value else []
+    return type(value).__name__
+
+
+def plan_summary(explain: dict) -> dict:
+    """Winning plan stages and indexes from any explain output (find, aggregate, writes)."""
+    def find_planner(node):
+        if isinstance(node, dict):
+            if "queryPlanner" in node:
+                return node["queryPlanner"]
+            children = node.values()
+        elif isinstance(node, list):
+            children = node
+        else:
+            return None
+        for child in children:
+            planner = find_planner(child)
+            if planner is not None:
+                return planner
+        return None
+
+    def index_names(node):
+        if isinstance(node, dict):
+            if "indexName" in node:
+                yield node["indexName"]
+            for child in node.values():
+                yield from index_names(child)
+        elif isinstance(node, list):
+            for child in node:
+                yield from index_names(child)
+
+    planner = find_planner(explain) or {}
+    winning = planner.get("winningPlan", {})
+    # Newer servers nest the classic plan under queryPlan
+    winning = winning.get("queryPlan", winning)
+    stages = plan_stages(winning) if winning else []
+    return {"stages": stages, "indexes": list(dict.fromkeys(index_names(winning))), "collscan": "COLLSCAN" in stages}
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Log MongoDB commands slower than `threshold_ms` as JSON lines on the slow_queries logger.
+
+    Each entry has the collection, command, duration and filter shape; reads
+    also get a summary of their plan.
+    Listener callbacks run on the driver's threads and must not block, so
+    slow commands are queued to a background thread that runs `explain`
+    through its own client, once per (collection, command, shape).
+    """
+
+    def __init__(self, threshold_ms: float, mongo_url: str, max_plans: int = 1000, max_queue: int = 1000):
+        self.threshold_ms = threshold_ms
+        self.mongo_url = mongo_url
+        self.max_plans = max_plans
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[dict]" = queue.Queue(max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._client: Optional[MongoClient] = None
+        self._plans: "OrderedDict[str, dict]" = OrderedDict()
+
+    def started(self, event):
+        if event.command_name == "explain":
+            return
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (event.command_name, event.command)
+
+    def succeeded(self, event):
+        with self._lock:
+            started = self._pending.pop((event.connection_id, event.request_id), None)
+        if started is None or event.duration_micros < self.threshold_ms * 1000:
+            return
+        command_name, command = started
+        target = command.get("collection") if command_name == "getMore" else command.get(command_name)
+        entry = {
+            "at": datetime.now(timezone.utc).isoformat(),
+            "database": event.database_name,
+            "collection": target if isinstance(target, str) else None,
+            "command": command_name,
+            "duration_ms": round(event.duration_micros / 1000, 2),
+        }
+        if command_name in EXPLAINABLE:
+            entry["filter"] = query_shape(EXPLAINABLE[command_name](command) or {})
+            if "sort" in command:
+                entry["sort"] = list(command["sort"])
+            if command_name not in WRITE_COMMANDS:
+                entry["explain"] = {key: value for key, value in command.items() if key not in DRIVER_FIELDS}
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            return  # already far behind; drop rather than slow the driver down
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="slow-query-log", daemon=True)
+                    self._thread.start()
+
+    def failed(self, event):
+        with self._lock:
+            self._pending.pop((event.connection_id, event.request_id), None)
+
+    def plan(self, entry: dict) -> Optional[dict]:
+        command = entry.pop("explain", None)
+        if command is None:
+            return None
+        key = json.dumps([entry["collection"], entry["command"], entry["filter"], entry.get("sort")], default=str)
+        if key not in self._plans:
+            if self._client is None:
+                self._client = MongoClient(self.mongo_url)
+            explain = self._client[entry["database"]].command({"explain": command, "verbosity": "queryPlanner"})
+            self._plans[key] = plan_summary(explain)
+            if len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        return self._plans[key]
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            try:
+                plan = self.plan(entry)
+            except Exception as error:
+                plan = {"error": str(error)}
+            if plan is not None:
+                entry["plan"] = plan
+            slow_query_logger.warning(json.dumps(entry, default=str))
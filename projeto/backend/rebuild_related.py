@@ -0,0 +1,51 @@
+"""Recompute the co-purchase counts and related-product lists from the orders collection.
+
+Checkout keeps them up to date incrementally from a background queue;
+this rebuilds them from scratch (for baskets dropped when that queue was
+full, orders placed before they existed, or after changing
+RELATED_TOP_K) with vectorised numpy counting.
+
+    python rebuild_related.py [--dry-run] [--top-k 20]
+"""
+import asyncio
+
+import typer
+
+from config import RELATED_TOP_K, STREAM_BATCH_SIZE, require_mongo, storage_from_env
+from storage import Storage
+from related import basket, cooccurrence, related_data
+
+cli = typer.Typer(add_completion=False)
+
+
+async def rebuild(storage: Storage, dry_run: bool, top_k: int):
+    baskets = []
+    async for order in storage.orders.stream(STREAM_BATCH_SIZE):
+        baskets.append(basket(order))
+    pairs, top = related_data(*cooccurrence(baskets), top_k)
+    typer.echo(f"{len(baskets)} orders -> {len(pairs)} product pairs, {len(top)} related lists")
+    if not dry_run:
+        await storage.related.replace(pairs, top)
+        typer.echo("Co-purchase data replaced")
+
+
+async def run(dry_run: bool, top_k: int):
+    storage = storage_from_env()
+    try:
+        await rebuild(storage, dry_run, top_k)
+    finally:
+        await storage.close()
+
+
+@cli.command()
+def main(
+    dry_run: bool = typer.Option(False, help="compute without replacing the stored data"),
+    top_k: int = typer.Option(RELATED_TOP_K, min=1, help="products kept in each related list"),
+):
+    """Rebuild the co-purchase counts and related-product lists from all orders."""
+    require_mongo()
+    asyncio.run(run(dry_run, top_k))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,154 @@
+import heapq
+import asyncio
+import logging
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Orders with more distinct products than this (bulk purchases) say little
+# about what goes together and would add a quadratic number of pairs
+MAX_BASKET_PRODUCTS = 50
+
+
+def basket(order: dict) -> List[str]:
+    """Distinct product ids of an order, or [] when it is too big to count."""
+    product_ids = list(dict.fromkeys(line["product_id"] for line in order["items"]))
+    return product_ids if len(product_ids) <= MAX_BASKET_PRODUCTS else []
+
+
+def basket_pairs(product_ids: List[str]) -> List[Tuple[str, str]]:
+    """Every ordered (product, other) pair bought together, both directions."""
+    return [(product_id, other) for product_id in product_ids for other in product_ids if other != product_id]
+
+
+def pair_counts(baskets: Iterable[List[str]]) -> Dict[Tuple[str, str], int]:
+    """How many of `baskets` hold each ordered pair."""
+    return Counter(pair for product_ids in baskets for pair in basket_pairs(product_ids))
+
+
+def top_related(counts: Dict[str, int], top_k: int) -> List[dict]:
+    """The `top_k` most co-purchased products, ties broken by id."""
+    best = heapq.nsmallest(top_k, counts.items(), key=lambda item: (-item[1], item[0]))
+    return [{"product_id": other, "count": count} for other, count in best]
+
+
+def cooccurrence(baskets: Iterable[List[str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Count co-purchases across all baskets at once.
+
+    Returns (product ids, left, right, count): one entry per distinct
+    ordered pair, with left/right indexing into the sorted product ids.
+    Only the pairs that actually occur are materialised.
+    """
+    sizes = []
+    lines = []
+    for product_ids in baskets:
+        if len(product_ids) > 1:
+            sizes.append(len(product_ids))
+            lines.extend(product_ids)
+    if not sizes:
+        empty = np.empty(0, dtype=np.int64)
+        return np.empty(0, dtype=object), empty, empty, empty
+    ids, products = np.unique(np.array(lines, dtype=object), return_inverse=True)
+    return (ids, *count_pairs(products.astype(np.int64), np.array(sizes, dtype=np.int64), len(ids)))
+
+
+def count_pairs(products: np.ndarray, sizes: np.ndarray,
+                product_count: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(left, right, count) over baskets given as consecutive runs of `sizes` product codes."""
+    # Pair every line with each line of its own basket: a line in a basket
+    # of size s repeats s times, against offsets 0..s-1 from the basket start
+    per_line = np.repeat(sizes, sizes)
+    basket_starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    left = np.repeat(products, per_line)
+    offsets = np.arange(len(left)) - np.repeat(np.cumsum(per_line) - per_line, per_line)
+    right = products[np.repeat(basket_starts, per_line) + offsets]
+    keep = left != right
+
+    codes, counts = np.unique(left[keep] * product_count + right[keep], return_counts=True)
+    return codes // product_count, codes % product_count, counts
+
+
+def top_k_pairs(left: np.ndarray, right: np.ndarray, counts: np.ndarray, top_k: int) -> np.ndarray:
+    """Positions of each product's `top_k` best pairs, grouped by product, best first."""
+    order = np.lexsort((right, -counts, left))
+    grouped = left[order]
+    group_starts = np.searchsorted(grouped, grouped, side="left")
+    return order[np.arange(len(order)) - group_starts < top_k]
+
+
+def related_data(ids: np.ndarray, left: np.ndarray, right: np.ndarray, counts: np.ndarray,
+                 top_k: int) -> Tuple[List[dict], Dict[str, List[dict]]]:
+    """The pair count documents and per-product top lists RelatedRepository.replace() takes."""
+    pairs = [
+        {"product_id": ids[a], "other_id": ids[b], "count": int(count)}
+        for a, b, count in zip(left, right, counts)
+    ]
+    top: Dict[str, List[dict]] = {}
+    for position in top_k_pairs(left, right, counts, top_k):
+        top.setdefault(ids[left[position]], []).append(
+            {"product_id": ids[right[position]], "count": int(counts[position])})
+    return pairs, top
+
+
+class RelatedUpdater:
+    """Fold checkout baskets into the co-purchase data in the background.
+
+    Checkout only queues its basket, so neither its latency nor its outcome
+    depends on the pair updates. Baskets waiting in the queue are applied
+    together, up to `batch_size` at a time, so a burst of orders costs one
+    bulk write plus one re-rank per distinct product. The queue is bounded;
+    when it is full the basket is dropped with a warning, and
+    rebuild_related.py recounts everything from the orders.
+    """
+
+    def __init__(self, related, top_k: int, max_queue: int = 10_000, batch_size: int = 100):
+        self.related = related
+        self.top_k = top_k
+        self.batch_size = batch_size
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self._task = None
+
+    def submit(self, product_ids: List[str]):
+        if len(product_ids) < 2:
+            return
+        try:
+            self.queue.put_nowait(product_ids)
+        except asyncio.QueueFull:
+            logger.warning("Co-purchase queue full; basket dropped until the next rebuild_related.py run")
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the worker, applying whatever is still queued."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        while not self.queue.empty():
+            await self._apply(self._take(self.queue.get_nowait()))
+
+    async def join(self):
+        await self.queue.join()
+
+    def _take(self, first: List[str]) -> List[List[str]]:
+        baskets = [first]
+        while len(baskets) < self.batch_size and not self.queue.empty():
+            baskets.append(self.queue.get_nowait())
+        return baskets
+
+    async def _apply(self, baskets: List[List[str]]):
+        try:
+            await self.related.apply(baskets, self.top_k)
+        except Exception:
+            logger.exception("Co-purchase update of %d baskets failed", len(baskets))
+        finally:
+            for _ in baskets:
+                self.queue.task_done()
+
+    async def _run(self):
+        while True:
+            await self._apply(self._take(await self.queue.get()))
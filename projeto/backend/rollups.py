@@ -0,0 +1,71 @@
+from collections import defaultdict
+from datetime import timezone
+from typing import Dict, Iterable, List
+
+# Bucket dimensions; "total" has a single value per day
+ROLLUP_DIMENSIONS = ("total", "category", "brand")
+ROLLUP_METRICS = ("revenue", "orders", "units")
+
+# Orders in these states no longer count as sales
+EXCLUDED_STATUSES = {"cancelled", "refunded", "payment_failed"}
+
+UNKNOWN = "unknown"
+
+
+def counts_as_sale(status: str) -> bool:
+    return status not in EXCLUDED_STATUSES
+
+
+def status_sign(old: str, new: str) -> int:
+    """+1/-1 when a status change moves an order into/out of the sales figures."""
+    return int(counts_as_sale(new)) - int(counts_as_sale(old))
+
+
+def order_day(order: dict) -> str:
+    created_at = order["created_at"]
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date().isoformat()
+
+
+def order_deltas(order: dict, sign: int = 1) -> List[dict]:
+    """The $inc each daily bucket needs for one order (sign -1 takes it back out).
+
+    An order counts once per category and brand it touches, however many
+    of its lines fall there.
+    """
+    day = order_day(order)
+    buckets = {("total", "all"): [order["total_amount"], 1, 0]}
+    for line in order["items"]:
+        for dimension in ("category", "brand"):
+            key = (dimension, line.get(dimension) or UNKNOWN)
+            bucket = buckets.setdefault(key, [0.0, 1, 0])
+            bucket[0] += line["line_total"]
+            bucket[2] += line["quantity"]
+        buckets[("total", "all")][2] += line["quantity"]
+    return [
+        {
+            "day": day,
+            "dimension": dimension,
+            "value": value,
+            "revenue": round(revenue, 2) * sign,
+            "orders": orders * sign,
+            "units": units * sign,
+        }
+        for (dimension, value), (revenue, orders, units) in buckets.items()
+    ]
+
+
+def sum_buckets(buckets: Iterable[dict], group_by: str) -> List[dict]:
+    """Fold bucket documents into report rows keyed by day or by dimension value."""
+    rows: Dict[str, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(ROLLUP_METRICS, 0))
+    for bucket in buckets:
+        row = rows[bucket["day"] if group_by == "day" else bucket["value"]]
+        for metric in ROLLUP_METRICS:
+            row[metric] += bucket[metric]
+    ordered = sorted(rows.items()) if group_by == "day" else sorted(rows.items(), key=lambda item: -item[1]["revenue"])
+    return [
+        {"key": key, **row, "revenue": round(row["revenue"], 2)}
+        for key, row in ordered
+        if row["orders"] or row["units"]
+    ]
@@ -0,0 +1,181 @@
+import re
+import math
+import heapq
+import bisect
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Dict, List, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Very common Portuguese words that would otherwise match most of the catalog
+STOPWORDS = {
+    "a", "o", "as", "os", "de", "da", "do", "das", "dos", "e", "em", "na", "no",
+    "nas", "nos", "com", "para", "por", "um", "uma", "ou",
+}
+
+# Term frequency multiplier per indexed field
+FIELD_WEIGHTS = {"name": 3, "brand": 2, "description": 1, "specifications": 1}
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents so "Fogão" and "fogao" compare equal."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_RE.findall(fold(text)) if token not in STOPWORDS]
+
+
+def product_terms(product: dict) -> Counter:
+    terms = Counter()
+    fields = {
+        "name": product.get("name", ""),
+        "brand": product.get("brand", ""),
+        "description": product.get("description", ""),
+        "specifications": " ".join(str(value) for value in (product.get("specifications") or {}).values()),
+    }
+    for field, text in fields.items():
+        for token in tokenize(text):
+            terms[token] += FIELD_WEIGHTS[field]
+    return terms
+
+
+class SearchIndex:
+    """In-memory inverted index over the product catalog with BM25 ranking.
+
+    Postings hold the BM25 term-frequency component, computed when a product
+    is added, and each term also keeps its postings ordered by that weight.
+    Queries walk the ordered lists with the threshold algorithm and stop as
+    soon as no unseen product can enter the top results. Length normalisation
+    uses the average document length at insert time and is brought back in
+    line by `rebuild`.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, memo_size: int = 1024):
+        self.k1 = k1
+        self.b = b
+        self.memo_size = memo_size
+        self.clear()
+
+    def clear(self):
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._ranked: Dict[str, List[Tuple[float, str]]] = {}
+        self._doc_terms: Dict[str, Counter] = {}
+        self._total_length = 0
+        # Recent multi-term results; storefront queries repeat a lot
+        self._memo: "OrderedDict[tuple, List[str]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def _weight(self, tf: int, length: int, avgdl: float) -> float:
+        norm = 1 - self.b + self.b * length / avgdl if avgdl else 1
+        return tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+    def _index(self, product: dict) -> List[Tuple[str, float]]:
+        doc_id = product["id"]
+        if doc_id in self._doc_terms:
+            self.remove(doc_id)
+        terms = product_terms(product)
+        length = sum(terms.values())
+        self._doc_terms[doc_id] = terms
+        self._total_length += length
+        avgdl = self._total_length / len(self._doc_terms)
+        weights = []
+        for term, tf in terms.items():
+            weight = self._weight(tf, length, avgdl)
+            self._postings.setdefault(term, {})[doc_id] = weight
+            weights.append((term, weight))
+        return weights
+
+    def add(self, product: dict):
+        self._memo.clear()
+        for term, weight in self._index(product):
+            bisect.insort(self._ranked.setdefault(term, []), (-weight, product["id"]))
+
+    def remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        self._memo.clear()
+        self._total_length -= sum(terms.values())
+        for term in terms:
+            postings = self._postings[term]
+            ranked = self._ranked[term]
+            del ranked[bisect.bisect_left(ranked, (-postings.pop(doc_id), doc_id))]
+            if not postings:
+                del self._postings[term]
+                del self._ranked[term]
+
+    def rebuild(self, products):
+        self.clear()
+        for product in products:
+            self._index(product)
+        # Recompute every weight against the final average document length
+        avgdl = self._total_length / len(self._doc_terms) if self._doc_terms else 0
+        for doc_id, terms in self._doc_terms.items():
+            length = sum(terms.values())
+            for term, tf in terms.items():
+                self._postings[term][doc_id] = self._weight(tf, length, avgdl)
+        self._ranked = {
+            term: sorted((-weight, doc_id) for doc_id, weight in postings.items())
+            for term, postings in self._postings.items()
+        }
+
+    def _idf(self, term: str) -> float:
+        df = len(self._postings[term])
+        return math.log(1 + (len(self._doc_terms) - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[str]:
+        """Return product ids matching every query term, best first."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or any(term not in self._postings for term in terms):
+            return []
+        wanted = offset + limit
+
+        if len(terms) == 1:
+            # Single term: the weight-ordered postings are already the ranking
+            return [doc_id for _, doc_id in self._ranked[terms[0]][offset:wanted]]
+
+        key = (tuple(terms), wanted)
+        if key in self._memo:
+            self._memo.move_to_end(key)
+            return self._memo[key][offset:]
+        hits = self._top_matches(terms, wanted)
+        self._memo[key] = hits
+        if len(self._memo) > self.memo_size:
+            self._memo.popitem(last=False)
+        return hits[offset:]
+
+    def _top_matches(self, terms: List[str], wanted: int) -> List[str]:
+        scorers = [(self._idf(term), self._postings[term]) for term in terms]
+        ranked = [(idf, self._ranked[term]) for term, (idf, _) in zip(terms, scorers)]
+        top: List[Tuple[float, str]] = []
+        seen = set()
+        for depth in range(min(len(self._ranked[term]) for term in terms)):
+            threshold = 0.0
+            for idf, lst in ranked:
+                negative_weight, doc_id = lst[depth]
+                threshold -= idf * negative_weight
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                score = 0.0
+                for term_idf, posting in scorers:
+                    weight = posting.get(doc_id)
+                    if weight is None:
+                        break
+                    score += term_idf * weight
+                else:
+                    if len(top) < wanted:
+                        heapq.heappush(top, (score, doc_id))
+                    elif score > top[0][0]:
+                        heapq.heapreplace(top, (score, doc_id))
+            # No product below this depth can beat the current k-th best
+            if len(top) >= wanted and top[0][0] >= threshold:
+                break
+        # Once the shortest list is exhausted every product matching all
+        # terms has been seen, so the loop bound above is exact
+        return [doc_id for _, doc_id in sorted(top, key=lambda hit: (-hit[0], hit[1]))]
@@ -1,201 +1,895 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request
-from dotenv import load_dotenv
+from fastapi import FastAPI, APIRouter, HTTPException, Request, Response, Query, Depends
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from fastapi.routing import APIRoute
+from fastapi.encoders import jsonable_encoder
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
 import os
 import logging
-from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import uuid
-from datetime import datetime, timezone
+import json
+import base64
+import hmac
+import orjson
+import httpx
+from datetime import date, datetime, timedelta, timezone
 import asyncio
+from collections import Counter
+from cache import ResponseCache, etag_matches
+from search import SearchIndex
+from facets import FacetIndex
+from admission import AdmissionMiddleware
+from compression import CompressionMiddleware
+from metrics import MetricsMiddleware, registry
+from profiling import ProfilingMiddleware, TimedORJSONResponse, TimedRoute, TimedStorage
+from models import (
+    Product, ProductCreate, FacetedProducts, ImportJob, CartItem, CartDetails, CartItemCreate,
+    Order, OrderCreate, OrderItemCreate, OrderStatusUpdate, OrderSummary, product_shape, cart_item_shape, order_shape,
+    order_summary_shape,
+)
+from storage import Storage, InsufficientStock, DuplicateProduct
+from importer import ImportFormatError, multipart_file, detect_format, ndjson_records, csv_records, validate
+from rollups import order_deltas, status_sign, sum_buckets
+from related import RelatedUpdater, basket
+from export import csv_header, export_batches, export_range, gzip_stream
+from synthetic import generate
+from payments import PayPalClient, PayPalError, CaptureWorker
+from idempotency import IdempotencyGuard, KeyReused, RequestInProgress, fingerprint
+from config import (
+    CART_TTL_SECONDS, EXPORT_BATCH_SIZE, RELATED_TOP_K, STREAM_BATCH_SIZE, SYNTHETIC_BATCH_SIZE,
+    paypal_from_env, storage_from_env,
+)
+
+# Listing pagination
+PAGE_SIZE_DEFAULT = 100
+PAGE_SIZE_MAX = 1000
+
+# Carts are keyed by an opaque token and expire after CART_TTL_SECONDS untouched
+CART_TOKEN_HEADER = "X-Cart-Token"
+CART_TOKEN_COOKIE = "cart_token"
+
+# Bulk product import
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+IMPORT_MAX_ERRORS = 1000
+
+# How often workers without change streams poll the product version counter
+CATALOG_POLL_INTERVAL = float(os.environ.get('CATALOG_POLL_INTERVAL', '0.25'))
+
+# Synthetic data for scale tests (POST /api/init-data?mode=synthetic)
+SYNTHETIC_WORKERS = int(os.environ.get('SYNTHETIC_WORKERS', '4'))
+SYNTHETIC_MAX_RECORDS = 5_000_000
+
+# Longest date range a sales report may span
+REPORT_MAX_DAYS = 366
+
+# Fulfilment status changes through PUT /orders/{id}/status need
+# "Authorization: Bearer <ADMIN_TOKEN>"; without ADMIN_TOKEN the route is off
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+# The only status changes that route may make; payment statuses are left to PayPal
+ORDER_TRANSITIONS = {
+    "pending": ("cancelled",),
+    "paid": ("shipped",),
+    "shipped": ("delivered",),
+}
+
+# PayPal, when config.py finds credentials
+PAYPAL_CURRENCY = os.environ.get('PAYPAL_CURRENCY', 'BRL')
+PAYPAL_CAPTURE_WORKERS = int(os.environ.get('PAYPAL_CAPTURE_WORKERS', '4'))
+
+# Admission control, per worker process; a rate or cap of 0 disables it. The
+# rate limit is per client IP and off by default: behind a proxy or NAT many
+# shoppers share one address, so size it for the deployment before enabling
+ADMISSION_RATE = float(os.environ.get('ADMISSION_RATE', '0'))
+ADMISSION_BURST = float(os.environ.get('ADMISSION_BURST', '40'))
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', '64'))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', '256'))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', '2'))
+# Checkout goes ahead of catalog browsing when the API is saturated
+CHECKOUT_PREFIXES = ("/api/orders", "/api/cart", "/api/paypal")
+
+# Retried POSTs carrying the same key replay the first response
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '10'))
+
+# Server-Timing (db, app, serialize, other) on every /api response. Off by
+# default: it tells any client how the backend spends its time
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+# cProfile a request when it sends X-Profile: <PROFILE_TOKEN>, or a sampled fraction of them
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+# Text responses at least this big are sent gzip compressed when the client accepts it (brotli too,
+# if the optional brotli package is installed)
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', '1024'))
+
+logger = logging.getLogger(__name__)
+
+class Catalog:
+    """Per-app catalog state derived from the products repository.
+
+    Holds the serialized response cache and the in-memory search and facet
+    indexes. They are loaded at startup and then follow the products
+    collection's change feed, so writes made through any worker show up in
+    every worker.
+    """
+
+    def __init__(self):
+        self.cache = ResponseCache(
+            max_entries=int(os.environ.get('CATALOG_CACHE_SIZE', '512')),
+            ttl=float(os.environ.get('CATALOG_CACHE_TTL', '60')),
+        )
+        self.search = SearchIndex()
+        self.facets = FacetIndex()
+
+    async def load(self, storage: Storage):
+        products = [product async for product in storage.products.stream(None, None, None, STREAM_BATCH_SIZE)]
+        self.rebuild(products)
+        logger.info("Catalog indexes loaded with %d products", len(products))
+
+    def rebuild(self, products: List[dict]):
+        """`products` must be in listing order."""
+        self.cache.clear()
+        self.search.rebuild(products)
+        self.facets.rebuild(products)
+
+    def add(self, product: dict):
+        """Insert or refresh one product."""
+        self.cache.clear()
+        self.search.remove(product["id"])
+        self.search.add(product)
+        self.facets.add(product)
+
+    async def follow(self, storage: Storage, ready: asyncio.Event):
+        """Apply the change feed until cancelled, reconnecting on errors."""
+        while True:
+            try:
+                async for event in storage.products.changes(CATALOG_POLL_INTERVAL):
+                    if event["op"] in ("ready", "reload"):
+                        await self.load(storage)
+                        ready.set()
+                    elif event["op"] == "upsert":
+                        self.add(event["product"])
+            except Exception:
+                logger.exception("Catalog change feed failed; reconnecting")
+            await asyncio.sleep(1)
+
+def get_storage(request: Request) -> Storage:
+    return request.app.state.storage
+
+def get_catalog(request: Request) -> Catalog:
+    return request.app.state.catalog
+
+def product_fieldset(
+    fields: Optional[str] = Query(None, description="Comma-separated Product fields to return, e.g. id,name,price"),
+) -> Optional[Tuple[str, ...]]:
+    """Parse a `fields=` sparse fieldset; the id is always included."""
+    if fields is None:
+        return None
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = names - set(Product.model_fields)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown product fields: {', '.join(sorted(unknown))}")
+    return product_shape.only(names | {"id"}).fields
+
+def carry_headers(response: Response, sub_response: Response) -> Response:
+    """Copy headers set by dependencies (e.g. the cart token) onto a Response returned directly."""
+    for name, value in sub_response.headers.raw:
+        if name != b"content-length":
+            response.headers.raw.append((name, value))
+    return response
+
+async def idempotent(request: Request, sub_response: Response, session_id: str, handler):
+    """Run `handler` once per Idempotency-Key and replay its response for retries.
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+    Without the header the handler's result is returned as is. Keys are
+    bound to the route, cart session and request body; reusing one for a
+    different request is rejected with 422.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return await handler()
+    if not 0 < len(key) <= 255:
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+    async def run():
+        return 200, orjson.dumps(jsonable_encoder(await handler()))
 
-# Create the main app without a prefix
-app = FastAPI()
+    request_fingerprint = fingerprint(request.method, request.url.path, session_id, await request.body())
+    try:
+        (status_code, body), replayed = await request.app.state.idempotency.run(key, request_fingerprint, run)
+    except KeyReused:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+    except RequestInProgress:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress",
+                            headers={"Retry-After": "1"})
+    response = Response(content=body, status_code=status_code, media_type="application/json")
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return carry_headers(response, sub_response)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
-
-# Pydantic Models
-class Product(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    name: str
-    description: str
-    price: float
-    category: str
-    brand: str
-    image_url: str
-    in_stock: bool = True
-    specifications: dict = {}
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-
-class ProductCreate(BaseModel):
-    name: str
-    description: str
-    price: float
-    category: str
-    brand: str
-    image_url: str
-    in_stock: bool = True
-    specifications: dict = {}
-
-class CartItem(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    product_id: str
-    quantity: int
-    added_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-
-class CartItemCreate(BaseModel):
-    product_id: str
-    quantity: int
-
-class Order(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    customer_name: str
-    customer_email: str
-    customer_phone: str
-    items: List[dict]
-    total_amount: float
-    status: str = "pending"
-    paypal_order_id: Optional[str] = None
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
-
-class OrderCreate(BaseModel):
-    customer_name: str
-    customer_email: str
-    customer_phone: str
-    items: List[dict]
-    total_amount: float
+api_router = APIRouter(prefix="/api", route_class=TimedRoute if SERVER_TIMING else APIRoute)
+
+# Keyset pagination helpers
+def encode_cursor(doc: dict) -> str:
+    """Opaque `after` token pointing at the last (created_at, id) returned."""
+    raw = json.dumps([doc["created_at"].isoformat(), doc["id"]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(token: str):
+    """Turn an `after` token back into a (created_at, id) keyset position."""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        created_at, doc_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(doc_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def stream_products(products, fmt: str, shape=product_shape):
+    # Encode batch by batch so memory stays flat regardless of catalog size
+    if fmt == "json":
+        yield b"["
+    first = True
+    chunk = []
+    async for product in products:
+        line = orjson.dumps(shape(product))
+        if fmt == "ndjson":
+            chunk.append(line + b"\n")
+        else:
+            chunk.append(line if first else b"," + line)
+        first = False
+        if len(chunk) >= STREAM_BATCH_SIZE:
+            yield b"".join(chunk)
+            chunk = []
+    if chunk:
+        yield b"".join(chunk)
+    if fmt == "json":
+        yield b"]"
+
+async def cached_json(request: Request, build):
+    """Serve a catalog read from the response cache, honouring If-None-Match.
+
+    `build` is only awaited on a cache miss and returns (body, headers).
+    """
+    cache = request.app.state.catalog.cache
+    key = request.url.path + "?" + request.url.query
+    entry = cache.get(key)
+    if entry is None:
+        body, headers = await build()
+        entry = cache.set(key, body, headers)
+    headers = {**entry.headers, "ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+async def list_products(category: Optional[str], request: Request, limit: Optional[int],
+                        after: Optional[str], stream: Optional[str], fields: Optional[Tuple[str, ...]]):
+    storage = get_storage(request)
+    position = decode_cursor(after) if after else None
+    shape = product_shape.only(fields) if fields else product_shape
+
+    if stream:
+        media_type = "application/x-ndjson" if stream == "ndjson" else "application/json"
+        return StreamingResponse(
+            stream_products(
+                storage.products.stream(category, position, limit, STREAM_BATCH_SIZE, fields), stream, shape,
+            ),
+            media_type=media_type,
+        )
+
+    limit = limit or PAGE_SIZE_DEFAULT
+
+    async def build():
+        # Fetch one extra document to know whether another page exists; the
+        # cursor needs created_at even when the fieldset leaves it out
+        products = await storage.products.page(category, position, limit + 1, fields and (*fields, "created_at"))
+        headers = {}
+        if len(products) > limit:
+            products = products[:limit]
+            headers["X-Next-Cursor"] = encode_cursor(products[-1])
+        if fields and "created_at" not in fields:
+            products = [shape.select(product) for product in products]
+        body = orjson.dumps([shape(product) for product in products])
+        return body, headers
+
+    return await cached_json(request, build)
+
+async def products_in_order(storage: Storage, ids: List[str],
+                            fields: Optional[Tuple[str, ...]] = None) -> List[dict]:
+    """Fetch products with one $in query and return them in `ids` order."""
+    shape = product_shape.only(fields) if fields else product_shape
+    by_id = {product["id"]: product for product in await storage.products.get_many(ids, fields)}
+    return [shape(by_id[product_id]) for product_id in ids if product_id in by_id]
 
 # Product endpoints
 @api_router.get("/products", response_model=List[Product])
-async def get_products():
-    products = await db.products.find().to_list(1000)
-    return [Product(**product) for product in products]
+async def get_products(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    after: Optional[str] = None,
+    stream: Optional[str] = Query(None, pattern="^(json|ndjson)$"),
+    fields: Optional[Tuple[str, ...]] = Depends(product_fieldset),
+):
+    return await list_products(None, request, limit, after, stream, fields)
 
 @api_router.get("/products/category/{category}", response_model=List[Product])
-async def get_products_by_category(category: str):
-    products = await db.products.find({"category": category}).to_list(1000)
-    return [Product(**product) for product in products]
+async def get_products_by_category(
+    category: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=PAGE_SIZE_MAX),
+    after: Optional[str] = None,
+    stream: Optional[str] = Query(None, pattern="^(json|ndjson)$"),
+    fields: Optional[Tuple[str, ...]] = Depends(product_fieldset),
+):
+    return await list_products(category, request, limit, after, stream, fields)
+
+@api_router.get("/products/search", response_model=List[Product])
+async def search_products(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=PAGE_SIZE_MAX),
+    offset: int = Query(0, ge=0),
+    fields: Optional[Tuple[str, ...]] = Depends(product_fieldset),
+    storage: Storage = Depends(get_storage),
+    catalog: Catalog = Depends(get_catalog),
+):
+    ids = catalog.search.search(q, limit=limit, offset=offset)
+    return TimedORJSONResponse(await products_in_order(storage, ids, fields))
+
+@api_router.get("/products/facets", response_model=FacetedProducts)
+async def filter_products(
+    category: List[str] = Query([]),
+    brand: List[str] = Query([]),
+    price: List[str] = Query([], description="Price ranges in BRL, min-max (max excluded) or min+, e.g. "
+                                             "500-1000 or 5000+; repeat to OR several"),
+    in_stock: Optional[bool] = None,
+    limit: int = Query(20, ge=1, le=PAGE_SIZE_MAX),
+    offset: int = Query(0, ge=0),
+    fields: Optional[Tuple[str, ...]] = Depends(product_fieldset),
+    storage: Storage = Depends(get_storage),
+    catalog: Catalog = Depends(get_catalog),
+):
+    filters = {"category": category, "brand": brand, "price": price}
+    if in_stock is not None:
+        filters["in_stock"] = ["true" if in_stock else "false"]
+    try:
+        ids, total, facets = catalog.facets.query(filters, limit=limit, offset=offset)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    items = await products_in_order(storage, ids, fields)
+    return TimedORJSONResponse({"items": items, "total": total, "facets": facets})
 
 @api_router.get("/products/{product_id}", response_model=Product)
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id})
-    if not product:
+async def get_product(
+    product_id: str,
+    request: Request,
+    fields: Optional[Tuple[str, ...]] = Depends(product_fieldset),
+    storage: Storage = Depends(get_storage),
+):
+    async def build():
+        product = await storage.products.get(product_id, fields)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return orjson.dumps((product_shape.only(fields) if fields else product_shape)(product)), {}
+
+    return await cached_json(request, build)
+
+@api_router.get("/products/{product_id}/related", response_model=List[Product])
+async def get_related_products(
+    product_id: str,
+    limit: int = Query(10, ge=1, le=RELATED_TOP_K),
+    fields: Optional[Tuple[str, ...]] = Depends(product_fieldset),
+    storage: Storage = Depends(get_storage),
+):
+    """Products most often bought together with this one, from the precomputed co-purchase list."""
+    related = await storage.related.top(product_id)
+    if not related and not await storage.products.get(product_id, ["id"]):
         raise HTTPException(status_code=404, detail="Product not found")
-    return Product(**product)
+    ids = [entry["product_id"] for entry in related[:limit]]
+    return TimedORJSONResponse(await products_in_order(storage, ids, fields))
 
 @api_router.post("/products", response_model=Product)
-async def create_product(product: ProductCreate):
+async def create_product(
+    product: ProductCreate,
+    storage: Storage = Depends(get_storage),
+    catalog: Catalog = Depends(get_catalog),
+):
     product_dict = product.dict()
     product_obj = Product(**product_dict)
-    await db.products.insert_one(product_obj.dict())
+    try:
+        await storage.products.insert(product_obj.dict())
+    except DuplicateProduct:
+        raise HTTPException(status_code=409, detail="A product with this SKU already exists")
+    catalog.add(product_obj.dict())
     return product_obj
 
+@api_router.post("/products/import", response_model=ImportJob)
+async def import_products(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(ndjson|csv)$"),
+    job_id: Optional[str] = Query(None, max_length=64),
+    storage: Storage = Depends(get_storage),
+    catalog: Catalog = Depends(get_catalog),
+):
+    """Bulk upsert products by SKU from an NDJSON or CSV upload.
+
+    The file is the raw request body or the file part of a multipart form.
+    Rows are validated and written batch by batch as the upload streams in,
+    so memory use does not grow with the file. Progress is saved after every
+    batch and can be followed at GET /api/products/import/{job_id}.
+    """
+    content_type = request.headers.get("content-type", "")
+    chunks = request.stream()
+    filename = None
+    if content_type.startswith("multipart/form-data"):
+        try:
+            chunks, part = await multipart_file(chunks, content_type)
+        except ImportFormatError as error:
+            raise HTTPException(status_code=400, detail=str(error))
+        filename, content_type = part["filename"], part["content_type"]
+    fmt = format or detect_format(content_type, filename)
+    if fmt is None:
+        raise HTTPException(status_code=400, detail="Unknown upload format; pass format=ndjson or format=csv")
+
+    job = ImportJob(format=fmt, **({"id": job_id} if job_id else {})).dict()
+    if not await storage.imports.create(job):
+        raise HTTPException(status_code=409, detail="An import with this job_id already exists")
+
+    def fail(row_number: int, sku, errors: List[str]):
+        job["failed"] += 1
+        if len(job["errors"]) < IMPORT_MAX_ERRORS:
+            job["errors"].append({"row": row_number, "sku": sku, "errors": errors})
+
+    batch = {}
+
+    async def flush():
+        rows = list(batch.values())
+        batch.clear()
+        inserted, updated, failures = await storage.products.upsert_by_sku([row for _, row in rows])
+        job["inserted"] += inserted
+        job["updated"] += updated
+        for index, message in failures.items():
+            fail(rows[index][0], rows[index][1]["sku"], [message])
+        # The indexes catch up through the change feed; listings must not lag here
+        catalog.cache.clear()
+        await storage.imports.save(job)
+
+    records = ndjson_records(chunks) if fmt == "ndjson" else csv_records(chunks)
+    try:
+        async for row_number, record in records:
+            job["rows"] += 1
+            row, errors = validate(record)
+            if errors:
+                fail(row_number, record.get("sku") if isinstance(record, dict) else None, errors)
+                continue
+            # A repeated SKU goes to the next batch so the later row wins
+            if row["sku"] in batch or len(batch) >= IMPORT_BATCH_SIZE:
+                await flush()
+            batch[row["sku"]] = (row_number, row)
+        if batch:
+            await flush()
+        job["status"] = "completed"
+    except ImportFormatError as error:
+        job["status"] = "failed"
+        raise HTTPException(status_code=400, detail=str(error))
+    except Exception:
+        job["status"] = "failed"
+        raise
+    finally:
+        job["finished_at"] = datetime.now(timezone.utc)
+        await storage.imports.save(job)
+    logger.info("Import %s: %d rows, %d inserted, %d updated, %d failed",
+                job["id"], job["rows"], job["inserted"], job["updated"], job["failed"])
+    return TimedORJSONResponse(job)
+
+@api_router.get("/products/import/{job_id}", response_model=ImportJob)
+async def get_import(job_id: str, storage: Storage = Depends(get_storage)):
+    job = await storage.imports.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Import not found")
+    return TimedORJSONResponse(job)
+
 # Cart endpoints
+def cart_session(request: Request, response: Response) -> str:
+    """Resolve the caller's cart token, issuing a new one when missing."""
+    token = request.headers.get(CART_TOKEN_HEADER) or request.cookies.get(CART_TOKEN_COOKIE)
+    if token and len(token) > 64:
+        raise HTTPException(status_code=400, detail="Invalid cart token")
+    if not token:
+        token = str(uuid.uuid4())
+    response.headers[CART_TOKEN_HEADER] = token
+    response.set_cookie(CART_TOKEN_COOKIE, token, max_age=CART_TTL_SECONDS, httponly=True, samesite="lax")
+    return token
+
 @api_router.get("/cart", response_model=List[CartItem])
-async def get_cart():
-    cart_items = await db.cart.find().to_list(1000)
-    return [CartItem(**item) for item in cart_items]
+async def get_cart(
+    response: Response,
+    session_id: str = Depends(cart_session),
+    storage: Storage = Depends(get_storage),
+):
+    cart_items = await storage.cart.lines(session_id)
+    return carry_headers(TimedORJSONResponse([cart_item_shape(item) for item in cart_items]), response)
+
+@api_router.get("/cart/details", response_model=CartDetails)
+async def get_cart_details(
+    response: Response,
+    session_id: str = Depends(cart_session),
+    storage: Storage = Depends(get_storage),
+):
+    lines = []
+    for line, product in await storage.cart.lines_with_products(session_id):
+        lines.append({
+            **cart_item_shape(line),
+            "product": product_shape(product) if product else None,
+            "line_total": round(product["price"] * line["quantity"], 2) if product else 0.0,
+        })
+    return carry_headers(TimedORJSONResponse({
+        "items": lines,
+        "total": round(sum(line["line_total"] for line in lines), 2),
+        "item_count": sum(line["quantity"] for line in lines),
+    }), response)
 
 @api_router.post("/cart", response_model=CartItem)
-async def add_to_cart(item: CartItemCreate):
-    # Check if item already exists in cart
-    existing_item = await db.cart.find_one({"product_id": item.product_id})
-    if existing_item:
-        # Update quantity
-        new_quantity = existing_item["quantity"] + item.quantity
-        await db.cart.update_one(
-            {"product_id": item.product_id},
-            {"$set": {"quantity": new_quantity}}
-        )
-        updated_item = await db.cart.find_one({"product_id": item.product_id})
-        return CartItem(**updated_item)
-    else:
-        # Add new item
-        cart_item_dict = item.dict()
-        cart_item_obj = CartItem(**cart_item_dict)
-        await db.cart.insert_one(cart_item_obj.dict())
-        return cart_item_obj
+async def add_to_cart(
+    item: CartItemCreate,
+    request: Request,
+    response: Response,
+    session_id: str = Depends(cart_session),
+    storage: Storage = Depends(get_storage),
+):
+    async def add():
+        cart_item = await storage.cart.add(session_id, item.product_id, item.quantity)
+        return CartItem(**cart_item)
+
+    return await idempotent(request, response, session_id, add)
+
+@api_router.post("/cart/items", response_model=List[CartItem])
+async def add_many_to_cart(
+    items: List[CartItemCreate],
+    request: Request,
+    response: Response,
+    session_id: str = Depends(cart_session),
+    storage: Storage = Depends(get_storage),
+):
+    quantities = Counter()
+    for item in items:
+        quantities[item.product_id] += item.quantity
+
+    async def add():
+        cart_items = await storage.cart.add_many(session_id, dict(quantities))
+        return [CartItem(**cart_item) for cart_item in cart_items]
+
+    return await idempotent(request, response, session_id, add)
 
 @api_router.put("/cart/{item_id}")
-async def update_cart_item(item_id: str, quantity: int):
-    await db.cart.update_one(
-        {"id": item_id},
-        {"$set": {"quantity": quantity}}
-    )
+async def update_cart_item(
+    item_id: str,
+    quantity: int,
+    session_id: str = Depends(cart_session),
+    storage: Storage = Depends(get_storage),
+):
+    await storage.cart.set_quantity(session_id, item_id, quantity)
     return {"message": "Cart updated"}
 
 @api_router.delete("/cart/{item_id}")
-async def remove_from_cart(item_id: str):
-    await db.cart.delete_one({"id": item_id})
+async def remove_from_cart(
+    item_id: str,
+    session_id: str = Depends(cart_session),
+    storage: Storage = Depends(get_storage),
+):
+    await storage.cart.remove(session_id, item_id)
     return {"message": "Item removed from cart"}
 
 @api_router.delete("/cart")
-async def clear_cart():
-    await db.cart.delete_many({})
+async def clear_cart(session_id: str = Depends(cart_session), storage: Storage = Depends(get_storage)):
+    await storage.cart.clear(session_id)
     return {"message": "Cart cleared"}
 
 # Order endpoints
+async def price_order(storage: Storage, items: List[OrderItemCreate]):
+    """Resolve every line against the catalog with one $in query.
+
+    Returns the priced order lines, the total and the stock reservations
+    needed for products whose stock is tracked.
+    """
+    quantities = Counter()
+    for item in items:
+        quantities[item.product_id] += item.quantity
+    products = await storage.products.get_many(list(quantities))
+    by_id = {product["id"]: product for product in products}
+
+    missing = [product_id for product_id in quantities if product_id not in by_id]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Unknown products: {', '.join(missing)}")
+    unavailable = [product_id for product_id in quantities if not by_id[product_id].get("in_stock", True)]
+    if unavailable:
+        raise HTTPException(status_code=409, detail=f"Out of stock: {', '.join(unavailable)}")
+
+    lines = []
+    reservations = []
+    for product_id, quantity in quantities.items():
+        product = by_id[product_id]
+        lines.append({
+            "product_id": product_id,
+            "product_name": product["name"],
+            "category": product["category"],
+            "brand": product["brand"],
+            "quantity": quantity,
+            "price": product["price"],
+            "line_total": round(product["price"] * quantity, 2),
+        })
+        if product.get("stock") is not None:
+            reservations.append((product_id, quantity))
+    total = round(sum(line["line_total"] for line in lines), 2)
+    return lines, total, reservations
+
 @api_router.post("/orders", response_model=Order)
-async def create_order(order: OrderCreate):
-    order_dict = order.dict()
-    order_obj = Order(**order_dict)
-    await db.orders.insert_one(order_obj.dict())
-    return order_obj
+async def create_order(
+    order: OrderCreate,
+    request: Request,
+    response: Response,
+    storage: Storage = Depends(get_storage),
+):
+    async def place():
+        lines, total, reservations = await price_order(storage, order.items)
+        order_obj = Order(
+            customer_name=order.customer_name,
+            customer_email=order.customer_email,
+            customer_phone=order.customer_phone,
+            items=lines,
+            item_count=sum(line["quantity"] for line in lines),
+            total_amount=total,
+        )
+        try:
+            await storage.orders.create(order_obj.dict(), reservations)
+        except InsufficientStock as error:
+            raise HTTPException(status_code=409, detail=str(error))
+        await apply_sales(storage, order_deltas(order_obj.dict()))
+        request.app.state.related_updater.submit(basket(order_obj.dict()))
+        return order_obj
+
+    return await idempotent(request, response, "", place)
+
+@api_router.get("/orders", response_model=List[OrderSummary])
+async def list_orders(
+    customer_email: Optional[str] = None,
+    status: Optional[str] = None,
+    limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX),
+    after: Optional[str] = None,
+    storage: Storage = Depends(get_storage),
+):
+    """Order summaries, newest first; line items come from /orders/{id}/items."""
+    position = decode_cursor(after) if after else None
+    orders = await storage.orders.page(customer_email, status, position, limit + 1)
+    headers = {}
+    if len(orders) > limit:
+        orders = orders[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(orders[-1])
+    return TimedORJSONResponse([order_summary_shape(order) for order in orders], headers=headers)
+
+@api_router.get("/orders/export")
+async def export_orders(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    after_created_at: Optional[datetime] = None,
+    after_id: Optional[str] = None,
+    compress: bool = True,
+    storage: Storage = Depends(get_storage),
+):
+    """Every order created between `start` and `end` (inclusive UTC days), oldest first.
+
+    Streamed straight from the cursor, so memory stays flat whatever the
+    range. CSV has one row per order line; NDJSON one object per order. An
+    interrupted download resumes with the `created_at` and id of the last
+    complete order as `after_created_at` / `after_id`.
+    """
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    after = (after_created_at, after_id or "") if after_created_at else None
+    orders = storage.orders.export(*export_range(start, end), after, EXPORT_BATCH_SIZE)
+
+    async def body():
+        if format == "csv":
+            yield csv_header()
+        async for chunk, _, _ in export_batches(orders, format, EXPORT_BATCH_SIZE):
+            yield chunk
+
+    filename = f"orders-{start or 'all'}-{end or 'now'}.{format}" + (".gz" if compress else "")
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        gzip_stream(body()) if compress else body(),
+        media_type="application/gzip" if compress else media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@api_router.get("/orders/{order_id}/items", response_model=List[dict])
+async def get_order_items(order_id: str, storage: Storage = Depends(get_storage)):
+    items = await storage.orders.items(order_id)
+    if items is None:
+        raise HTTPException(status_code=404, detail="Order not found")
+    return TimedORJSONResponse(items)
+
+async def apply_sales(storage: Storage, deltas: List[dict]):
+    """Update the sales rollups for an order that is already stored.
+
+    Never fails the request: the order is written and its idempotent
+    response must stand, so a failed update is only logged and left for
+    backfill_rollups.py to repair.
+    """
+    try:
+        await storage.sales.apply(deltas)
+    except Exception:
+        logger.exception("Sales rollup update failed; run backfill_rollups.py to repair")
+
+async def change_order_status(storage: Storage, order_id: str, status: str,
+                              from_statuses: Optional[List[str]] = None) -> dict:
+    """Set an order's status, moving it into or out of the sales rollups.
+
+    With `from_statuses`, an order in any other status is left alone and
+    the change answers 409.
+    """
+    previous = await storage.orders.set_status(order_id, status, from_statuses)
+    if previous is None:
+        current = await storage.orders.get(order_id) if from_statuses is not None else None
+        if current is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        raise HTTPException(status_code=409, detail=f"An order cannot go from {current['status']} to {status}")
+    sign = status_sign(previous["status"], status)
+    if sign:
+        await apply_sales(storage, order_deltas(previous, sign))
+    return {**previous, "status": status}
+
+def require_admin(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    authorization = request.headers.get("authorization", "")
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {ADMIN_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token", headers={"WWW-Authenticate": "Bearer"})
+
+@api_router.put("/orders/{order_id}/status", response_model=Order, dependencies=[Depends(require_admin)])
+async def update_order_status(order_id: str, update: OrderStatusUpdate, storage: Storage = Depends(get_storage)):
+    allowed = [status for status, targets in ORDER_TRANSITIONS.items() if update.status in targets]
+    order = await change_order_status(storage, order_id, update.status, allowed)
+    return TimedORJSONResponse(order_shape(order))
 
 @api_router.get("/orders/{order_id}", response_model=Order)
-async def get_order(order_id: str):
-    order = await db.orders.find_one({"id": order_id})
+async def get_order(order_id: str, storage: Storage = Depends(get_storage)):
+    order = await storage.orders.get(order_id)
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
-    return Order(**order)
+    return TimedORJSONResponse(order_shape(order))
+
+# Reports
+@api_router.get("/reports/sales")
+async def sales_report(
+    group_by: str = Query("day", pattern="^(day|category|brand)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    storage: Storage = Depends(get_storage),
+):
+    """Revenue, orders and units from the daily rollups, defaulting to the last 30 days.
+
+    Reads at most one bucket per day and dimension value, independently of
+    how many orders there are.
+    """
+    end = end or datetime.now(timezone.utc).date()
+    start = start or end - timedelta(days=29)
+    if start > end or (end - start).days >= REPORT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must span 1 to {REPORT_MAX_DAYS} days")
+    totals = await storage.sales.buckets("total", start.isoformat(), end.isoformat())
+    if group_by == "day":
+        rows = sum_buckets(totals, "day")
+    else:
+        rows = sum_buckets(await storage.sales.buckets(group_by, start.isoformat(), end.isoformat()), group_by)
+    overall = sum_buckets(totals, "total")
+    return TimedORJSONResponse({
+        "group_by": group_by,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "rows": rows,
+        "totals": overall[0] if overall else {"key": "all", "revenue": 0, "orders": 0, "units": 0},
+    })
 
-# PayPal integration endpoints (placeholder for demo)
+# PayPal integration endpoints
 @api_router.post("/paypal/create-order")
-async def create_paypal_order(order_data: dict):
-    # This would integrate with PayPal SDK in production
-    # For demo, we'll just return a mock response
-    return {
-        "id": f"PAYPAL_{uuid.uuid4()}",
-        "status": "CREATED",
-        "links": [
-            {
-                "href": "https://www.sandbox.paypal.com/checkoutnow?token=DEMO_TOKEN",
-                "rel": "approve",
-                "method": "GET"
-            }
-        ]
-    }
+async def create_paypal_order(order_data: dict, request: Request, storage: Storage = Depends(get_storage)):
+    paypal = request.app.state.paypal
+    if paypal is None:
+        # Demo mode: no PayPal credentials configured
+        return {
+            "id": f"PAYPAL_{uuid.uuid4()}",
+            "status": "CREATED",
+            "links": [
+                {
+                    "href": "https://www.sandbox.paypal.com/checkoutnow?token=DEMO_TOKEN",
+                    "rel": "approve",
+                    "method": "GET"
+                }
+            ]
+        }
+
+    order_id = order_data.get("order_id")
+    if not order_id:
+        raise HTTPException(status_code=400, detail="order_id is required")
+    order = await storage.orders.get(order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    # The amount always comes from the stored order, never from the client
+    try:
+        paypal_order = await paypal.create_order(order["total_amount"], PAYPAL_CURRENCY, order_id)
+    except (PayPalError, httpx.HTTPError) as error:
+        logger.warning("PayPal order creation for %s failed: %s", order_id, error)
+        raise HTTPException(status_code=502, detail="Payment provider unavailable")
+    await storage.orders.attach_payment(order_id, paypal_order["id"])
+    return paypal_order
 
 @api_router.post("/paypal/capture-order/{order_id}")
-async def capture_paypal_order(order_id: str):
-    # This would capture the PayPal payment in production
-    # For demo, we'll just return success
-    return {
-        "id": order_id,
-        "status": "COMPLETED",
-        "payment_source": {
-            "paypal": {}
+async def capture_paypal_order(order_id: str, request: Request, storage: Storage = Depends(get_storage)):
+    """Queue the capture of an approved PayPal order; `order_id` is PayPal's id.
+
+    The order's status moves to "capturing" and then to "paid" or
+    "payment_failed" once the capture worker hears back from PayPal.
+    """
+    if request.app.state.paypal is None:
+        # Demo mode: report an immediate capture
+        return {
+            "id": order_id,
+            "status": "COMPLETED",
+            "payment_source": {
+                "paypal": {}
+            }
         }
-    }
+
+    order = await storage.orders.get_by_payment(order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Order not found")
+    status = order["status"]
+    if status in ("pending", "payment_failed"):
+        await change_order_status(storage, order["id"], "capturing")
+        request.app.state.capture_worker.submit(order["id"], order_id)
+        status = "capturing"
+    return TimedORJSONResponse({"id": order_id, "order_id": order["id"], "status": status}, status_code=202)
+
+async def resume_captures(storage: Storage, worker: CaptureWorker):
+    """Resubmit captures left in flight by a previous process."""
+    position = None
+    while True:
+        orders = await storage.orders.page(None, "capturing", position, PAGE_SIZE_MAX)
+        for summary in orders:
+            order = await storage.orders.get(summary["id"])
+            if order and order.get("paypal_order_id"):
+                worker.submit(order["id"], order["paypal_order_id"])
+        if len(orders) < PAGE_SIZE_MAX:
+            return
+        position = (orders[-1]["created_at"], orders[-1]["id"])
 
 # Initialize sample data
 @api_router.post("/init-data")
-async def initialize_sample_data():
+async def initialize_sample_data(
+    mode: str = Query("sample", pattern="^(sample|synthetic)$"),
+    products: int = Query(10_000, ge=1, le=SYNTHETIC_MAX_RECORDS),
+    carts: int = Query(1_000, ge=0, le=SYNTHETIC_MAX_RECORDS),
+    orders: int = Query(10_000, ge=0, le=SYNTHETIC_MAX_RECORDS),
+    seed: int = 42,
+    storage: Storage = Depends(get_storage),
+    catalog: Catalog = Depends(get_catalog),
+):
+    """Seed an empty store with six sample products.
+
+    mode=synthetic generates a deterministic catalog of `products` plus carts
+    and orders instead; generate_data.py does the same from the command line.
+    """
     # Check if data already exists
-    existing_products = await db.products.count_documents({})
+    existing_products = await storage.products.count()
     if existing_products > 0:
         return {"message": "Sample data already exists"}
+
+    if mode == "synthetic":
+        summary = await generate(storage, seed, products, carts, orders, SYNTHETIC_BATCH_SIZE, SYNTHETIC_WORKERS,
+                                 top_k=RELATED_TOP_K)
+        return {"message": "Synthetic data generated", **summary}
     
     sample_products = [
         {
@@ -302,27 +996,97 @@ async def initialize_sample_data():
         }
     ]
     
-    await db.products.insert_many(sample_products)
+    await storage.products.insert_many(sample_products)
+    catalog.rebuild(sorted(sample_products, key=lambda product: (product["created_at"], product["id"])))
     return {"message": "Sample data initialized"}
 
-# Include the router in the main app
-app.include_router(api_router)
+# Diagnostics
+@api_router.get("/diagnostics/query-plans")
+async def check_query_plans(storage: Storage = Depends(get_storage)):
+    results = await storage.query_plans(PAGE_SIZE_DEFAULT)
+    regressions = [result["route"] for result in results if result["collscan"]]
+    if regressions:
+        logger.warning("COLLSCAN detected for routes: %s", ", ".join(regressions))
+    return {"ok": not regressions, "routes": results}
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    storage = app.state.storage
+    await storage.start()
+    catalog_ready = asyncio.Event()
+    follower = asyncio.create_task(app.state.catalog.follow(storage, catalog_ready))
+    await catalog_ready.wait()
+    related_updater = app.state.related_updater = RelatedUpdater(storage.related, RELATED_TOP_K)
+    related_updater.start()
+
+    paypal = app.state.paypal
+    if paypal is not None:
+        async def record_capture(order_id: str, status: str):
+            await change_order_status(storage, order_id, status)
+
+        worker = app.state.capture_worker = CaptureWorker(paypal, record_capture, concurrency=PAYPAL_CAPTURE_WORKERS)
+        worker.start()
+        await resume_captures(storage, worker)
+    yield
+    if paypal is not None:
+        await app.state.capture_worker.stop()
+        await paypal.http.aclose()
+    await related_updater.stop()
+    follower.cancel()
+    await asyncio.gather(follower, return_exceptions=True)
+    await storage.close()
+
+def create_app(storage: Optional[Storage] = None, paypal: Optional[PayPalClient] = None) -> FastAPI:
+    """Build the API around `storage` and `paypal`, defaulting to the ones configured by env."""
+    # Create the main app without a prefix
+    app = FastAPI(default_response_class=TimedORJSONResponse, lifespan=lifespan)
+    app.state.storage = storage or storage_from_env()
+    if SERVER_TIMING:
+        app.state.storage = TimedStorage(app.state.storage)
+    app.state.paypal = paypal or paypal_from_env()
+    app.state.catalog = Catalog()
+    app.state.idempotency = IdempotencyGuard(app.state.storage.idempotency, wait_seconds=IDEMPOTENCY_WAIT_SECONDS)
+
+    # Include the router in the main app
+    app.include_router(api_router)
+    app.add_api_route("/metrics", metrics, methods=["GET"], include_in_schema=False)
+
+    # Innermost, so that profiles only cover admitted requests
+    if PROFILE_TOKEN or PROFILE_SAMPLE_RATE > 0:
+        app.add_middleware(
+            ProfilingMiddleware,
+            directory=PROFILE_DIR,
+            sample_rate=PROFILE_SAMPLE_RATE,
+            token=PROFILE_TOKEN,
+        )
+
+    # Inside CORS so that rejections still carry the CORS headers
+    app.add_middleware(
+        AdmissionMiddleware,
+        rate=ADMISSION_RATE,
+        burst=ADMISSION_BURST,
+        max_concurrent=ADMISSION_MAX_CONCURRENT,
+        max_queue=ADMISSION_MAX_QUEUE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+        priority_prefixes=CHECKOUT_PREFIXES,
+    )
+
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESS_MIN_SIZE)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag", CART_TOKEN_HEADER, "Idempotent-Replayed", "Retry-After",
+                        "Server-Timing", "X-Profile-Report"],
+    )
+
+    app.add_middleware(MetricsMiddleware)
+    return app
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+app = create_app()
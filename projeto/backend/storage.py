@@ -0,0 +1,1452 @@
+import abc
+import uuid
+import bisect
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+from typing import AsyncIterator, Collection, Dict, Iterable, List, Optional, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import IndexModel, ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure, BulkWriteError, DuplicateKeyError
+
+from models import ProductImportRow, TrustedShape, product_shape, cart_item_shape, order_shape, order_summary_shape
+from related import pair_counts, top_related
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_SORT = [("created_at", 1), ("id", 1)]
+# Order listings show the newest first
+ORDER_SORT = [("created_at", -1), ("id", -1)]
+# Exports run oldest first, so a (created_at, id) watermark can resume them;
+# the listing indexes serve this order scanned backwards
+ORDER_EXPORT_SORT = [("created_at", 1), ("id", 1)]
+# Summary fields not already in a listing index's filter or sort keys
+ORDER_SUMMARY_KEYS = [("total_amount", 1), ("item_count", 1)]
+
+# Co-purchase lists: most bought-together first, ties by id
+RELATED_SORT = [("count", -1), ("other_id", 1)]
+
+# Keyset position in the product listing: (created_at, id)
+Cursor = Tuple[datetime, str]
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product_id: str):
+        super().__init__(f"Insufficient stock for product {product_id}")
+        self.product_id = product_id
+
+
+class DuplicateProduct(Exception):
+    """A product with the same id or SKU already exists."""
+
+
+class ProductRepository(abc.ABC):
+    @abc.abstractmethod
+    async def page(self, category: Optional[str], after: Optional[Cursor], limit: int,
+                   fields: Optional[Iterable[str]] = None) -> List[dict]:
+        """Products in listing order, starting after the keyset cursor.
+
+        Product reads return every Product field, or only `fields` (a sparse
+        fieldset) which are then the only ones read from the database.
+        """
+
+    @abc.abstractmethod
+    def stream(self, category: Optional[str], after: Optional[Cursor], limit: Optional[int],
+               batch_size: int, fields: Optional[Iterable[str]] = None) -> AsyncIterator[dict]:
+        """Like `page`, but yields documents without materialising the result."""
+
+    @abc.abstractmethod
+    async def get(self, product_id: str, fields: Optional[Iterable[str]] = None) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def get_many(self, product_ids: List[str], fields: Optional[Iterable[str]] = None) -> List[dict]:
+        """Products for the given ids, in no particular order; unknown ids are skipped."""
+
+    @abc.abstractmethod
+    async def insert(self, product: dict):
+        ...
+
+    @abc.abstractmethod
+    async def insert_many(self, products: List[dict]):
+        ...
+
+    @abc.abstractmethod
+    async def bulk_insert(self, products: List[dict]):
+        """Unordered insert for bulk loads, without a change event per product.
+
+        Call announce_reload() once the load is done.
+        """
+
+    @abc.abstractmethod
+    async def announce_reload(self):
+        """Have every catalog follower reload all products."""
+
+    @abc.abstractmethod
+    async def count(self) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def upsert_by_sku(self, rows: List[dict]) -> Tuple[int, int, Dict[int, str]]:
+        """Create or update products by SKU, one batch at a time.
+
+        New products get an id and created_at. Returns (inserted, updated,
+        {row index: error}) for rows the database refused.
+        """
+
+    @abc.abstractmethod
+    def changes(self, poll_interval: float) -> AsyncIterator[dict]:
+        """Follow writes to the catalog made by any process.
+
+        Yields {"op": "ready"} once following has started, when the caller
+        should (re)load the catalog: anything written afterwards will be
+        seen. Then {"op": "upsert", "product": {...}} per change, or
+        {"op": "reload"} when changes may have been missed.
+        """
+
+
+class CartRepository(abc.ABC):
+    @abc.abstractmethod
+    async def lines(self, session_id: str) -> List[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def lines_with_products(self, session_id: str) -> List[Tuple[dict, Optional[dict]]]:
+        """Cart lines joined to their product, None when the product is gone."""
+
+    @abc.abstractmethod
+    async def add(self, session_id: str, product_id: str, quantity: int) -> dict:
+        """Atomically add `quantity` to a line, creating it if needed."""
+
+    @abc.abstractmethod
+    async def add_many(self, session_id: str, quantities: Dict[str, int]) -> List[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def set_quantity(self, session_id: str, item_id: str, quantity: int):
+        ...
+
+    @abc.abstractmethod
+    async def remove(self, session_id: str, item_id: str):
+        ...
+
+    @abc.abstractmethod
+    async def clear(self, session_id: str):
+        ...
+
+    @abc.abstractmethod
+    async def bulk_insert(self, lines: List[dict]):
+        """Unordered insert of complete cart lines (bulk loads)."""
+
+
+class OrderRepository(abc.ABC):
+    @abc.abstractmethod
+    async def create(self, order: dict, reservations: List[Tuple[str, int]]):
+        """Reserve stock and insert the order atomically.
+
+        Raises InsufficientStock, with nothing reserved, when a line cannot
+        be served.
+        """
+
+    @abc.abstractmethod
+    async def bulk_insert(self, orders: List[dict]):
+        """Unordered insert of complete orders (bulk loads).
+
+        Stock is not reserved, and sales rollups and co-purchase data are
+        left to the caller.
+        """
+
+    @abc.abstractmethod
+    async def get(self, order_id: str) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def page(self, customer_email: Optional[str], status: Optional[str], before: Optional[Cursor],
+                   limit: int) -> List[dict]:
+        """Order summaries, newest first, starting before the keyset cursor."""
+
+    @abc.abstractmethod
+    async def items(self, order_id: str) -> Optional[List[dict]]:
+        """Line items of one order, None when the order does not exist."""
+
+    @abc.abstractmethod
+    async def set_status(self, order_id: str, status: str,
+                         from_statuses: Optional[Collection[str]] = None) -> Optional[dict]:
+        """Update an order's status and return the order as it was before.
+
+        With `from_statuses`, only an order currently in one of them is
+        changed; None means the order is missing or in another status.
+        """
+
+    @abc.abstractmethod
+    def stream(self, batch_size: int) -> AsyncIterator[dict]:
+        """Every order, in no particular order."""
+
+    @abc.abstractmethod
+    def export(self, start: Optional[datetime], end: Optional[datetime], after: Optional[Cursor],
+               batch_size: int) -> AsyncIterator[dict]:
+        """Orders created in [start, end), oldest first, resuming past `after`."""
+
+    @abc.abstractmethod
+    async def attach_payment(self, order_id: str, paypal_order_id: str) -> bool:
+        """Record the PayPal order paying for an order; False when the order does not exist."""
+
+    @abc.abstractmethod
+    async def get_by_payment(self, paypal_order_id: str) -> Optional[dict]:
+        ...
+
+
+class SalesRepository(abc.ABC):
+    """Pre-aggregated daily sales buckets, one per (day, dimension, value)."""
+
+    @abc.abstractmethod
+    async def apply(self, deltas: List[dict]):
+        """Add each delta's revenue/orders/units to its bucket, creating it if needed."""
+
+    @abc.abstractmethod
+    async def buckets(self, dimension: str, start: str, end: str) -> List[dict]:
+        """Buckets of one dimension for the days in [start, end] (ISO dates)."""
+
+    @abc.abstractmethod
+    async def replace(self, buckets: List[dict]):
+        """Swap every bucket for a freshly computed set (backfill).
+
+        Updates applied while the new set is being written are lost with the
+        old one.
+        """
+
+
+class RelatedRepository(abc.ABC):
+    """Co-purchase counts per product pair, and each product's top list built from them."""
+
+    @abc.abstractmethod
+    async def apply(self, baskets: List[List[str]], top_k: int):
+        """Count one more order per basket of product ids and refresh the affected top lists."""
+
+    @abc.abstractmethod
+    async def top(self, product_id: str) -> List[dict]:
+        """The stored list: {"product_id", "count"} entries, most bought-together first."""
+
+    @abc.abstractmethod
+    async def replace(self, counts: List[dict], top: Dict[str, List[dict]]):
+        """Swap every count and list for a freshly computed set (rebuild)."""
+
+
+class ImportRepository(abc.ABC):
+    @abc.abstractmethod
+    async def create(self, job: dict) -> bool:
+        """Store a new job; False when a job with its id already exists."""
+
+    @abc.abstractmethod
+    async def save(self, job: dict):
+        ...
+
+    @abc.abstractmethod
+    async def get(self, job_id: str) -> Optional[dict]:
+        ...
+
+
+class IdempotencyRepository(abc.ABC):
+    """Responses of mutating requests, keyed by their Idempotency-Key.
+
+    A record is "pending" while its first request runs and "done" once the
+    response is stored. Pending records hold a lock that the running request
+    keeps renewing; it expires only when that stops, so a key left behind by
+    a crashed worker can be claimed again.
+    """
+
+    @abc.abstractmethod
+    async def claim(self, key: str, fingerprint: str, lock_seconds: float) -> Optional[dict]:
+        """Mark `key` pending for the caller.
+
+        Returns None when the caller now owns the key, or the existing
+        record when another request got there first.
+        """
+
+    @abc.abstractmethod
+    async def get(self, key: str) -> Optional[dict]:
+        ...
+
+    @abc.abstractmethod
+    async def renew(self, key: str, lock_seconds: float):
+        """Extend the lock on a pending key whose request is still running."""
+
+    @abc.abstractmethod
+    async def complete(self, key: str, status_code: int, body: bytes):
+        ...
+
+    @abc.abstractmethod
+    async def release(self, key: str):
+        """Forget a pending key so a retry can run the request again."""
+
+
+class Storage(abc.ABC):
+    products: ProductRepository
+    cart: CartRepository
+    orders: OrderRepository
+    sales: SalesRepository
+    related: RelatedRepository
+    imports: ImportRepository
+    idempotency: IdempotencyRepository
+
+    async def start(self):
+        """Prepare the backend (indexes, connections) before serving."""
+
+    async def close(self):
+        ...
+
+    @abc.abstractmethod
+    async def query_plans(self, limit: int) -> List[dict]:
+        """Access path of every route's query, flagging full scans."""
+
+
+# MongoDB backend
+
+def plan_stages(plan: dict) -> List[str]:
+    """Flatten the stage names of an explain() winning plan."""
+    stages = [plan["stage"]] if "stage" in plan else []
+    children = plan.get("inputStages", [])
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            children = children + [plan[key]]
+    for child in children:
+        stages.extend(plan_stages(child))
+    return stages
+
+
+def import_defaults(row: dict) -> dict:
+    """Defaults for the fields an imported row leaves out, set only when it creates the product."""
+    return {
+        name: field.get_default(call_default_factory=True)
+        for name, field in ProductImportRow.model_fields.items()
+        if not field.is_required() and name not in row
+    }
+
+
+def product_fields(fields: Optional[Iterable[str]]) -> TrustedShape:
+    """The product shape for a sparse fieldset, or the full one."""
+    return product_shape if fields is None else product_shape.only(fields)
+
+
+def product_filter(category: Optional[str], after: Optional[Cursor]) -> dict:
+    query = {"category": category} if category is not None else {}
+    if after:
+        created_at, doc_id = after
+        query = {"$and": [query, {"$or": [
+            {"created_at": {"$gt": created_at}},
+            {"created_at": created_at, "id": {"$gt": doc_id}},
+        ]}]}
+    return query
+
+
+def order_filter(customer_email: Optional[str], status: Optional[str], before: Optional[Cursor]) -> dict:
+    query = {}
+    if customer_email:
+        query["customer_email"] = customer_email
+    if status:
+        query["status"] = status
+    if before:
+        created_at, order_id = before
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": order_id}},
+        ]
+    return query
+
+
+def export_filter(start: Optional[datetime], end: Optional[datetime], after: Optional[Cursor]) -> dict:
+    query = {}
+    if start or end:
+        query["created_at"] = {}
+        if start:
+            query["created_at"]["$gte"] = start
+        if end:
+            query["created_at"]["$lt"] = end
+    if after:
+        created_at, order_id = after
+        query["$or"] = [
+            {"created_at": {"$gt": created_at}},
+            {"created_at": created_at, "id": {"$gt": order_id}},
+        ]
+    return query
+
+
+def cart_increment(quantity: int) -> dict:
+    """Update document adding `quantity` to a cart line, creating it if needed."""
+    now = datetime.now(timezone.utc)
+    return {
+        "$inc": {"quantity": quantity},
+        "$set": {"updated_at": now},
+        "$setOnInsert": {
+            "id": str(uuid.uuid4()),
+            "added_at": now,
+        },
+    }
+
+
+# Change stream events that can alter what the catalog shows; updates
+# whose only change is `stock` (every order) are left to the cache TTL, but
+# one that also sets price, name or anything else goes through
+PRODUCT_CHANGES_PIPELINE = [
+    {"$match": {"$or": [
+        {"operationType": {"$in": ["insert", "replace", "delete", "drop", "invalidate"]}},
+        {"operationType": "update", "$expr": {"$or": [
+            {"$ne": [
+                {"$map": {"input": {"$objectToArray": "$updateDescription.updatedFields"}, "in": "$$this.k"}},
+                ["stock"],
+            ]},
+            {"$gt": [{"$size": {"$ifNull": ["$updateDescription.removedFields", []]}}, 0]},
+        ]}},
+    ]}},
+]
+# Server errors meaning change streams need a replica set
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324, 115}
+
+
+class MotorProducts(ProductRepository):
+    """Products collection.
+
+    When change streams are unavailable (standalone mongod), writers also
+    bump a version counter and log the changed ids, which `changes` polls.
+    """
+
+    def __init__(self, db):
+        self.collection = db.products
+        self.counters = db.counters
+        self.change_log = db.product_changes
+        self.log_changes = False
+        self._resume_token = None
+
+    def _find(self, category, after, fields):
+        return self.collection.find(
+            product_filter(category, after), product_fields(fields).projection
+        ).sort(PRODUCT_SORT)
+
+    async def page(self, category, after, limit, fields=None):
+        return await self._find(category, after, fields).limit(limit).to_list(limit)
+
+    async def stream(self, category, after, limit, batch_size, fields=None):
+        cursor = self._find(category, after, fields).batch_size(batch_size)
+        if limit:
+            cursor = cursor.limit(limit)
+        async for product in cursor:
+            yield product
+
+    async def get(self, product_id, fields=None):
+        return await self.collection.find_one({"id": product_id}, product_fields(fields).projection)
+
+    async def get_many(self, product_ids, fields=None):
+        if not product_ids:
+            return []
+        return await self.collection.find(
+            {"id": {"$in": list(product_ids)}}, product_fields(fields).projection
+        ).to_list(len(product_ids))
+
+    async def insert(self, product):
+        try:
+            await self.collection.insert_one(dict(product))
+        except DuplicateKeyError as error:
+            raise DuplicateProduct(str(error))
+        await self.record_changes([product["id"]])
+
+    async def insert_many(self, products):
+        await self.collection.insert_many([dict(product) for product in products])
+        await self.record_changes([product["id"] for product in products])
+
+    async def bulk_insert(self, products):
+        await self.collection.insert_many([dict(product) for product in products], ordered=False)
+
+    async def announce_reload(self):
+        # Change stream followers already saw every insert
+        await self.record_changes([None], op="reload")
+
+    async def count(self):
+        return await self.collection.count_documents({})
+
+    async def upsert_by_sku(self, rows):
+        if not rows:
+            return 0, 0, {}
+        now = datetime.now(timezone.utc)
+        ops = [
+            UpdateOne(
+                {"sku": row["sku"]},
+                {"$set": row, "$setOnInsert": {**import_defaults(row), "id": str(uuid.uuid4()), "created_at": now}},
+                upsert=True,
+            )
+            for row in rows
+        ]
+        failures = {}
+        try:
+            result = (await self.collection.bulk_write(ops, ordered=False)).bulk_api_result
+        except BulkWriteError as error:
+            result = error.details
+            failures = {write_error["index"]: write_error["errmsg"] for write_error in result["writeErrors"]}
+        if self.log_changes:
+            written = [row["sku"] for index, row in enumerate(rows) if index not in failures]
+            products = await self.collection.find({"sku": {"$in": written}}, {"_id": 0, "id": 1}).to_list(None)
+            await self.record_changes([product["id"] for product in products])
+        return result["nUpserted"], result["nMatched"], failures
+
+    async def record_changes(self, product_ids: List[str], op: str = "upsert"):
+        if not self.log_changes or not product_ids:
+            return
+        counter = await self.counters.find_one_and_update(
+            {"_id": "products"},
+            {"$inc": {"seq": len(product_ids)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        first = counter["seq"] - len(product_ids) + 1
+        now = datetime.now(timezone.utc)
+        await self.change_log.insert_many(
+            [{"seq": first + index, "id": product_id, "op": op, "at": now} for index, product_id in enumerate(product_ids)],
+            ordered=False,
+        )
+
+    async def changes(self, poll_interval):
+        if not self.log_changes:
+            try:
+                async for event in self._watch():
+                    yield event
+                return
+            except OperationFailure as error:
+                if error.code not in CHANGE_STREAMS_UNSUPPORTED:
+                    raise
+                logger.warning("Change streams unavailable (%s); polling the product version counter", error)
+                self.log_changes = True
+        async for event in self._poll(poll_interval):
+            yield event
+
+    async def _watch(self):
+        resuming = self._resume_token is not None
+        try:
+            stream = self.collection.watch(PRODUCT_CHANGES_PIPELINE, full_document="updateLookup",
+                                           resume_after=self._resume_token)
+            await stream.__aenter__()
+        except OperationFailure:
+            # Most likely the resume point fell off the oplog; start over
+            self._resume_token = None
+            raise
+        try:
+            # Resuming replays what was missed, so only a fresh stream needs a load
+            if not resuming:
+                yield {"op": "ready"}
+            async for change in stream:
+                self._resume_token = stream.resume_token
+                operation = change["operationType"]
+                if operation == "invalidate":
+                    # The stream is over; the caller reconnects and reloads
+                    self._resume_token = None
+                    return
+                if operation in ("delete", "drop"):
+                    # Deletes only carry the _id; they are rare enough to reload
+                    yield {"op": "reload"}
+                    continue
+                document = change.get("fullDocument")
+                if document is None:
+                    continue  # deleted again before the lookup
+                yield {"op": "upsert", "product": product_shape.select(document)}
+        finally:
+            await stream.close()
+
+    async def _poll(self, poll_interval, gap_timeout: float = 10.0):
+        counter = await self.counters.find_one({"_id": "products"})
+        seen = counter["seq"] if counter else 0
+        yield {"op": "ready"}
+        loop = asyncio.get_running_loop()
+        gap_since = None
+        while True:
+            await asyncio.sleep(poll_interval)
+            counter = await self.counters.find_one({"_id": "products"})
+            latest = counter["seq"] if counter else 0
+            if latest <= seen:
+                continue
+            entries = await self.change_log.find(
+                {"seq": {"$gt": seen, "$lte": latest}}, {"_id": 0, "seq": 1, "id": 1, "op": 1}
+            ).sort("seq", 1).to_list(None)
+            # Apply the contiguous run; a hole is a writer between its two writes
+            run = []
+            for entry in entries:
+                if entry["seq"] != seen + len(run) + 1:
+                    break
+                run.append(entry)
+            if run:
+                seen += len(run)
+                gap_since = None
+                if any(entry.get("op") == "reload" for entry in run):
+                    yield {"op": "reload"}
+                else:
+                    for product in await self.get_many([entry["id"] for entry in run]):
+                        yield {"op": "upsert", "product": product}
+            if seen < latest:
+                gap_since = gap_since or loop.time()
+                if loop.time() - gap_since > gap_timeout:
+                    # Log entries expired or a writer died midway
+                    seen, gap_since = latest, None
+                    yield {"op": "reload"}
+
+
+class MotorCart(CartRepository):
+    def __init__(self, db):
+        self.collection = db.cart
+
+    async def lines(self, session_id):
+        return await self.collection.find({"session_id": session_id}, cart_item_shape.projection).to_list(1000)
+
+    async def lines_with_products(self, session_id):
+        # Join each line to its product in one aggregation instead of N lookups
+        pipeline = [
+            {"$match": {"session_id": session_id}},
+            {"$lookup": {
+                "from": "products",
+                "localField": "product_id",
+                "foreignField": "id",
+                "as": "product",
+            }},
+            {"$unwind": {"path": "$product", "preserveNullAndEmptyArrays": True}},
+            {"$project": {
+                **cart_item_shape.projection,
+                **{f"product.{name}": 1 for name in product_shape.template},
+            }},
+        ]
+        joined = []
+        async for line in self.collection.aggregate(pipeline):
+            product = line.pop("product", None)
+            joined.append((line, product))
+        return joined
+
+    async def add(self, session_id, product_id, quantity):
+        # Single atomic upsert: increments an existing line or creates it
+        return await self.collection.find_one_and_update(
+            {"session_id": session_id, "product_id": product_id},
+            cart_increment(quantity),
+            projection=cart_item_shape.projection,
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def add_many(self, session_id, quantities):
+        if not quantities:
+            return []
+        await self.collection.bulk_write(
+            [
+                UpdateOne({"session_id": session_id, "product_id": product_id}, cart_increment(quantity), upsert=True)
+                for product_id, quantity in quantities.items()
+            ],
+            ordered=False,
+        )
+        return await self.collection.find(
+            {"session_id": session_id, "product_id": {"$in": list(quantities)}}, cart_item_shape.projection
+        ).to_list(len(quantities))
+
+    async def set_quantity(self, session_id, item_id, quantity):
+        await self.collection.update_one(
+            {"id": item_id, "session_id": session_id},
+            {"$set": {"quantity": quantity, "updated_at": datetime.now(timezone.utc)}}
+        )
+
+    async def remove(self, session_id, item_id):
+        await self.collection.delete_one({"id": item_id, "session_id": session_id})
+
+    async def clear(self, session_id):
+        await self.collection.delete_many({"session_id": session_id})
+
+    async def bulk_insert(self, lines):
+        await self.collection.insert_many([dict(line) for line in lines], ordered=False)
+
+
+class MotorOrders(OrderRepository):
+    def __init__(self, storage: "MotorStorage"):
+        self.storage = storage
+        self.collection = storage.db.orders
+        self.products = storage.db.products
+
+    async def reserve_stock(self, reservations, session=None):
+        """Decrement stock for every reservation, all or nothing.
+
+        Each line is a conditional $inc that only matches while enough stock
+        is left. Lines run concurrently, or one after another inside a
+        transaction, whose session cannot be shared. A line that matched
+        nothing is either short of stock or no longer tracks it; one read
+        tells them apart. On a shortage the lines already taken are put back,
+        or the transaction aborts.
+        """
+        if not reservations:
+            return
+
+        async def take(product_id, quantity):
+            result = await self.products.update_one(
+                {"id": product_id, "stock": {"$gte": quantity}}, {"$inc": {"stock": -quantity}}, session=session,
+            )
+            return result.matched_count == 1
+
+        if session is None:
+            results = await asyncio.gather(*(take(*line) for line in reservations), return_exceptions=True)
+        else:
+            results = [await take(*line) for line in reservations]
+        taken = [line for line, result in zip(reservations, results) if result is True]
+        errors = [result for result in results if isinstance(result, BaseException)]
+        missed = [product_id for (product_id, _), result in zip(reservations, results) if result is False]
+        short = []
+        if missed and not errors:
+            untracked = await self.products.find(
+                {"id": {"$in": missed}, "stock": None}, {"_id": 0, "id": 1}, session=session,
+            ).to_list(None)
+            short = sorted(set(missed) - {product["id"] for product in untracked})
+        if errors or short:
+            if session is None:
+                await self.release_stock(taken)
+            if errors:
+                raise errors[0]
+            raise InsufficientStock(short[0])
+
+    async def release_stock(self, reservations):
+        if reservations:
+            await self.products.bulk_write(
+                [UpdateOne({"id": product_id}, {"$inc": {"stock": quantity}}) for product_id, quantity in reservations],
+                ordered=False,
+            )
+
+    async def create(self, order, reservations):
+        if await self.storage.transactions_supported():
+            async with await self.storage.client.start_session() as session:
+                async with session.start_transaction():
+                    await self.reserve_stock(reservations, session=session)
+                    await self.collection.insert_one(dict(order), session=session)
+        else:
+            await self.reserve_stock(reservations)
+            try:
+                await self.collection.insert_one(dict(order))
+            except Exception:
+                await self.release_stock(reservations)
+                raise
+
+    async def bulk_insert(self, orders):
+        await self.collection.insert_many([dict(order) for order in orders], ordered=False)
+
+    async def get(self, order_id):
+        return await self.collection.find_one({"id": order_id}, order_shape.projection)
+
+    async def page(self, customer_email, status, before, limit):
+        # Every filtered and projected field is in the index, so this is a
+        # covered query that never touches the order documents
+        return await self.collection.find(
+            order_filter(customer_email, status, before), order_summary_shape.projection
+        ).sort(ORDER_SORT).limit(limit).to_list(limit)
+
+    async def items(self, order_id):
+        order = await self.collection.find_one({"id": order_id}, {"_id": 0, "items": 1})
+        return order["items"] if order else None
+
+    async def set_status(self, order_id, status, from_statuses=None):
+        query = {"id": order_id}
+        if from_statuses is not None:
+            query["status"] = {"$in": list(from_statuses)}
+        return await self.collection.find_one_and_update(
+            query,
+            {"$set": {"status": status}},
+            projection=order_shape.projection,
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    async def stream(self, batch_size):
+        async for order in self.collection.find({}, order_shape.projection).batch_size(batch_size):
+            yield order
+
+    async def export(self, start, end, after, batch_size):
+        cursor = self.collection.find(export_filter(start, end, after), order_shape.projection)
+        async for order in cursor.sort(ORDER_EXPORT_SORT).batch_size(batch_size):
+            yield order
+
+    async def attach_payment(self, order_id, paypal_order_id):
+        result = await self.collection.update_one({"id": order_id}, {"$set": {"paypal_order_id": paypal_order_id}})
+        return result.matched_count == 1
+
+    async def get_by_payment(self, paypal_order_id):
+        return await self.collection.find_one({"paypal_order_id": paypal_order_id}, order_shape.projection)
+
+
+class MotorSales(SalesRepository):
+    def __init__(self, db, indexes: List[IndexModel]):
+        self.collection = db.sales_rollups
+        self.indexes = indexes
+
+    async def apply(self, deltas):
+        if not deltas:
+            return
+        await self.collection.bulk_write(
+            [
+                UpdateOne(
+                    {"dimension": delta["dimension"], "day": delta["day"], "value": delta["value"]},
+                    {"$inc": {"revenue": delta["revenue"], "orders": delta["orders"], "units": delta["units"]}},
+                    upsert=True,
+                )
+                for delta in deltas
+            ],
+            ordered=False,
+        )
+
+    async def buckets(self, dimension, start, end):
+        return await self.collection.find(
+            {"dimension": dimension, "day": {"$gte": start, "$lte": end}}, {"_id": 0}
+        ).to_list(None)
+
+    async def replace(self, buckets):
+        # Built aside and renamed over the live collection in one step, so
+        # reports never see it empty or half filled
+        staging = self.collection.database[self.collection.name + "_rebuild"]
+        await staging.drop()
+        await staging.create_indexes(self.indexes)
+        if buckets:
+            await staging.insert_many([dict(bucket) for bucket in buckets], ordered=False)
+        await staging.rename(self.collection.name, dropTarget=True)
+
+
+class MotorRelated(RelatedRepository):
+    def __init__(self, db):
+        self.counts = db.co_purchases
+        self.lists = db.related_products
+
+    async def _top(self, product_id, top_k):
+        counts = await self.counts.find(
+            {"product_id": product_id}, {"_id": 0, "other_id": 1, "count": 1}
+        ).sort(RELATED_SORT).limit(top_k).to_list(None)
+        return [{"product_id": count["other_id"], "count": count["count"]} for count in counts]
+
+    async def apply(self, baskets, top_k):
+        pairs = pair_counts(baskets)
+        if not pairs:
+            return
+        await self.counts.bulk_write(
+            [UpdateOne({"product_id": product_id, "other_id": other}, {"$inc": {"count": count}}, upsert=True)
+             for (product_id, other), count in pairs.items()],
+            ordered=False,
+        )
+        product_ids = list(dict.fromkeys(product_id for product_id, _ in pairs))
+        # Each list is read back off the (product_id, count) index, K entries deep
+        tops = await asyncio.gather(*(self._top(product_id, top_k) for product_id in product_ids))
+        await self.lists.bulk_write(
+            [UpdateOne({"product_id": product_id}, {"$set": {"related": related}}, upsert=True)
+             for product_id, related in zip(product_ids, tops)],
+            ordered=False,
+        )
+
+    async def top(self, product_id):
+        doc = await self.lists.find_one({"product_id": product_id}, {"_id": 0, "related": 1})
+        return doc["related"] if doc else []
+
+    async def replace(self, counts, top):
+        await self.counts.delete_many({})
+        await self.lists.delete_many({})
+        if counts:
+            await self.counts.insert_many([dict(count) for count in counts], ordered=False)
+        if top:
+            await self.lists.insert_many(
+                [{"product_id": product_id, "related": related} for product_id, related in top.items()],
+                ordered=False,
+            )
+
+
+class MotorIdempotency(IdempotencyRepository):
+    def __init__(self, db):
+        self.collection = db.idempotency_keys
+
+    async def claim(self, key, fingerprint, lock_seconds):
+        now = datetime.now(timezone.utc)
+        locked_until = now + timedelta(seconds=lock_seconds)
+        try:
+            await self.collection.insert_one({
+                "key": key,
+                "fingerprint": fingerprint,
+                "state": "pending",
+                "locked_until": locked_until,
+                "created_at": now,
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+        # Take over a pending key whose owner stopped renewing it
+        stolen = await self.collection.find_one_and_update(
+            {"key": key, "state": "pending", "fingerprint": fingerprint, "locked_until": {"$lt": now}},
+            {"$set": {"locked_until": locked_until}},
+        )
+        if stolen is not None:
+            return None
+        return await self.get(key)
+
+    async def get(self, key):
+        return await self.collection.find_one({"key": key}, {"_id": 0})
+
+    async def renew(self, key, lock_seconds):
+        await self.collection.update_one(
+            {"key": key, "state": "pending"},
+            {"$set": {"locked_until": datetime.now(timezone.utc) + timedelta(seconds=lock_seconds)}},
+        )
+
+    async def complete(self, key, status_code, body):
+        await self.collection.update_one(
+            {"key": key},
+            {"$set": {"state": "done", "status_code": status_code, "body": body}},
+        )
+
+    async def release(self, key):
+        await self.collection.delete_one({"key": key, "state": "pending"})
+
+
+class MotorImports(ImportRepository):
+    def __init__(self, db):
+        self.collection = db.imports
+
+    async def create(self, job):
+        try:
+            await self.collection.insert_one(dict(job))
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def save(self, job):
+        await self.collection.replace_one({"id": job["id"]}, dict(job), upsert=True)
+
+    async def get(self, job_id):
+        return await self.collection.find_one({"id": job_id}, {"_id": 0})
+
+
+class MotorStorage(Storage):
+    def __init__(self, mongo_url: str, db_name: str, cart_ttl_seconds: int, event_listeners=(),
+                 idempotency_ttl_seconds: int = 24 * 3600):
+        self.client = AsyncIOMotorClient(mongo_url, event_listeners=list(event_listeners))
+        self.db = self.client[db_name]
+        self._transactions_supported: Optional[bool] = None
+
+        # Index declarations, applied idempotently at startup
+        self.indexes = {
+            "products": [
+                IndexModel([("id", 1)], unique=True),
+                IndexModel(PRODUCT_SORT),
+                IndexModel([("category", 1)] + PRODUCT_SORT),
+                IndexModel([("sku", 1)], unique=True, partialFilterExpression={"sku": {"$type": "string"}}),
+            ],
+            "cart": [
+                IndexModel([("id", 1)], unique=True),
+                # Unique so concurrent upserts for one product collapse into one line
+                IndexModel([("session_id", 1), ("product_id", 1)], unique=True),
+                IndexModel([("updated_at", 1)], expireAfterSeconds=cart_ttl_seconds),
+            ],
+            "orders": [
+                IndexModel([("id", 1)], unique=True),
+                # Covering indexes for the order listing: filter keys, then the
+                # sort, then the remaining summary fields
+                IndexModel([("customer_email", 1)] + ORDER_SORT + [("status", 1)] + ORDER_SUMMARY_KEYS),
+                IndexModel([("status", 1)] + ORDER_SORT + [("customer_email", 1)] + ORDER_SUMMARY_KEYS),
+                IndexModel(ORDER_SORT + [("customer_email", 1), ("status", 1)] + ORDER_SUMMARY_KEYS),
+                # Most orders have no PayPal order yet and stay out of this index
+                IndexModel([("paypal_order_id", 1)], partialFilterExpression={"paypal_order_id": {"$type": "string"}}),
+            ],
+            "sales_rollups": [
+                IndexModel([("dimension", 1), ("day", 1), ("value", 1)], unique=True),
+            ],
+            "co_purchases": [
+                IndexModel([("product_id", 1), ("other_id", 1)], unique=True),
+                IndexModel([("product_id", 1)] + RELATED_SORT),
+            ],
+            "related_products": [
+                IndexModel([("product_id", 1)], unique=True),
+            ],
+            "imports": [
+                IndexModel([("id", 1)], unique=True),
+            ],
+            "product_changes": [
+                IndexModel([("seq", 1)], unique=True),
+                IndexModel([("at", 1)], expireAfterSeconds=24 * 3600),
+            ],
+            "idempotency_keys": [
+                IndexModel([("key", 1)], unique=True),
+                IndexModel([("created_at", 1)], expireAfterSeconds=idempotency_ttl_seconds),
+            ],
+        }
+        # Indexes from earlier layouts that would now get in the way
+        self.legacy_indexes = {
+            "cart": ["product_id_1"],
+        }
+        # Representative query of every route, checked by query_plans()
+        self.route_queries = [
+            ("GET /api/products", "products", {}, PRODUCT_SORT),
+            ("GET /api/products/category/{category}", "products", {"category": "geladeira"}, PRODUCT_SORT),
+            ("GET /api/products/{product_id}", "products", {"id": "probe"}, None),
+            ("GET /api/cart", "cart", {"session_id": "probe"}, None),
+            ("POST /api/cart", "cart", {"session_id": "probe", "product_id": "probe"}, None),
+            ("PUT /api/cart/{item_id}", "cart", {"id": "probe", "session_id": "probe"}, None),
+            ("DELETE /api/cart/{item_id}", "cart", {"id": "probe", "session_id": "probe"}, None),
+            ("GET /api/orders/{order_id}", "orders", {"id": "probe"}, None),
+            ("GET /api/orders?customer_email=", "orders", {"customer_email": "probe"}, ORDER_SORT),
+            ("GET /api/orders?status=", "orders", {"status": "probe"}, ORDER_SORT),
+            ("GET /api/orders", "orders", {}, ORDER_SORT),
+            ("GET /api/orders/export", "orders", {"created_at": {"$gte": "probe"}}, ORDER_EXPORT_SORT),
+            ("POST /api/paypal/capture-order/{paypal_order_id}", "orders", {"paypal_order_id": "probe"}, None),
+            ("GET /api/products/{product_id}/related", "related_products", {"product_id": "probe"}, None),
+            ("GET /api/reports/sales", "sales_rollups", {"dimension": "total", "day": {"$gte": "probe"}}, None),
+            ("Idempotency-Key", "idempotency_keys", {"key": "probe"}, None),
+        ]
+
+        self.products = MotorProducts(self.db)
+        self.cart = MotorCart(self.db)
+        self.orders = MotorOrders(self)
+        self.sales = MotorSales(self.db, self.indexes["sales_rollups"])
+        self.related = MotorRelated(self.db)
+        self.imports = MotorImports(self.db)
+        self.idempotency = MotorIdempotency(self.db)
+
+    async def start(self):
+        for collection, names in self.legacy_indexes.items():
+            for name in names:
+                try:
+                    await self.db[collection].drop_index(name)
+                except OperationFailure:
+                    pass  # already gone
+        # create_indexes is a no-op for indexes that already exist
+        for collection, indexes in self.indexes.items():
+            await self.db[collection].create_indexes(indexes)
+        # Change streams need the same topology as transactions
+        self.products.log_changes = not await self.transactions_supported()
+
+    async def close(self):
+        self.client.close()
+
+    async def transactions_supported(self) -> bool:
+        """Multi-document transactions need a replica set or a mongos router."""
+        if self._transactions_supported is None:
+            hello = await self.client.admin.command("hello")
+            self._transactions_supported = "setName" in hello or hello.get("msg") == "isdbgrid"
+        return self._transactions_supported
+
+    async def query_plans(self, limit):
+        results = []
+        for route, collection, query, sort in self.route_queries:
+            cursor = self.db[collection].find(query)
+            if sort:
+                cursor = cursor.sort(sort)
+            explain = await cursor.limit(limit).explain()
+            stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+            results.append({
+                "route": route,
+                "collection": collection,
+                "stages": stages,
+                "collscan": "COLLSCAN" in stages,
+            })
+        return results
+
+
+# In-memory backend
+
+def naive_utc(value: datetime) -> datetime:
+    """Store datetimes the way MongoDB hands them back: naive, in UTC."""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+class MemoryProducts(ProductRepository):
+    """Products keyed by id, with sorted (created_at, id) keys per listing."""
+
+    def __init__(self):
+        self._by_id: Dict[str, dict] = {}
+        self._order: List[Cursor] = []
+        self._by_category: Dict[str, List[Cursor]] = {}
+        self._by_sku: Dict[str, str] = {}
+        self._subscribers: List[asyncio.Queue] = []
+
+    def _keys(self, category, after) -> List[Cursor]:
+        keys = self._order if category is None else self._by_category.get(category, [])
+        if after:
+            keys = keys[bisect.bisect_right(keys, (naive_utc(after[0]), after[1])):]
+        return keys
+
+    async def page(self, category, after, limit, fields=None):
+        shape = product_fields(fields)
+        return [shape.select(self._by_id[key[1]]) for key in self._keys(category, after)[:limit]]
+
+    async def stream(self, category, after, limit, batch_size, fields=None):
+        shape = product_fields(fields)
+        keys = self._keys(category, after)
+        for key in keys[:limit] if limit else keys:
+            product = self._by_id.get(key[1])
+            if product is not None:
+                yield shape.select(product)
+
+    async def get(self, product_id, fields=None):
+        product = self._by_id.get(product_id)
+        return product_fields(fields).select(product) if product else None
+
+    async def get_many(self, product_ids, fields=None):
+        shape = product_fields(fields)
+        return [shape.select(self._by_id[product_id]) for product_id in product_ids if product_id in self._by_id]
+
+    async def insert(self, product):
+        self._publish(self._insert(product))
+
+    def _insert(self, product: dict) -> dict:
+        if product["id"] in self._by_id:
+            raise DuplicateProduct(f"Duplicate product id {product['id']}")
+        if product.get("sku") and product["sku"] in self._by_sku:
+            raise DuplicateProduct(f"Duplicate SKU {product['sku']}")
+        product = {**product, "created_at": naive_utc(product["created_at"])}
+        self._by_id[product["id"]] = product
+        key = (product["created_at"], product["id"])
+        bisect.insort(self._order, key)
+        bisect.insort(self._by_category.setdefault(product["category"], []), key)
+        if product.get("sku"):
+            self._by_sku[product["sku"]] = product["id"]
+        return product
+
+    def _publish(self, product: dict):
+        for queue in self._subscribers:
+            queue.put_nowait({"op": "upsert", "product": product_shape.select(product)})
+
+    async def upsert_by_sku(self, rows):
+        inserted = updated = 0
+        for row in rows:
+            product_id = self._by_sku.get(row["sku"])
+            if product_id is None:
+                await self.insert({
+                    **import_defaults(row), **row, "id": str(uuid.uuid4()), "created_at": datetime.now(timezone.utc),
+                })
+                inserted += 1
+                continue
+            product = self._by_id[product_id]
+            if row["category"] != product["category"]:
+                key = (product["created_at"], product_id)
+                self._by_category[product["category"]].remove(key)
+                bisect.insort(self._by_category.setdefault(row["category"], []), key)
+            product.update(row)
+            self._publish(product)
+            updated += 1
+        return inserted, updated, {}
+
+    async def insert_many(self, products):
+        for product in products:
+            await self.insert(product)
+
+    async def bulk_insert(self, products):
+        for product in products:
+            self._insert(product)
+
+    async def announce_reload(self):
+        for queue in self._subscribers:
+            queue.put_nowait({"op": "reload"})
+
+    async def count(self):
+        return len(self._by_id)
+
+    async def changes(self, poll_interval):
+        # Only this process can write, so writes are pushed to subscribers
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        try:
+            yield {"op": "ready"}
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers.remove(queue)
+
+    def reserve(self, reservations) -> None:
+        # Check every line first; nothing awaits in between, so this is atomic
+        taken = []
+        for product_id, quantity in reservations:
+            product = self._by_id.get(product_id)
+            if product is None:
+                raise InsufficientStock(product_id)
+            # Stock may have stopped being tracked since the order was priced
+            if product.get("stock") is None:
+                continue
+            if product["stock"] < quantity:
+                raise InsufficientStock(product_id)
+            taken.append((product, quantity))
+        for product, quantity in taken:
+            product["stock"] -= quantity
+
+
+class MemoryCart(CartRepository):
+    """Cart lines keyed by (session, product) with lazy TTL expiry."""
+
+    def __init__(self, products: MemoryProducts, ttl_seconds: int):
+        self.products = products
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._sessions: Dict[str, Dict[str, dict]] = {}
+        self._by_id: Dict[str, dict] = {}
+
+    def _session(self, session_id) -> Dict[str, dict]:
+        lines = self._sessions.get(session_id, {})
+        expired_before = naive_utc(datetime.now(timezone.utc)) - self.ttl
+        for product_id, line in list(lines.items()):
+            if line["updated_at"] < expired_before:
+                del lines[product_id]
+                del self._by_id[line["id"]]
+        return lines
+
+    async def lines(self, session_id):
+        return [cart_item_shape.select(line) for line in self._session(session_id).values()]
+
+    async def lines_with_products(self, session_id):
+        return [
+            (cart_item_shape.select(line), await self.products.get(line["product_id"]))
+            for line in self._session(session_id).values()
+        ]
+
+    def _add(self, session_id, product_id, quantity) -> dict:
+        now = naive_utc(datetime.now(timezone.utc))
+        lines = self._session(session_id)
+        line = lines.get(product_id)
+        if line is None:
+            line = {"id": str(uuid.uuid4()), "session_id": session_id, "product_id": product_id,
+                    "quantity": 0, "added_at": now}
+            lines[product_id] = line
+            self._sessions[session_id] = lines
+            self._by_id[line["id"]] = line
+        line["quantity"] += quantity
+        line["updated_at"] = now
+        return cart_item_shape.select(line)
+
+    async def add(self, session_id, product_id, quantity):
+        return self._add(session_id, product_id, quantity)
+
+    async def add_many(self, session_id, quantities):
+        return [self._add(session_id, product_id, quantity) for product_id, quantity in quantities.items()]
+
+    async def set_quantity(self, session_id, item_id, quantity):
+        line = self._by_id.get(item_id)
+        if line is not None and line["session_id"] == session_id:
+            line["quantity"] = quantity
+            line["updated_at"] = naive_utc(datetime.now(timezone.utc))
+
+    async def remove(self, session_id, item_id):
+        line = self._by_id.get(item_id)
+        if line is not None and line["session_id"] == session_id:
+            del self._by_id[item_id]
+            del self._sessions[session_id][line["product_id"]]
+
+    async def clear(self, session_id):
+        for line in self._sessions.pop(session_id, {}).values():
+            del self._by_id[line["id"]]
+
+    async def bulk_insert(self, lines):
+        for line in lines:
+            line = {**line, "added_at": naive_utc(line["added_at"]), "updated_at": naive_utc(line["updated_at"])}
+            self._sessions.setdefault(line["session_id"], {})[line["product_id"]] = line
+            self._by_id[line["id"]] = line
+
+
+class MemoryOrders(OrderRepository):
+    """Orders keyed by id, with sorted (created_at, id) keys per customer and status."""
+
+    def __init__(self, products: MemoryProducts):
+        self.products = products
+        self._by_id: Dict[str, dict] = {}
+        self._order: List[Cursor] = []
+        self._by_customer: Dict[str, List[Cursor]] = {}
+        self._by_status: Dict[str, List[Cursor]] = {}
+        self._by_payment: Dict[str, str] = {}
+
+    async def create(self, order, reservations):
+        self.products.reserve(reservations)
+        order = {**order, "created_at": naive_utc(order["created_at"])}
+        self._by_id[order["id"]] = order
+        key = (order["created_at"], order["id"])
+        bisect.insort(self._order, key)
+        bisect.insort(self._by_customer.setdefault(order["customer_email"], []), key)
+        bisect.insort(self._by_status.setdefault(order["status"], []), key)
+        if order.get("paypal_order_id"):
+            self._by_payment[order["paypal_order_id"]] = order["id"]
+
+    async def bulk_insert(self, orders):
+        for order in orders:
+            await self.create(order, [])
+
+    async def get(self, order_id):
+        order = self._by_id.get(order_id)
+        return order_shape.select(order) if order else None
+
+    async def page(self, customer_email, status, before, limit):
+        if customer_email:
+            keys = self._by_customer.get(customer_email, [])
+        elif status:
+            keys = self._by_status.get(status, [])
+        else:
+            keys = self._order
+        end = bisect.bisect_left(keys, (naive_utc(before[0]), before[1])) if before else len(keys)
+        summaries = []
+        for index in range(end - 1, -1, -1):
+            order = self._by_id[keys[index][1]]
+            if status and order["status"] != status:
+                continue
+            summaries.append(order_summary_shape.select(order))
+            if len(summaries) == limit:
+                break
+        return summaries
+
+    async def items(self, order_id):
+        order = self._by_id.get(order_id)
+        return order["items"] if order else None
+
+    async def set_status(self, order_id, status, from_statuses=None):
+        order = self._by_id.get(order_id)
+        if order is None or (from_statuses is not None and order["status"] not in from_statuses):
+            return None
+        before = order_shape.select(order)
+        key = (order["created_at"], order_id)
+        self._by_status[order["status"]].remove(key)
+        bisect.insort(self._by_status.setdefault(status, []), key)
+        order["status"] = status
+        return before
+
+    async def stream(self, batch_size):
+        for order in list(self._by_id.values()):
+            yield order_shape.select(order)
+
+    async def export(self, start, end, after, batch_size):
+        low = bisect.bisect_left(self._order, (naive_utc(start), "")) if start else 0
+        if after:
+            low = max(low, bisect.bisect_right(self._order, (naive_utc(after[0]), after[1])))
+        high = bisect.bisect_left(self._order, (naive_utc(end), "")) if end else len(self._order)
+        for _, order_id in self._order[low:high]:
+            yield order_shape.select(self._by_id[order_id])
+
+    async def attach_payment(self, order_id, paypal_order_id):
+        order = self._by_id.get(order_id)
+        if order is None:
+            return False
+        self._by_payment.pop(order.get("paypal_order_id"), None)
+        order["paypal_order_id"] = paypal_order_id
+        self._by_payment[paypal_order_id] = order_id
+        return True
+
+    async def get_by_payment(self, paypal_order_id):
+        order_id = self._by_payment.get(paypal_order_id)
+        return await self.get(order_id) if order_id else None
+
+
+class MemorySales(SalesRepository):
+    def __init__(self):
+        # dimension -> day -> value -> bucket, so a report touches only its days
+        self._buckets: Dict[str, Dict[str, Dict[str, dict]]] = {}
+
+    async def apply(self, deltas):
+        for delta in deltas:
+            values = self._buckets.setdefault(delta["dimension"], {}).setdefault(delta["day"], {})
+            bucket = values.setdefault(delta["value"], {
+                "dimension": delta["dimension"], "day": delta["day"], "value": delta["value"],
+                "revenue": 0, "orders": 0, "units": 0,
+            })
+            for metric in ("revenue", "orders", "units"):
+                bucket[metric] += delta[metric]
+
+    async def buckets(self, dimension, start, end):
+        days = self._buckets.get(dimension, {})
+        return [
+            dict(bucket)
+            for day in sorted(days) if start <= day <= end
+            for bucket in days[day].values()
+        ]
+
+    async def replace(self, buckets):
+        self._buckets = {}
+        await self.apply(buckets)
+
+
+class MemoryRelated(RelatedRepository):
+    def __init__(self):
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._lists: Dict[str, List[dict]] = {}
+
+    async def apply(self, baskets, top_k):
+        pairs = pair_counts(baskets)
+        for (product_id, other), count in pairs.items():
+            counts = self._counts.setdefault(product_id, {})
+            counts[other] = counts.get(other, 0) + count
+        for product_id in dict.fromkeys(product_id for product_id, _ in pairs):
+            self._lists[product_id] = top_related(self._counts[product_id], top_k)
+
+    async def top(self, product_id):
+        return [dict(entry) for entry in self._lists.get(product_id, [])]
+
+    async def replace(self, counts, top):
+        self._counts = {}
+        for count in counts:
+            self._counts.setdefault(count["product_id"], {})[count["other_id"]] = count["count"]
+        self._lists = {product_id: [dict(entry) for entry in related] for product_id, related in top.items()}
+
+
+class MemoryImports(ImportRepository):
+    def __init__(self):
+        self._jobs: Dict[str, dict] = {}
+
+    async def create(self, job):
+        if job["id"] in self._jobs:
+            return False
+        self._jobs[job["id"]] = dict(job)
+        return True
+
+    async def save(self, job):
+        self._jobs[job["id"]] = dict(job)
+
+    async def get(self, job_id):
+        job = self._jobs.get(job_id)
+        return dict(job) if job else None
+
+
+class MemoryIdempotency(IdempotencyRepository):
+    def __init__(self, ttl_seconds: int):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self._records: Dict[str, dict] = {}
+
+    async def claim(self, key, fingerprint, lock_seconds):
+        now = datetime.now(timezone.utc)
+        record = await self.get(key)
+        if record is None or (record["state"] == "pending" and record["fingerprint"] == fingerprint
+                              and record["locked_until"] < now):
+            self._records[key] = {
+                "key": key,
+                "fingerprint": fingerprint,
+                "state": "pending",
+                "locked_until": now + timedelta(seconds=lock_seconds),
+                "created_at": record["created_at"] if record else now,
+            }
+            return None
+        return dict(record)
+
+    async def get(self, key):
+        record = self._records.get(key)
+        if record is not None and record["created_at"] < datetime.now(timezone.utc) - self.ttl:
+            del self._records[key]
+            record = None
+        return dict(record) if record else None
+
+    async def renew(self, key, lock_seconds):
+        record = self._records.get(key)
+        if record is not None and record["state"] == "pending":
+            record["locked_until"] = datetime.now(timezone.utc) + timedelta(seconds=lock_seconds)
+
+    async def complete(self, key, status_code, body):
+        if key in self._records:
+            self._records[key].update(state="done", status_code=status_code, body=body)
+
+    async def release(self, key):
+        if self._records.get(key, {}).get("state") == "pending":
+            del self._records[key]
+
+
+class MemoryStorage(Storage):
+    """Indexed in-memory engine for tests and for profiling the API layer alone."""
+
+    def __init__(self, cart_ttl_seconds: int = 7 * 24 * 3600, idempotency_ttl_seconds: int = 24 * 3600):
+        self.products = MemoryProducts()
+        self.cart = MemoryCart(self.products, cart_ttl_seconds)
+        self.orders = MemoryOrders(self.products)
+        self.sales = MemorySales()
+        self.related = MemoryRelated()
+        self.imports = MemoryImports()
+        self.idempotency = MemoryIdempotency(idempotency_ttl_seconds)
+
+    async def query_plans(self, limit):
+        # Every lookup goes through a dict or a sorted key list
+        return []
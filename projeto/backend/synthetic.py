@@ -0,0 +1,475 @@
+"""Deterministic synthetic catalog, carts and orders for scale testing.
+
+Every value is a hash of (seed, record index, field), so any record can be
+generated on its own, in any order, by any worker, and always comes out the
+same. Orders rebuild the products they reference from their indexes instead
+of reading them back. Only cart timestamps follow the clock, so the cart
+TTL index does not reap them straight away.
+"""
+import time
+import uuid
+import asyncio
+import functools
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from rollups import counts_as_sale, order_deltas
+from related import count_pairs, related_data
+
+# Generated timestamps end here unless told otherwise
+DEFAULT_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+PRODUCT_SPAN_DAYS = 3 * 365
+ORDER_SPAN_DAYS = 365
+
+PRODUCT, ORDER, CART, CUSTOMER = 1, 2, 3, 4
+
+# weight: share of the catalog; brands: relative share within the category;
+# price: (median, log-normal sigma, floor, ceiling) in BRL; the first spec
+# goes into the product name; optional specs show up on about 40% of products
+CATEGORIES = {
+    "geladeira": {
+        "weight": 12, "noun": "Geladeira",
+        "lines": ["Frost Free", "Duplex", "Inverse", "French Door", "Side by Side"],
+        "brands": {"Brastemp": 30, "Consul": 28, "Electrolux": 22, "Samsung": 10, "LG": 7, "Panasonic": 3},
+        "price": (2800, 0.45, 899, 15999),
+        "specs": {
+            "capacidade": ["260L", "300L", "340L", "400L", "460L", "540L"],
+            "cor": ["Branca", "Inox", "Preta", "Platinum"],
+            "consumo": ["28kWh/mês", "35kWh/mês", "40kWh/mês", "45kWh/mês", "52kWh/mês"],
+            "voltagem": ["110V", "220V"],
+        },
+        "optional": {"dispenser": ["Água", "Água e gelo"], "portas": ["2", "3", "4"]},
+    },
+    "lavadora": {
+        "weight": 10, "noun": "Máquina de Lavar",
+        "lines": ["Essential Care", "Eco Turbo", "Lava e Seca", "Premium Care", "Smart"],
+        "brands": {"Electrolux": 30, "Brastemp": 26, "Consul": 20, "Samsung": 12, "LG": 9, "Midea": 3},
+        "price": (2100, 0.5, 799, 9999),
+        "specs": {
+            "capacidade": ["8kg", "10kg", "11kg", "12kg", "13kg", "15kg", "17kg"],
+            "programas": ["9", "12", "15", "16"],
+            "cor": ["Branca", "Inox", "Titânio"],
+            "voltagem": ["110V", "220V"],
+        },
+        "optional": {"abertura": ["Frontal", "Superior"], "secagem": ["7kg", "8kg", "9kg"]},
+    },
+    "fogao": {
+        "weight": 9, "noun": "Fogão",
+        "lines": ["Mesa de Vidro", "Acendimento Automático", "Turbo Chama", "Home Pro"],
+        "brands": {"Consul": 28, "Brastemp": 24, "Electrolux": 22, "Atlas": 14, "Esmaltec": 8, "Mueller": 4},
+        "price": (1100, 0.5, 399, 6999),
+        "specs": {
+            "bocas": ["4 Bocas", "5 Bocas", "6 Bocas"],
+            "forno": ["Sim", "Sim com Grill", "Autolimpante"],
+            "cor": ["Branco", "Inox", "Preto"],
+            "gas": ["GLP", "Bivolt GLP/GN"],
+        },
+        "optional": {"mesa": ["Vidro temperado", "Inox"], "timer": ["Sim"]},
+    },
+    "cooktop": {
+        "weight": 5, "noun": "Cooktop",
+        "lines": ["Indução", "Gás", "Vitrocerâmico"],
+        "brands": {"Electrolux": 30, "Brastemp": 22, "Fischer": 18, "Philco": 16, "Tramontina": 14},
+        "price": (1300, 0.55, 299, 7999),
+        "specs": {
+            "zonas": ["1", "2", "4", "5"],
+            "controle": ["Touch", "Botões"],
+            "potencia": ["3500W", "5000W", "7000W", "7400W"],
+        },
+        "optional": {"voltagem": ["220V"], "timer": ["Sim"]},
+    },
+    "microondas": {
+        "weight": 8, "noun": "Micro-ondas",
+        "lines": ["Tira Odor", "Grill", "Espelhado", "Inverter"],
+        "brands": {"Electrolux": 28, "Panasonic": 24, "Brastemp": 16, "Philco": 14, "LG": 10, "Midea": 8},
+        "price": (650, 0.35, 349, 3499),
+        "specs": {
+            "capacidade": ["20L", "25L", "30L", "32L", "34L"],
+            "potencia": ["700W", "900W", "1100W", "1400W"],
+            "cor": ["Branco", "Preto", "Inox", "Espelhado"],
+        },
+        "optional": {"receitas": ["10", "15", "30"], "voltagem": ["110V", "220V"]},
+    },
+    "ar_condicionado": {
+        "weight": 9, "noun": "Ar-Condicionado Split",
+        "lines": ["Inverter", "Hi Wall", "Dual Inverter", "Eco Garden"],
+        "brands": {"LG": 24, "Samsung": 20, "Midea": 18, "Gree": 14, "Elgin": 12, "Philco": 8, "Consul": 4},
+        "price": (2600, 0.4, 1299, 9999),
+        "specs": {
+            "capacidade": ["9000 BTUs", "12000 BTUs", "18000 BTUs", "24000 BTUs"],
+            "ciclo": ["Frio", "Quente/Frio"],
+            "voltagem": ["220V"],
+        },
+        "optional": {"wifi": ["Sim"], "selo_procel": ["A", "B"]},
+    },
+    "televisao": {
+        "weight": 14, "noun": "Smart TV",
+        "lines": ["LED", "QLED", "OLED", "Crystal UHD", "NanoCell"],
+        "brands": {"Samsung": 32, "LG": 26, "TCL": 14, "Philco": 10, "Sony": 8, "AOC": 6, "Philips": 4},
+        "price": (2400, 0.7, 799, 29999),
+        "specs": {
+            "tela": ["32\"", "43\"", "50\"", "55\"", "65\"", "75\"", "85\""],
+            "resolucao": ["HD", "Full HD", "4K", "8K"],
+            "sistema": ["Tizen", "webOS", "Google TV", "Roku", "VIDAA"],
+        },
+        "optional": {"hdmi": ["2", "3", "4"], "taxa_atualizacao": ["60Hz", "120Hz", "144Hz"]},
+    },
+    "lava_loucas": {
+        "weight": 4, "noun": "Lava-Louças",
+        "lines": ["Compacta", "Inox", "Smart"],
+        "brands": {"Brastemp": 32, "Electrolux": 30, "Midea": 20, "Samsung": 10, "Philco": 8},
+        "price": (2900, 0.35, 1499, 8999),
+        "specs": {
+            "servicos": ["6", "8", "10", "14"],
+            "programas": ["5", "6", "8"],
+            "cor": ["Inox", "Branca", "Preta"],
+        },
+        "optional": {"voltagem": ["110V", "220V"], "meia_carga": ["Sim"]},
+    },
+    "aspirador": {
+        "weight": 11, "noun": "Aspirador",
+        "lines": ["Vertical", "Robô", "Pó e Água", "Portátil"],
+        "brands": {"Electrolux": 26, "WAP": 22, "Philco": 16, "Mondial": 14, "Britânia": 12, "Xiaomi": 10},
+        "price": (420, 0.7, 89, 4999),
+        "specs": {
+            "potencia": ["600W", "1000W", "1400W", "2000W"],
+            "reservatorio": ["0,5L", "1L", "1,5L", "20L"],
+            "filtro": ["HEPA", "Espuma", "Ciclônico"],
+        },
+        "optional": {"bateria": ["40 min", "60 min", "120 min"], "voltagem": ["110V", "220V"]},
+    },
+    "cafeteira": {
+        "weight": 10, "noun": "Cafeteira",
+        "lines": ["Expresso", "Cápsulas", "Elétrica", "Italiana"],
+        "brands": {"Nespresso": 24, "Dolce Gusto": 22, "Oster": 16, "Mondial": 14, "Britânia": 12, "Philco": 12},
+        "price": (380, 0.6, 79, 3999),
+        "specs": {
+            "pressao": ["15 bar", "19 bar", "20 bar"],
+            "reservatorio": ["0,6L", "0,8L", "1L", "1,2L"],
+            "cor": ["Preta", "Vermelha", "Branca", "Inox"],
+        },
+        "optional": {"voltagem": ["110V", "220V"], "espumador": ["Sim"]},
+    },
+    "liquidificador": {
+        "weight": 8, "noun": "Liquidificador",
+        "lines": ["Turbo", "Power", "Pro", "Mini"],
+        "brands": {"Arno": 26, "Oster": 22, "Mondial": 20, "Philco": 16, "Britânia": 16},
+        "price": (190, 0.5, 59, 1499),
+        "specs": {
+            "potencia": ["500W", "900W", "1200W", "1400W"],
+            "copo": ["Acrílico", "Vidro", "Tritan"],
+            "velocidades": ["3", "5", "12"],
+        },
+        "optional": {"voltagem": ["110V", "220V"], "filtro": ["Sim"]},
+    },
+}
+CATEGORY_NAMES = list(CATEGORIES)
+_CATEGORY_CDF = np.cumsum([CATEGORIES[name]["weight"] for name in CATEGORY_NAMES], dtype=float)
+_CATEGORY_CDF /= _CATEGORY_CDF[-1]
+_PRICES = [CATEGORIES[name]["price"] for name in CATEGORY_NAMES]
+_BRAND_CDFS = {
+    name: np.cumsum(list(spec["brands"].values()), dtype=float) / sum(spec["brands"].values())
+    for name, spec in CATEGORIES.items()
+}
+
+FIRST_NAMES = ["Ana", "Bruno", "Carla", "Diego", "Eduarda", "Felipe", "Gabriela", "Henrique", "Isabela", "João",
+               "Larissa", "Marcos", "Natália", "Otávio", "Paula", "Rafael", "Sofia", "Thiago", "Vitória", "Yuri"]
+LAST_NAMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima", "Gomes",
+              "Costa", "Ribeiro", "Martins", "Carvalho", "Almeida", "Lopes", "Barbosa", "Araújo", "Rocha", "Dias"]
+
+# Order status mix for the past year of orders
+ORDER_STATUSES = ["delivered", "paid", "shipped", "pending", "cancelled", "refunded", "payment_failed"]
+_STATUS_CDF = np.cumsum([0.52, 0.16, 0.12, 0.08, 0.07, 0.03, 0.02])
+
+
+def _mix(x):
+    """splitmix64 finaliser; uint64 arithmetic wraps around on purpose."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class Draws:
+    """Independent pseudo-random streams indexed by record, for one record kind."""
+
+    def __init__(self, seed: int, kind: int, indices: np.ndarray):
+        self.seed = seed % 2 ** 64
+        self.kind = kind
+        self.indices = np.asarray(indices, dtype=np.uint64)
+
+    def bits(self, stream: int) -> np.ndarray:
+        with np.errstate(over="ignore"):
+            key = _mix(np.array([self.seed], dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+                       + np.uint64((self.kind << 16) | stream))
+            return _mix(self.indices * np.uint64(0x9E3779B97F4A7C15) + key)
+
+    def uniform(self, stream: int) -> np.ndarray:
+        return (self.bits(stream) >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+    def choice(self, stream: int, cdf: np.ndarray) -> np.ndarray:
+        return np.minimum(np.searchsorted(cdf, self.uniform(stream), side="right"), len(cdf) - 1)
+
+    def normal(self, stream: int) -> np.ndarray:
+        # Box-Muller over two uniforms
+        radius = np.sqrt(-2.0 * np.log1p(-self.uniform(stream)))
+        return radius * np.cos(2.0 * np.pi * self.uniform(stream + 1))
+
+    def uuids(self, stream: int) -> List[str]:
+        high, low = self.bits(stream), self.bits(stream + 1)
+        return [str(uuid.UUID(int=(int(h) << 64) | int(l), version=4)) for h, l in zip(high, low)]
+
+
+def product_ids(seed: int, indices: np.ndarray) -> List[str]:
+    return Draws(seed, PRODUCT, indices).uuids(0)
+
+
+def popular_products(draws: Draws, stream: int, product_count: int) -> np.ndarray:
+    """Product indexes with Zipf-like popularity, spread over the catalog.
+
+    Popularity rank r comes out with probability ~1/r; a multiplicative
+    permutation turns ranks into indexes so best sellers are not simply
+    the oldest products.
+    """
+    ranks = np.floor(np.exp(draws.uniform(stream) * np.log(product_count + 1))).astype(np.int64) - 1
+    ranks = np.clip(ranks, 0, product_count - 1)
+    step = 2654435761 % product_count or 1
+    while np.gcd(step, product_count) != 1:
+        step += 1
+    return (ranks * step + 7919) % product_count
+
+
+def make_products(seed: int, indices: np.ndarray, epoch: datetime = DEFAULT_EPOCH) -> List[dict]:
+    indices = np.asarray(indices, dtype=np.int64)
+    draws = Draws(seed, PRODUCT, indices)
+    ids = draws.uuids(0)
+    categories = draws.choice(2, _CATEGORY_CDF)
+    brand_u = draws.uniform(3)
+    brands = np.zeros(len(indices), dtype=np.int64)
+    for code, name in enumerate(CATEGORY_NAMES):
+        rows = categories == code
+        brands[rows] = np.minimum(np.searchsorted(_BRAND_CDFS[name], brand_u[rows], side="right"),
+                                  len(_BRAND_CDFS[name]) - 1)
+    median, sigma, low, high = (np.array(values)[categories] for values in zip(*_PRICES))
+    prices = np.floor(np.clip(median * np.exp(sigma * draws.normal(4)), low, high)) + 0.99
+    lines = draws.uniform(6)
+    model_codes = (draws.bits(7) % np.uint64(900) + np.uint64(100)).tolist()
+    tracked = (draws.uniform(8) < 0.3).tolist()
+    stock = np.floor(-np.log1p(-draws.uniform(9)) * 40).astype(np.int64).tolist()
+    available = (draws.uniform(10) < 0.95).tolist()
+    # Skewed towards recent additions
+    ages = (draws.uniform(11) ** 2 * PRODUCT_SPAN_DAYS * 86400).tolist()
+    spec_u = [draws.uniform(20 + number).tolist() for number in range(12)]
+
+    products = []
+    for row, index in enumerate(indices.tolist()):
+        category = CATEGORY_NAMES[categories[row]]
+        spec = CATEGORIES[category]
+        brand = list(spec["brands"])[brands[row]]
+        line = spec["lines"][int(lines[row] * len(spec["lines"]))]
+        specifications = {}
+        for number, (key, values) in enumerate(spec["specs"].items()):
+            specifications[key] = values[int(spec_u[number][row] * len(values))]
+        for number, (key, values) in enumerate(spec["optional"].items()):
+            if spec_u[6 + 2 * number][row] < 0.4:
+                specifications[key] = values[int(spec_u[7 + 2 * number][row] * len(values))]
+        headline = next(iter(specifications.values()))
+        sku = f"SYN{index:09d}"
+        products.append({
+            "id": ids[row],
+            "sku": sku,
+            "name": f"{spec['noun']} {brand} {line} {headline} {brand[:3].upper()}{model_codes[row]}",
+            "description": f"{spec['noun']} {brand} linha {line}, "
+                           + ", ".join(f"{key}: {value}" for key, value in specifications.items()),
+            "price": round(float(prices[row]), 2),
+            "category": category,
+            "brand": brand,
+            "image_url": f"https://picsum.photos/seed/{sku}/600/600",
+            "in_stock": stock[row] > 0 if tracked[row] else available[row],
+            "stock": stock[row] if tracked[row] else None,
+            "specifications": specifications,
+            "created_at": epoch - timedelta(seconds=ages[row]),
+        })
+    return products
+
+
+def product_chunk(seed: int, epoch: datetime, start: int, count: int) -> List[dict]:
+    return make_products(seed, np.arange(start, start + count), epoch)
+
+
+def customers(seed: int, indices: np.ndarray) -> List[dict]:
+    draws = Draws(seed, CUSTOMER, indices)
+    first = draws.choice(0, np.linspace(0, 1, len(FIRST_NAMES) + 1)[1:])
+    last = draws.choice(1, np.linspace(0, 1, len(LAST_NAMES) + 1)[1:])
+    phones = (draws.bits(2) % np.uint64(10 ** 8)).tolist()
+    return [
+        {
+            "customer_name": f"{FIRST_NAMES[a]} {LAST_NAMES[b]}",
+            "customer_email": f"{FIRST_NAMES[a].lower()}.{LAST_NAMES[b].lower()}.{index}@example.com",
+            "customer_phone": f"+55 11 9{phone:08d}",
+        }
+        for a, b, phone, index in zip(first, last, phones, np.asarray(indices).tolist())
+    ]
+
+
+def make_orders(seed: int, product_count: int, customer_count: int, epoch: datetime,
+                start: int, count: int) -> Tuple[List[dict], np.ndarray, np.ndarray, List[dict]]:
+    """Orders `start`..`start + count`, plus what the derived data needs.
+
+    Returns (orders, basket sizes, basket product indexes concatenated,
+    sales rollup deltas merged per bucket).
+    """
+    draws = Draws(seed, ORDER, np.arange(start, start + count))
+    ids = draws.uuids(0)
+    line_counts = (1 + (draws.uniform(2) < 0.38) + (draws.uniform(3) < 0.14) + (draws.uniform(4) < 0.05)).tolist()
+    picks = np.stack([popular_products(draws, 10 + line, product_count) for line in range(4)], axis=1)
+    quantities = (1 + (draws.uniform(20) < 0.1) + (draws.uniform(21) < 0.03)).tolist()
+    buyers = customers(seed, (draws.uniform(5) * customer_count).astype(np.int64))
+    ages = (draws.uniform(6) * ORDER_SPAN_DAYS * 86400).tolist()
+    statuses = draws.choice(7, _STATUS_CDF).tolist()
+    payment_ids = draws.bits(8).tolist()
+
+    used = np.unique(picks)
+    catalog = dict(zip(used.tolist(), make_products(seed, used, epoch)))
+    orders = []
+    sizes = []
+    baskets = []
+    deltas: Dict[Tuple[str, str, str], List[float]] = defaultdict(lambda: [0.0, 0, 0])
+    for row, picked in enumerate(picks.tolist()):
+        lines = []
+        for index in dict.fromkeys(picked[:line_counts[row]]):
+            product = catalog[index]
+            quantity = quantities[row] if not lines else 1
+            lines.append({
+                "product_id": product["id"],
+                "product_name": product["name"],
+                "category": product["category"],
+                "brand": product["brand"],
+                "quantity": quantity,
+                "price": product["price"],
+                "line_total": round(product["price"] * quantity, 2),
+            })
+            baskets.append(index)
+        sizes.append(len(lines))
+        status = ORDER_STATUSES[statuses[row]]
+        order = {
+            "id": ids[row],
+            **buyers[row],
+            "items": lines,
+            "total_amount": round(sum(line["line_total"] for line in lines), 2),
+            "item_count": sum(line["quantity"] for line in lines),
+            "status": status,
+            "paypal_order_id": None if status == "pending" else f"{payment_ids[row]:016X}",
+            "created_at": epoch - timedelta(seconds=ages[row]),
+        }
+        orders.append(order)
+        if counts_as_sale(status):
+            for delta in order_deltas(order):
+                bucket = deltas[(delta["day"], delta["dimension"], delta["value"])]
+                bucket[0] += delta["revenue"]
+                bucket[1] += delta["orders"]
+                bucket[2] += delta["units"]
+    merged = [
+        {"day": day, "dimension": dimension, "value": value,
+         "revenue": round(revenue, 2), "orders": order_count, "units": units}
+        for (day, dimension, value), (revenue, order_count, units) in deltas.items()
+    ]
+    return orders, np.array(sizes, dtype=np.int64), np.array(baskets, dtype=np.int64), merged
+
+
+def make_carts(seed: int, product_count: int, now: datetime, start: int, count: int) -> List[dict]:
+    """Lines of carts `start`..`start + count`, touched over the last two days."""
+    draws = Draws(seed, CART, np.arange(start, start + count))
+    sessions = draws.uuids(0)
+    line_ids = [draws.uuids(30 + 2 * line) for line in range(4)]
+    line_counts = (1 + (draws.uniform(2) < 0.5) + (draws.uniform(3) < 0.25) + (draws.uniform(4) < 0.1)).tolist()
+    picks = np.stack([popular_products(draws, 10 + line, product_count) for line in range(4)], axis=1)
+    quantities = (1 + (draws.uniform(5) < 0.15)).tolist()
+    ages = (draws.uniform(6) * 2 * 86400).tolist()
+    used = np.unique(picks)
+    ids = dict(zip(used.tolist(), product_ids(seed, used)))
+    lines = []
+    for row, picked in enumerate(picks.tolist()):
+        touched = now - timedelta(seconds=ages[row])
+        for position, index in enumerate(dict.fromkeys(picked[:line_counts[row]])):
+            lines.append({
+                "id": line_ids[position][row],
+                "session_id": sessions[row],
+                "product_id": ids[index],
+                "quantity": quantities[row],
+                "added_at": touched,
+                "updated_at": touched,
+            })
+    return lines
+
+
+def related_from_baskets(seed: int, sizes: List[np.ndarray], lines: List[np.ndarray],
+                         top_k: int) -> Tuple[List[dict], Dict[str, List[dict]]]:
+    """Co-purchase data for the generated orders, ranked by product id like the live updates."""
+    used, products = np.unique(np.concatenate(lines), return_inverse=True)
+    ids = np.array(product_ids(seed, used), dtype=object)
+    order = np.argsort(ids)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    left, right, counts = count_pairs(rank[products], np.concatenate(sizes), len(ids))
+    return related_data(ids[order], left, right, counts, top_k)
+
+
+async def generate(storage, seed: int, products: int, carts: int, orders: int, batch_size: int, workers: int,
+                   executor=None, epoch: datetime = DEFAULT_EPOCH, top_k: int = 20) -> dict:
+    """Generate the dataset into `storage`; returns counts and seconds per phase.
+
+    Chunks of `batch_size` records are built in `executor` (a process pool
+    makes generation parallel; None means the default thread pool), and up
+    to `workers` chunks are built and inserted at a time. Sales rollups and
+    co-purchase lists are filled in to match the orders.
+    """
+    loop = asyncio.get_running_loop()
+    timings = {}
+
+    async def run(phase: str, total: int, build: Callable, store: Callable):
+        began = time.perf_counter()
+        chunks = iter(range(0, total, batch_size))
+
+        async def worker():
+            # Workers share the iterator, each taking the next chunk
+            for start in chunks:
+                await store(await loop.run_in_executor(executor, build, start, min(batch_size, total - start)))
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        timings[phase] = round(time.perf_counter() - began, 2)
+
+    await run("products", products, functools.partial(product_chunk, seed, epoch), storage.products.bulk_insert)
+
+    cart_lines = 0
+
+    async def store_carts(lines: List[dict]):
+        nonlocal cart_lines
+        cart_lines += len(lines)
+        await storage.cart.bulk_insert(lines)
+
+    now = datetime.now(timezone.utc)
+    await run("carts", carts, functools.partial(make_carts, seed, products, now), store_carts)
+
+    sizes, lines = [], []
+
+    async def store_orders(result):
+        docs, basket_sizes, basket_lines, deltas = result
+        await storage.orders.bulk_insert(docs)
+        await storage.sales.apply(deltas)
+        sizes.append(basket_sizes)
+        lines.append(basket_lines)
+
+    customer_count = max(1, orders // 3)
+    await run("orders", orders, functools.partial(make_orders, seed, products, customer_count, epoch), store_orders)
+
+    if orders:
+        began = time.perf_counter()
+        pairs, top = await loop.run_in_executor(executor, related_from_baskets, seed, sizes, lines, top_k)
+        await storage.related.replace(pairs, top)
+        timings["related"] = round(time.perf_counter() - began, 2)
+
+    await storage.products.announce_reload()
+    return {"products": products, "carts": carts, "cart_lines": cart_lines, "orders": orders, "seconds": timings}
@@ -171,8 +171,15 @@ function App() {
 
   useEffect(() => {
     const fetchProducts = async () => {
-      const response = await axios.get(`${API}/products`);
-      setProducts(response.data);
+      // The listing is paginated; follow X-Next-Cursor until the last page
+      const all = [];
+      let after;
+      do {
+        const response = await axios.get(`${API}/products`, { params: { limit: 1000, after } });
+        all.push(...response.data);
+        after = response.headers["x-next-cursor"];
+      } while (after);
+      setProducts(all);
     };
     fetchProducts();
   }, []);
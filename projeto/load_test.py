@@ -0,0 +1,194 @@
+import json
+import math
+import time
+import random
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+import httpx
+import typer
+
+# Relative weight of each storefront flow in the traffic mix
+FLOW_WEIGHTS = {
+    "browse": 50,
+    "category": 25,
+    "add_to_cart": 15,
+    "checkout": 10,
+}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class EletroVendasLoadTester:
+    def __init__(self, base_url="http://localhost:8001", concurrency=10, duration=30.0, seed=None):
+        self.base_url = base_url
+        self.api_url = f"{base_url}/api"
+        self.concurrency = concurrency
+        self.duration = duration
+        self.random = random.Random(seed)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.flows_run = defaultdict(int)
+        self.products = []
+        self.categories = []
+
+    async def request(self, client, name, method, endpoint, expected_status=200, **kwargs):
+        """Issue one request and record its latency under `name`."""
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, f"{self.api_url}/{endpoint}", **kwargs)
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - started)
+        if response.status_code != expected_status:
+            self.errors[name] += 1
+            return None
+        return response
+
+    async def setup(self, client):
+        await self.request(client, "POST /api/init-data", "POST", "init-data")
+        response = await self.request(client, "GET /api/products", "GET", "products", params={"limit": 1000})
+        if response is None:
+            raise RuntimeError(f"Could not load the catalog from {self.api_url}")
+        self.products = response.json()
+        self.categories = sorted({product["category"] for product in self.products})
+        if not self.products:
+            raise RuntimeError("The catalog is empty")
+
+    # Storefront flows
+    async def browse(self, client, user):
+        response = await self.request(client, "GET /api/products", "GET", "products", params={"limit": 20})
+        if response is not None and response.headers.get("X-Next-Cursor"):
+            await self.request(client, "GET /api/products", "GET", "products",
+                               params={"limit": 20, "after": response.headers["X-Next-Cursor"]})
+        product = self.random.choice(self.products)
+        await self.request(client, "GET /api/products/{product_id}", "GET", f"products/{product['id']}")
+
+    async def category(self, client, user):
+        category = self.random.choice(self.categories)
+        await self.request(client, "GET /api/products/category/{category}", "GET", f"products/category/{category}",
+                           params={"limit": 20})
+
+    async def add_to_cart(self, client, user):
+        product = self.random.choice(self.products)
+        await self.request(client, "POST /api/cart", "POST", "cart",
+                           json={"product_id": product["id"], "quantity": self.random.randint(1, 3)},
+                           headers=user)
+        await self.request(client, "GET /api/cart/details", "GET", "cart/details", headers=user)
+
+    async def checkout(self, client, user):
+        await self.add_to_cart(client, user)
+        response = await self.request(client, "GET /api/cart", "GET", "cart", headers=user)
+        items = response.json() if response is not None else []
+        if items:
+            order = {
+                "customer_name": "Cliente Carga",
+                "customer_email": "carga@teste.com",
+                "customer_phone": "(11) 99999-9999",
+                "items": [{"product_id": item["product_id"], "quantity": item["quantity"]} for item in items],
+            }
+            await self.request(client, "POST /api/orders", "POST", "orders", json=order)
+        await self.request(client, "DELETE /api/cart", "DELETE", "cart", headers=user)
+
+    async def virtual_user(self, client, deadline, index):
+        # Each virtual user is one shopper with its own cart
+        user = {"X-Cart-Token": f"load-test-{index}-{self.random.getrandbits(32):08x}"}
+        flows = list(FLOW_WEIGHTS)
+        weights = list(FLOW_WEIGHTS.values())
+        while time.perf_counter() < deadline:
+            flow = self.random.choices(flows, weights)[0]
+            await getattr(self, flow)(client, user)
+            self.flows_run[flow] += 1
+
+    async def run(self):
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=30.0) as client:
+            await self.setup(client)
+            self.latencies.clear()
+            self.errors.clear()
+            started = time.perf_counter()
+            deadline = started + self.duration
+            await asyncio.gather(*(self.virtual_user(client, deadline, index) for index in range(self.concurrency)))
+            elapsed = time.perf_counter() - started
+        return self.report(elapsed)
+
+    def report(self, elapsed):
+        endpoints = {}
+        for name in sorted(set(self.latencies) | set(self.errors)):
+            samples = sorted(self.latencies[name])
+            endpoints[name] = {
+                "requests": len(samples),
+                "errors": self.errors[name],
+                "throughput_rps": round(len(samples) / elapsed, 2),
+                "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+                "max_ms": round(samples[-1] * 1000, 2) if samples else 0.0,
+            }
+        total = sum(endpoint["requests"] for endpoint in endpoints.values())
+        return {
+            "base_url": self.base_url,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "concurrency": self.concurrency,
+            "duration_s": round(elapsed, 2),
+            "requests": total,
+            "errors": sum(endpoint["errors"] for endpoint in endpoints.values()),
+            "throughput_rps": round(total / elapsed, 2),
+            "flows": dict(self.flows_run),
+            "endpoints": endpoints,
+        }
+
+
+def print_report(report):
+    print("\n" + "=" * 90)
+    print(f"📊 {report['requests']} requests in {report['duration_s']}s "
+          f"({report['throughput_rps']} req/s, {report['errors']} errors, concurrency {report['concurrency']})")
+    print("=" * 90)
+    print(f"{'endpoint':<42} {'reqs':>7} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, stats in report["endpoints"].items():
+        print(f"{name:<42} {stats['requests']:>7} {stats['errors']:>5} {stats['throughput_rps']:>8} "
+              f"{stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['p99_ms']:>8}")
+
+
+cli = typer.Typer(add_completion=False)
+
+
+@cli.command()
+def main(
+    base_url: str = typer.Option("http://localhost:8001"),
+    concurrency: int = typer.Option(10, min=1),
+    duration: float = typer.Option(30.0, min=0, help="seconds"),
+    seed: Optional[int] = typer.Option(None),
+    output: Optional[Path] = typer.Option(None, help="write the JSON report to this file"),
+):
+    """Concurrent storefront load test for the EletroVendas API; exits 1 if any request failed."""
+    print("🚀 Starting EletroVendas load test")
+    print(f"   Target: {base_url} | concurrency {concurrency} | {duration}s")
+    tester = EletroVendasLoadTester(base_url, concurrency, duration, seed)
+    try:
+        report = asyncio.run(tester.run())
+    except RuntimeError as error:
+        print(f"❌ {error}")
+        raise typer.Exit(1)
+
+    print_report(report)
+    if output:
+        with open(output, "w") as out:
+            json.dump(report, out, indent=2, sort_keys=True)
+        print(f"\n💾 Report written to {output}")
+    if report["errors"]:
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    cli()
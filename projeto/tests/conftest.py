@@ -0,0 +1,44 @@
+import os
+import sys
+import asyncio
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "backend"))
+os.environ["STORAGE_BACKEND"] = "memory"
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import server  # noqa: E402
+from models import Product  # noqa: E402
+from storage import MemoryStorage  # noqa: E402
+
+
+def make_products(count: int, category: str = "geladeira") -> list:
+    return [
+        Product(name=f"Produto {index}", description="", price=100.0 + index, category=category,
+                brand="Marca", image_url="https://example.com/p.jpg").dict()
+        for index in range(count)
+    ]
+
+
+@pytest.fixture
+def storage():
+    return MemoryStorage(cart_ttl_seconds=3600, idempotency_ttl_seconds=3600)
+
+
+@pytest.fixture
+def seed(storage):
+    """Insert `count` products before the app starts, so its catalog loads them."""
+    def insert(count, category="geladeira"):
+        products = make_products(count, category)
+        asyncio.run(storage.products.insert_many(products))
+        return products
+    return insert
+
+
+@pytest.fixture
+def client(storage):
+    with TestClient(server.create_app(storage)) as client:
+        yield client
@@ -0,0 +1,160 @@
+import asyncio
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from admission import HIGH, LOW, AdmissionMiddleware, PriorityLimiter
+
+
+def limited_app(**limits) -> TestClient:
+    app = FastAPI()
+
+    @app.get("/api/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.add_middleware(AdmissionMiddleware, **limits)
+    return TestClient(app)
+
+
+def test_rotating_cart_tokens_share_the_ip_bucket():
+    client = limited_app(rate=1, burst=5, max_concurrent=0)
+    statuses = [
+        client.get("/api/ping", headers={"X-Cart-Token": f"token-{index}"},
+                   cookies={"cart_token": f"cookie-{index}"}).status_code
+        for index in range(20)
+    ]
+    assert statuses.count(200) == 5
+    assert statuses.count(429) == 15
+
+
+def test_rejection_carries_retry_after():
+    client = limited_app(rate=1, burst=1, max_concurrent=0)
+    client.get("/api/ping")
+    response = client.get("/api/ping")
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+
+
+def test_clients_are_keyed_by_ip():
+    scope = {"type": "http", "client": ("203.0.113.7", 5000),
+             "headers": [(b"x-cart-token", b"abc"), (b"cookie", b"cart_token=def")]}
+    assert AdmissionMiddleware.client_key(scope) == "203.0.113.7"
+    assert AdmissionMiddleware.client_key({"type": "http", "headers": []}) == "-"
+
+
+def test_rate_zero_disables_the_limit():
+    client = limited_app(rate=0, max_concurrent=0)
+    assert all(client.get("/api/ping").status_code == 200 for _ in range(100))
+
+
+def test_paths_outside_the_prefixes_are_not_limited():
+    client = limited_app(rate=1, burst=1, max_concurrent=0)
+    client.get("/api/ping")
+    assert client.get("/docs").status_code == 200
+
+
+
+async def settle():
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_limiter_caps_concurrency():
+    async def main():
+        limiter = PriorityLimiter(max_concurrent=2, max_queue=10, queue_timeout=1)
+        assert await limiter.acquire(LOW) and await limiter.acquire(LOW)
+        third = asyncio.create_task(limiter.acquire(LOW))
+        await settle()
+        assert not third.done() and limiter.queued == 1
+        limiter.release()
+        assert await third
+        assert (limiter.active, limiter.queued) == (2, 0)
+        limiter.release()
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(main())
+
+
+def test_full_queue_refuses_at_once():
+    async def main():
+        limiter = PriorityLimiter(max_concurrent=1, max_queue=1, queue_timeout=5)
+        await limiter.acquire(HIGH)
+        waiting = asyncio.create_task(limiter.acquire(HIGH))
+        await settle()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        assert await limiter.acquire(LOW) is False
+        # Nothing low-priority to displace, so checkout is refused too
+        assert await limiter.acquire(HIGH) is False
+        assert loop.time() - started < 0.1
+        limiter.release()
+        assert await waiting
+
+    asyncio.run(main())
+
+
+def test_checkout_displaces_queued_browsing():
+    async def main():
+        limiter = PriorityLimiter(max_concurrent=1, max_queue=2, queue_timeout=5)
+        await limiter.acquire(LOW)
+        browse_old = asyncio.create_task(limiter.acquire(LOW))
+        await settle()
+        browse_new = asyncio.create_task(limiter.acquire(LOW))
+        await settle()
+        checkout = asyncio.create_task(limiter.acquire(HIGH))
+        await settle()
+        # The newest browse request gave its place up; the older one still waits
+        assert browse_new.done() and browse_new.result() is False
+        assert not browse_old.done()
+        limiter.release()
+        assert await checkout
+        assert not browse_old.done()
+        limiter.release()
+        assert await browse_old
+
+    asyncio.run(main())
+
+
+def test_waiting_too_long_gives_up():
+    async def main():
+        limiter = PriorityLimiter(max_concurrent=1, max_queue=5, queue_timeout=0.05)
+        await limiter.acquire(LOW)
+        assert await limiter.acquire(HIGH) is False
+        assert (limiter.active, limiter.queued) == (1, 0)
+        limiter.release()
+        assert limiter.active == 0
+
+    asyncio.run(main())
+
+
+def test_busy_server_answers_503():
+    app = FastAPI()
+    release = asyncio.Event()
+
+    @app.get("/api/slow")
+    async def slow():
+        await release.wait()
+        return {"ok": True}
+
+    app.add_middleware(AdmissionMiddleware, max_concurrent=1, max_queue=0, retry_after=3)
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = asyncio.create_task(client.get("/api/slow"))
+            await asyncio.sleep(0.05)
+            refused = await client.get("/api/slow")
+            release.set()
+            return (await first), refused
+
+    first, refused = asyncio.run(main())
+    assert first.status_code == 200
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"] == "3"
+
+
+def test_rate_limit_is_off_by_default():
+    client = limited_app(max_concurrent=0)
+    assert all(client.get("/api/ping").status_code == 200 for _ in range(100))
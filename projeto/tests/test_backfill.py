@@ -0,0 +1,43 @@
+import asyncio
+
+import pytest
+
+from backfill_rollups import backfill
+from config import STREAM_BATCH_SIZE
+
+
+def order_for(product_id, quantity=1):
+    return {"customer_name": "Ana", "customer_email": "ana@example.com", "customer_phone": "11999999999",
+            "items": [{"product_id": product_id, "quantity": quantity}]}
+
+
+def all_buckets(storage):
+    async def read():
+        buckets = {}
+        for dimension in ("total", "category", "brand"):
+            for bucket in await storage.sales.buckets(dimension, "0000-01-01", "9999-12-31"):
+                key = (bucket["day"], bucket["dimension"], bucket["value"])
+                buckets[key] = (pytest.approx(bucket["revenue"]), bucket["orders"], bucket["units"])
+        return buckets
+    return asyncio.run(read())
+
+
+def test_backfill_rebuilds_the_live_rollups(storage, seed, client, tmp_path):
+    products = seed(3) + seed(2, category="fogao")
+    for index in range(STREAM_BATCH_SIZE + 7):
+        client.post("/api/orders", json=order_for(products[index % len(products)]["id"], 1 + index % 3))
+    expected = all_buckets(storage)
+
+    asyncio.run(storage.sales.replace([]))
+    export = tmp_path / "sales.csv"
+    asyncio.run(backfill(storage, dry_run=False, export=export))
+
+    assert all_buckets(storage) == expected
+    assert len(export.read_text().splitlines()) == len(expected) + 1
+
+
+def test_dry_run_leaves_the_rollups_alone(storage, seed, client):
+    client.post("/api/orders", json=order_for(seed(1)[0]["id"]))
+    asyncio.run(storage.sales.replace([]))
+    asyncio.run(backfill(storage, dry_run=True))
+    assert all_buckets(storage) == {}
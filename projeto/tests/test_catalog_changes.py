@@ -0,0 +1,25 @@
+import pytest
+
+from storage import PRODUCT_CHANGES_PIPELINE
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def update(updated, removed=()):
+    return {"operationType": "update",
+            "updateDescription": {"updatedFields": updated, "removedFields": list(removed)}}
+
+
+@pytest.mark.parametrize("event, seen", [
+    (update({"stock": 3}), False),
+    (update({"stock": 3, "price": 99.9}), True),
+    (update({"stock": 0, "in_stock": False}), True),
+    (update({"name": "Fogão 5 bocas"}), True),
+    (update({"stock": 3}, removed=["sku"]), True),
+    ({"operationType": "insert"}, True),
+    ({"operationType": "delete"}, True),
+])
+def test_only_stock_only_updates_are_filtered_out(event, seen):
+    events = mongomock.MongoClient().db.events
+    events.insert_one(event)
+    assert len(list(events.aggregate(PRODUCT_CHANGES_PIPELINE))) == int(seen)
@@ -0,0 +1,33 @@
+import pytest
+from typer.testing import CliRunner
+
+import backfill_rollups
+import export_orders
+import generate_data
+import rebuild_related
+
+COMMANDS = [
+    (backfill_rollups.cli, ["--dry-run"]),
+    (export_orders.cli, ["orders.csv.gz"]),
+    (generate_data.cli, ["--products", "10"]),
+    (rebuild_related.cli, ["--dry-run"]),
+]
+
+
+@pytest.mark.parametrize("cli, args", COMMANDS)
+def test_commands_fail_without_mongo(cli, args, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("STORAGE_BACKEND")
+    monkeypatch.setenv("MONGO_URL", "")
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 1
+    assert "MONGO_URL" in result.output
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("cli, args", COMMANDS)
+def test_commands_refuse_the_memory_backend(cli, args, monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 1
+    assert "STORAGE_BACKEND" in result.output
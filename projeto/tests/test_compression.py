@@ -0,0 +1,62 @@
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.testclient import TestClient
+
+from compression import CompressionMiddleware, choose_encoding
+
+BODIES = {"big": b'{"items": "' + b"x" * 4096 + b'"}', "small": b'{"items": []}'}
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.get("/{name}")
+    async def read(name: str, request: Request):
+        etag = f'"{name}"'
+        if request.headers.get("if-none-match", "").removeprefix("W/") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(BODIES[name], media_type="application/json", headers={"ETag": etag})
+
+    app.add_middleware(CompressionMiddleware, minimum_size=1024)
+    with TestClient(app) as client:
+        yield client
+
+
+def test_choose_encoding_honours_q_values():
+    assert choose_encoding("gzip;q=0, br", ("br", "gzip")) == "br"
+    assert choose_encoding("gzip;q=0", ("gzip",)) is None
+    assert choose_encoding("*", ("gzip",)) == "gzip"
+
+
+def test_large_bodies_are_compressed_with_a_weak_etag(client):
+    response = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"big"'
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.content == BODIES["big"]
+    assert int(response.headers["content-length"]) < len(BODIES["big"])
+
+
+def test_negotiated_responses_get_a_weak_etag_even_when_small(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == 'W/"small"'
+    assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_not_modified_etag_depends_only_on_the_request(client):
+    # No earlier 200 on this worker: the 304 must not depend on what was compressed before
+    headers = {"Accept-Encoding": "gzip"}
+    for name in ("big", "small"):
+        response = client.get(f"/{name}", headers={**headers, "If-None-Match": f'W/"{name}"'})
+        assert (response.status_code, response.headers["etag"]) == (304, f'W/"{name}"')
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.headers["etag"] == client.get(f"/{name}", headers=headers).headers["etag"]
+
+
+def test_without_a_content_coding_the_etag_stays_strong(client):
+    headers = {"Accept-Encoding": "identity"}
+    assert client.get("/big", headers=headers).headers["etag"] == '"big"'
+    response = client.get("/big", headers={**headers, "If-None-Match": '"big"'})
+    assert (response.status_code, response.headers["etag"]) == (304, '"big"')
@@ -0,0 +1,18 @@
+import pytest
+
+from config import storage_from_env
+from storage import MemoryStorage
+
+
+def test_memory_backend_needs_opting_in(monkeypatch):
+    assert isinstance(storage_from_env(), MemoryStorage)
+    monkeypatch.delenv("STORAGE_BACKEND")
+    monkeypatch.delenv("MONGO_URL", raising=False)
+    with pytest.raises(RuntimeError, match="MONGO_URL"):
+        storage_from_env()
+
+
+def test_unknown_backend_is_rejected(monkeypatch):
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    with pytest.raises(RuntimeError, match="sqlite"):
+        storage_from_env()
@@ -0,0 +1,71 @@
+import pytest
+
+from facets import FacetIndex, parse_price_range
+
+
+def product(index: int, price: float) -> dict:
+    return {"id": f"p{index}", "category": "fogao", "brand": "Marca", "price": price, "in_stock": True}
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("500-1000", (500.0, 1000.0)),
+    ("99.90-149.90", (99.9, 149.9)),
+    ("5000+", (5000.0, None)),
+])
+def test_parse_price_range(value, expected):
+    assert parse_price_range(value) == expected
+
+
+@pytest.mark.parametrize("value", ["cheap", "1000-500", "500-500", "-100", "inf+", "1e3-2e3", ""])
+def test_parse_price_range_rejects_garbage(value):
+    with pytest.raises(ValueError):
+        parse_price_range(value)
+
+
+def test_price_filter_takes_any_range():
+    index = FacetIndex(capacity=2)
+    index.rebuild(product(number, price) for number, price in enumerate([120, 350, 499.99, 500, 7500]))
+    ids, total, facets = index.query({"price": ["300-500"]}, limit=10)
+    assert (ids, total) == (["p1", "p2"], 2)
+    assert facets["price"] == {"0-500": 3, "500-1000": 1, "5000+": 1}
+    assert index.query({"price": ["0-200", "5000+"]}, limit=10)[0] == ["p0", "p4"]
+
+
+def test_removed_products_drop_out_of_price_ranges():
+    index = FacetIndex()
+    index.rebuild([product(0, 100), product(1, 200)])
+    index.remove("p0")
+    assert index.query({"price": ["0-1000"]}, limit=10)[:2] == (["p1"], 1)
+
+
+def test_facets_endpoint_filters_by_price_range(storage, seed, client):
+    seed(5)
+    response = client.get("/api/products/facets", params={"price": ["101-103", "104+"]})
+    assert response.status_code == 200
+    assert sorted(item["price"] for item in response.json()["items"]) == [101.0, 102.0, 104.0]
+
+
+def test_facets_endpoint_rejects_unknown_price_values(storage, seed, client):
+    seed(1)
+    response = client.get("/api/products/facets", params={"price": "cheap"})
+    assert response.status_code == 400
+    assert "min-max" in response.json()["detail"]
+
+
+def test_prices_follow_slots_through_updates_removals_and_growth():
+    index = FacetIndex(capacity=2)
+    index.rebuild([product(0, 100), product(1, 200)])
+    # Updating a product reuses its slot, which must take the new price
+    index.add(product(0, 900))
+    index.remove("p1")
+    # Re-adding a removed product, past the initial capacity
+    index.add(product(1, 50))
+    index.add(product(2, 300))
+
+    def in_range(value):
+        return sorted(index.query({"price": [value]}, limit=10)[0])
+
+    assert in_range("0-150") == ["p1"]
+    assert in_range("150-250") == []
+    assert in_range("250-1000") == ["p0", "p2"]
+    assert index.query({}, limit=10)[2]["price"] == {"0-500": 2, "500-1000": 1}
@@ -0,0 +1,79 @@
+import asyncio
+
+from idempotency import IdempotencyGuard
+from storage import MemoryIdempotency
+
+
+def test_long_request_keeps_its_key_across_workers():
+    store = MemoryIdempotency(ttl_seconds=3600)
+    # Two guards on one store stand in for two worker processes
+    first = IdempotencyGuard(store, wait_seconds=5, lock_seconds=0.2, poll_interval=0.02)
+    second = IdempotencyGuard(store, wait_seconds=5, lock_seconds=0.2, poll_interval=0.02)
+    runs = []
+
+    async def slow_handler():
+        runs.append(1)
+        await asyncio.sleep(0.8)
+        return 200, b'{"id": "order-1"}'
+
+    async def main():
+        original = asyncio.create_task(first.run("key", "fp", slow_handler))
+        await asyncio.sleep(0.5)
+        retry = await second.run("key", "fp", slow_handler)
+        return await original, retry
+
+    original, retry = asyncio.run(main())
+    assert len(runs) == 1
+    assert original == ((200, b'{"id": "order-1"}'), False)
+    assert retry == ((200, b'{"id": "order-1"}'), True)
+
+
+def test_abandoned_key_can_be_claimed_once_its_lock_expires():
+    store = MemoryIdempotency(ttl_seconds=3600)
+    guard = IdempotencyGuard(store, wait_seconds=1, lock_seconds=0.1, poll_interval=0.02)
+
+    async def main():
+        # A worker that claimed the key and died never renews it
+        assert await store.claim("key", "fp", 0.1) is None
+        await asyncio.sleep(0.15)
+
+        async def handler():
+            return 201, b"{}"
+
+        return await guard.run("key", "fp", handler)
+
+    assert asyncio.run(main()) == ((201, b"{}"), False)
+
+
+def test_failed_complete_keeps_the_key_until_the_response_is_stored():
+    store = MemoryIdempotency(ttl_seconds=3600)
+    failures = [RuntimeError("write failed")] * 3
+    complete = store.complete
+
+    async def flaky_complete(key, status_code, body):
+        if failures:
+            raise failures.pop()
+        await complete(key, status_code, body)
+
+    store.complete = flaky_complete
+    first = IdempotencyGuard(store, wait_seconds=0.3, lock_seconds=0.1, poll_interval=0.02)
+    second = IdempotencyGuard(store, wait_seconds=0.3, lock_seconds=0.1, poll_interval=0.02)
+    runs = []
+
+    async def handler():
+        runs.append(1)
+        return 200, b'{"id": "order-1"}'
+
+    async def main():
+        original = await first.run("key", "fp", handler)
+        local = await first.run("key", "fp", handler)
+        # Longer than the lock: the key must still not be claimable elsewhere
+        await asyncio.sleep(0.2)
+        remote = await second.run("key", "fp", handler)
+        return original, local, remote
+
+    original, local, remote = asyncio.run(main())
+    assert len(runs) == 1
+    assert original == ((200, b'{"id": "order-1"}'), False)
+    assert local == remote == ((200, b'{"id": "order-1"}'), True)
+    assert not failures
@@ -0,0 +1,97 @@
+import asyncio
+
+import orjson
+import pytest
+
+import importer
+
+FEED = "sku,name,description,price,category,brand,image_url{extra}\n"
+
+
+def import_csv(client, body, **params):
+    return client.post("/api/products/import", content=body.encode(),
+                       headers={"Content-Type": "text/csv"}, params=params)
+
+
+def product_by_sku(storage, sku):
+    products = asyncio.run(storage.products.page(None, None, 1000))
+    return next(product for product in products if product["sku"] == sku)
+
+
+def test_new_rows_get_the_model_defaults(storage, client):
+    body = FEED.format(extra="") + "SKU-1,Fogão,Quatro bocas,899.9,fogao,Brastemp,https://example.com/f.jpg\n"
+    job = import_csv(client, body).json()
+    assert (job["status"], job["inserted"], job["failed"]) == ("completed", 1, 0)
+    product = product_by_sku(storage, "SKU-1")
+    assert product["in_stock"] is True
+    assert product["stock"] is None
+    assert product["specifications"] == {}
+
+
+def test_reimport_without_stock_keeps_tracked_stock(storage, client):
+    first = FEED.format(extra=",stock,in_stock,spec.voltage") + (
+        "SKU-1,Fogão,Quatro bocas,899.9,fogao,Brastemp,https://example.com/f.jpg,7,false,220V\n")
+    import_csv(client, first)
+    second = FEED.format(extra="") + "SKU-1,Fogão,Cinco bocas,949.9,fogao,Brastemp,https://example.com/f.jpg\n"
+    job = import_csv(client, second).json()
+    assert job["updated"] == 1
+    product = product_by_sku(storage, "SKU-1")
+    assert product["price"] == 949.9
+    assert product["description"] == "Cinco bocas"
+    assert product["stock"] == 7
+    assert product["in_stock"] is False
+    assert product["specifications"] == {"voltage": "220V"}
+
+
+def test_existing_job_id_is_rejected(client):
+    body = FEED.format(extra="") + "SKU-1,Fogão,x,1,fogao,Marca,https://example.com/f.jpg\n"
+    assert import_csv(client, body, job_id="nightly").status_code == 200
+    assert import_csv(client, body, job_id="nightly").status_code == 409
+    assert client.get("/api/products/import/nightly").json()["inserted"] == 1
+
+
+@pytest.mark.parametrize("specifications", ['"[1]"', '"""x"""', "7"])
+def test_specifications_that_are_not_an_object_fail_the_row(storage, client, specifications):
+    body = FEED.format(extra=",specifications,spec.voltage") + (
+        f"SKU-1,Fogão,x,1,fogao,Marca,https://example.com/f.jpg,{specifications},220V\n"
+        "SKU-2,Forno,x,1,forno,Marca,https://example.com/f.jpg,{},110V\n")
+    response = import_csv(client, body)
+    assert response.status_code == 200
+    job = response.json()
+    assert (job["inserted"], job["failed"]) == (1, 1)
+    assert "Invalid specifications" in str(job["errors"][0])
+
+
+def test_ndjson_rows_with_errors_are_reported(storage, client):
+    rows = [
+        {"sku": "A", "name": "A", "description": "", "price": 1, "category": "c", "brand": "b", "image_url": "u"},
+        {"sku": "B", "name": "B"},
+    ]
+    body = b"\n".join(orjson.dumps(row) for row in rows)
+    job = client.post("/api/products/import", content=body, params={"format": "ndjson"}).json()
+    assert (job["inserted"], job["failed"]) == (1, 1)
+    assert job["errors"][0]["sku"] == "B"
+
+
+def test_unterminated_quote_is_capped():
+    async def records(body):
+        async def chunks():
+            yield body.encode()
+        return [record async for record in importer.csv_records(chunks(), max_chars=200)]
+
+    body = FEED.format(extra="") + 'SKU-1,"never closed\n' + "x\n" * 300
+    parsed = asyncio.run(records(body))
+    assert isinstance(parsed[0][1], ValueError)
+    assert "Unterminated" in str(parsed[0][1])
+
+
+def test_overlong_line_is_refused():
+    async def lines(chunks):
+        return [line async for line in importer.lines(chunks, max_chars=100)]
+
+    async def chunks():
+        for _ in range(10):
+            yield b"x" * 50
+
+    with pytest.raises(importer.ImportFormatError, match="longer than 100"):
+        asyncio.run(lines(chunks()))
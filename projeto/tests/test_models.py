@@ -0,0 +1,20 @@
+import orjson
+
+from models import Product, product_shape
+
+
+def test_fast_path_matches_validation_for_documents_written_through_the_model():
+    doc = Product(name="Fogão", description="", price=100, category="fogao", brand="Marca",
+                  image_url="https://example.com/f.jpg").model_dump()
+    assert isinstance(doc["price"], float)
+    fast = orjson.loads(orjson.dumps(product_shape(doc)))
+    validated = orjson.loads(Product(**doc).model_dump_json())
+    # The same instant, written +00:00 by orjson and Z by pydantic
+    assert fast.pop("created_at").replace("+00:00", "Z") == validated.pop("created_at")
+    assert fast == validated
+
+
+def test_fast_path_emits_stored_values_without_coercion():
+    doc = {"id": "p1", "name": "Fogão", "description": "", "price": 100, "category": "fogao", "brand": "Marca",
+           "image_url": "https://example.com/f.jpg"}
+    assert b'"price":100,' in orjson.dumps(product_shape(doc))
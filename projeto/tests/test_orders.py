@@ -0,0 +1,86 @@
+import asyncio
+
+
+def order_for(product_id, quantity=1):
+    return {
+        "customer_name": "Ana",
+        "customer_email": "ana@example.com",
+        "customer_phone": "11999999999",
+        "items": [{"product_id": product_id, "quantity": quantity}],
+    }
+
+
+def stored_orders(storage):
+    return asyncio.run(storage.orders.page(None, None, None, 100))
+
+
+def test_retry_with_the_same_key_replays_the_order(storage, seed, client):
+    product = seed(1)[0]
+    headers = {"Idempotency-Key": "order-1"}
+    first = client.post("/api/orders", json=order_for(product["id"]), headers=headers)
+    retry = client.post("/api/orders", json=order_for(product["id"]), headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert len(stored_orders(storage)) == 1
+
+
+def test_same_key_with_a_different_body_is_rejected(storage, seed, client):
+    product = seed(1)[0]
+    headers = {"Idempotency-Key": "order-2"}
+    client.post("/api/orders", json=order_for(product["id"]), headers=headers)
+    response = client.post("/api/orders", json=order_for(product["id"], 2), headers=headers)
+    assert response.status_code == 422
+    assert len(stored_orders(storage)) == 1
+
+
+def test_failed_request_releases_the_key(storage, seed, client):
+    headers = {"Idempotency-Key": "order-3"}
+    assert client.post("/api/orders", json=order_for("missing"), headers=headers).status_code == 400
+    assert client.post("/api/orders", json=order_for("missing"), headers=headers).status_code == 400
+
+
+def test_rollup_failure_does_not_undo_the_idempotent_order(storage, seed, client):
+    product = seed(1)[0]
+
+    async def broken(deltas):
+        raise RuntimeError("rollups unavailable")
+
+    storage.sales.apply = broken
+    headers = {"Idempotency-Key": "order-4"}
+    first = client.post("/api/orders", json=order_for(product["id"]), headers=headers)
+    retry = client.post("/api/orders", json=order_for(product["id"]), headers=headers)
+    assert first.status_code == 200
+    assert retry.json()["id"] == first.json()["id"]
+    assert len(stored_orders(storage)) == 1
+
+
+def test_order_is_counted_in_the_sales_report(storage, seed, client):
+    product = seed(1)[0]
+    client.post("/api/orders", json=order_for(product["id"], 2))
+    report = client.get("/api/reports/sales")
+    assert report.status_code == 200
+    assert report.json()["totals"]["orders"] == 1
+
+
+def test_status_route_is_off_without_an_admin_token(storage, seed, client):
+    order = client.post("/api/orders", json=order_for(seed(1)[0]["id"])).json()
+    response = client.put(f"/api/orders/{order['id']}/status", json={"status": "cancelled"})
+    assert response.status_code == 404
+
+
+def test_status_changes_need_the_admin_token_and_an_allowed_transition(storage, seed, client, monkeypatch):
+    monkeypatch.setattr("server.ADMIN_TOKEN", "secret")
+    order = client.post("/api/orders", json=order_for(seed(1)[0]["id"])).json()
+    url = f"/api/orders/{order['id']}/status"
+    admin = {"Authorization": "Bearer secret"}
+    assert client.put(url, json={"status": "cancelled"}).status_code == 401
+    assert client.put(url, json={"status": "paid"}, headers=admin).status_code == 422
+    assert client.put(url, json={"status": "shipped"}, headers=admin).status_code == 409
+    response = client.put(url, json={"status": "cancelled"}, headers=admin)
+    assert response.status_code == 200
+    assert response.json()["status"] == "cancelled"
+    assert client.put(url, json={"status": "delivered"}, headers=admin).status_code == 409
+    assert client.get("/api/reports/sales").json()["totals"]["orders"] == 0
+    assert client.put("/api/orders/missing/status", json={"status": "cancelled"}, headers=admin).status_code == 404
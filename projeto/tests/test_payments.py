@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from payments import CaptureWorker, PayPalError
+
+
+class FakePayPal:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def capture(self, paypal_order_id: str) -> dict:
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def capture(paypal: FakePayPal, max_attempts: int = 3) -> list:
+    results = []
+
+    async def on_result(order_id, status):
+        results.append((order_id, status))
+
+    async def run():
+        worker = CaptureWorker(paypal, on_result, concurrency=1, max_attempts=max_attempts, base_delay=0)
+        worker.start()
+        worker.submit("order-1", "PAY-1")
+        await worker.join()
+        await worker.stop()
+
+    asyncio.run(run())
+    return results
+
+
+@pytest.mark.parametrize("body", [{}, {"details": []}, {"details": None}, {"name": "UNPROCESSABLE_ENTITY"}])
+def test_rejection_without_details_fails_the_payment(body):
+    paypal = FakePayPal(PayPalError(422, body))
+    assert capture(paypal) == [("order-1", "payment_failed")]
+    assert paypal.calls == 1
+
+
+def test_already_captured_counts_as_paid():
+    paypal = FakePayPal(PayPalError(422, {"details": [{"issue": "ORDER_ALREADY_CAPTURED"}]}))
+    assert capture(paypal) == [("order-1", "paid")]
+
+
+def test_server_errors_are_retried():
+    paypal = FakePayPal(PayPalError(503, {"details": []}), {"status": "COMPLETED"})
+    assert capture(paypal) == [("order-1", "paid")]
+    assert paypal.calls == 2
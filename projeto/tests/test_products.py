@@ -0,0 +1,50 @@
+import orjson
+
+
+def test_listing_defaults_to_one_page_with_a_cursor(storage, seed, client):
+    seed(150)
+    response = client.get("/api/products")
+    assert response.status_code == 200
+    assert len(response.json()) == 100
+    assert response.headers["X-Next-Cursor"]
+
+
+def test_following_the_cursor_returns_every_product_once(storage, seed, client):
+    products = seed(25)
+    seen = []
+    after = None
+    while True:
+        params = {"limit": 10, **({"after": after} if after else {})}
+        response = client.get("/api/products", params=params)
+        seen.extend(product["id"] for product in response.json())
+        after = response.headers.get("X-Next-Cursor")
+        if not after:
+            break
+    assert sorted(seen) == sorted(product["id"] for product in products)
+    assert len(seen) == len(set(seen))
+
+
+def test_last_page_has_no_cursor(storage, seed, client):
+    seed(5)
+    response = client.get("/api/products", params={"limit": 5})
+    assert len(response.json()) == 5
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/api/products", params={"after": "not-a-cursor"}).status_code == 400
+
+
+def test_category_listing_pages_within_the_category(storage, seed, client):
+    seed(4, "fogao")
+    seed(6, "geladeira")
+    first = client.get("/api/products/category/fogao", params={"limit": 3})
+    rest = client.get("/api/products/category/fogao", params={"limit": 3, "after": first.headers["X-Next-Cursor"]})
+    assert [p["category"] for p in first.json() + rest.json()] == ["fogao"] * 4
+
+
+def test_ndjson_stream_has_one_product_per_line(storage, seed, client):
+    seed(12)
+    lines = client.get("/api/products", params={"stream": "ndjson"}).content.splitlines()
+    assert len(lines) == 12
+    assert {"id", "name", "price"} <= set(orjson.loads(lines[0]))
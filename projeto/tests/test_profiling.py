@@ -0,0 +1,94 @@
+import types
+import logging
+
+from fastapi import APIRouter, FastAPI, Request
+from fastapi.testclient import TestClient
+
+from profiling import ProfilingMiddleware, SlowQueryLog, TimedORJSONResponse, TimedRoute, TimedStorage, query_shape
+
+
+def timed_app(storage) -> FastAPI:
+    app = FastAPI(default_response_class=TimedORJSONResponse)
+    app.state.storage = TimedStorage(storage)
+    router = APIRouter(route_class=TimedRoute)
+
+    @router.get("/products/{product_id}")
+    async def product(product_id: str, request: Request):
+        return TimedORJSONResponse(await request.app.state.storage.products.get(product_id))
+
+    app.include_router(router)
+    return app
+
+
+def server_timing(header: str) -> dict:
+    metrics = {}
+    for entry in header.split(","):
+        name, *params = entry.strip().split(";")
+        metrics[name] = dict(param.split("=", 1) for param in params)
+    return metrics
+
+
+def test_server_timing_breaks_the_request_down(storage, seed):
+    product = seed(1)[0]
+    with TestClient(timed_app(storage)) as client:
+        response = client.get(f"/products/{product['id']}")
+    metrics = server_timing(response.headers["Server-Timing"])
+    assert list(metrics) == ["db", "app", "other", "serialize", "total"]
+    assert metrics["db"]["desc"] == '"1 calls"'
+    assert all(float(metric["dur"]) >= 0 for metric in metrics.values())
+
+
+def test_profiling_needs_the_token(tmp_path):
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    app.add_middleware(ProfilingMiddleware, directory=str(tmp_path), token="secret")
+    with TestClient(app) as client:
+        assert "X-Profile-Report" not in client.get("/ping", headers={"X-Profile": "wrong"}).headers
+        name = client.get("/ping", headers={"X-Profile": "secret"}).headers["X-Profile-Report"]
+    assert (tmp_path / f"{name}.prof").exists()
+    assert "GET /ping" in (tmp_path / f"{name}.txt").read_text()
+
+
+def test_query_shape_hides_values():
+    shape = query_shape({"category": "fogao", "price": {"$gte": 10.5}, "id": {"$in": ["a", "b"]}})
+    assert shape == {"category": "str", "price": {"$gte": "float"}, "id": {"$in": ["str"]}}
+
+
+def log_slow_command(caplog, command_name, command, plans) -> str:
+    log = SlowQueryLog(threshold_ms=10, mongo_url="mongodb://unused")
+
+    class Database:
+        def command(self, command):
+            plans.append(command)
+            return {"queryPlanner": {"winningPlan": {"stage": "COLLSCAN"}}}
+
+    log._client = {"shop": Database()}
+    event = types.SimpleNamespace(command_name=command_name, connection_id=1, request_id=1, database_name="shop",
+                                  command={**command, "lsid": {}})
+    with caplog.at_level(logging.WARNING, logger="slow_queries"):
+        log.started(event)
+        log.succeeded(types.SimpleNamespace(connection_id=1, request_id=1, duration_micros=50_000,
+                                            database_name="shop"))
+        log._thread.join(timeout=0.5)  # daemon loop never ends; give it time to log
+    return caplog.text
+
+
+def test_slow_commands_are_logged_with_their_plan(caplog):
+    plans = []
+    text = log_slow_command(caplog, "find", {"find": "products", "filter": {"brand": "Brastemp"}}, plans)
+    assert '"filter": {"brand": "str"}' in text
+    assert '"collscan": true' in text
+    assert len(plans) == 1
+
+
+def test_slow_writes_are_logged_without_explain(caplog):
+    plans = []
+    command = {"update": "products", "updates": [{"q": {"id": "p1"}, "u": {"$inc": {"stock": -1}}}]}
+    text = log_slow_command(caplog, "update", command, plans)
+    assert '"filter": {"id": "str"}' in text
+    assert '"plan"' not in text
+    assert plans == []
@@ -0,0 +1,68 @@
+import asyncio
+
+from related import RelatedUpdater
+
+
+def checkout(client, product_ids):
+    response = client.post("/api/orders", json={
+        "customer_name": "Ana",
+        "customer_email": "ana@example.com",
+        "customer_phone": "11999999999",
+        "items": [{"product_id": product_id, "quantity": 1} for product_id in product_ids],
+    })
+    assert response.status_code == 200
+    return response
+
+
+def test_related_products_follow_checkouts(storage, seed, client):
+    a, b, c = (product["id"] for product in seed(3))
+    checkout(client, [a, b])
+    checkout(client, [a, b])
+    checkout(client, [a, c])
+    client.portal.call(client.app.state.related_updater.join)
+    related = client.get(f"/api/products/{a}/related").json()
+    assert [product["id"] for product in related] == [b, c]
+
+
+def test_co_purchase_failure_does_not_fail_checkout(storage, seed, client):
+    a, b = (product["id"] for product in seed(2))
+
+    async def broken(baskets, top_k):
+        raise RuntimeError("co-purchase store unavailable")
+
+    storage.related.apply = broken
+    checkout(client, [a, b])
+    client.portal.call(client.app.state.related_updater.join)
+
+
+def test_queued_baskets_are_applied_together(storage):
+    calls = []
+
+    async def apply(baskets, top_k):
+        calls.append(list(baskets))
+
+    storage.related.apply = apply
+
+    async def run():
+        updater = RelatedUpdater(storage.related, top_k=5, batch_size=10)
+        for index in range(25):
+            updater.submit(["a", str(index)])
+        updater.submit(["single"])
+        updater.start()
+        await updater.join()
+        await updater.stop()
+
+    asyncio.run(run())
+    assert [len(batch) for batch in calls] == [10, 10, 5]
+
+
+def test_full_queue_drops_instead_of_blocking(storage):
+    async def run():
+        updater = RelatedUpdater(storage.related, top_k=5, max_queue=2)
+        for _ in range(5):
+            updater.submit(["a", "b"])
+        assert updater.queue.qsize() == 2
+        await updater.stop()
+        return await storage.related.top("a")
+
+    assert asyncio.run(run()) == [{"product_id": "b", "count": 2}]
@@ -0,0 +1,53 @@
+import asyncio
+
+from models import Product
+
+
+def stocked(storage, **stock_by_name):
+    products = [
+        Product(name=name, description="", price=10.0, category="fogao", brand="Marca",
+                image_url="https://example.com/p.jpg", stock=stock).dict()
+        for name, stock in stock_by_name.items()
+    ]
+    asyncio.run(storage.products.insert_many(products))
+    return {product["name"]: product["id"] for product in products}
+
+
+def order(client, quantities):
+    return client.post("/api/orders", json={
+        "customer_name": "Ana",
+        "customer_email": "ana@example.com",
+        "customer_phone": "11999999999",
+        "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in quantities.items()],
+    })
+
+
+def stock_of(storage, product_id):
+    return asyncio.run(storage.products.get(product_id))["stock"]
+
+
+def test_order_reserves_tracked_stock(storage, client):
+    ids = stocked(storage, fogao=5)
+    assert order(client, {ids["fogao"]: 2}).status_code == 200
+    assert stock_of(storage, ids["fogao"]) == 3
+
+
+def test_shortage_on_one_line_takes_nothing(storage, client):
+    ids = stocked(storage, fogao=5, geladeira=1)
+    response = order(client, {ids["fogao"]: 2, ids["geladeira"]: 3})
+    assert response.status_code == 409
+    assert stock_of(storage, ids["fogao"]) == 5
+    assert stock_of(storage, ids["geladeira"]) == 1
+
+
+def test_untracked_stock_is_not_reserved(storage, client):
+    ids = stocked(storage, fogao=None)
+    assert order(client, {ids["fogao"]: 50}).status_code == 200
+    assert stock_of(storage, ids["fogao"]) is None
+
+
+def test_stock_untracked_after_pricing_still_sells(storage):
+    ids = stocked(storage, fogao=5)
+    storage.products._by_id[ids["fogao"]]["stock"] = None
+    storage.products.reserve([(ids["fogao"], 9)])
+    assert stock_of(storage, ids["fogao"]) is None